@@ -0,0 +1,3 @@
+"""
+Attack Shark R1 userspace tools
+"""
@@ -0,0 +1,260 @@
+"""
+Automatic profile switching when configured programs start and stop
+
+Rules map executable names to profiles (see attack_shark_r1.profiles):
+
+    [autoswitch]
+    default = desktop
+    debounce = 2
+
+    [rules]
+    cs2 = fps
+    steam = desktop
+
+The first rule, in file order, whose program is running wins; with none
+running the default profile is used. Only the reports whose settings differ
+from what the mouse holds are sent.
+
+Process starts come from the kernel's proc connector when the service may
+use it (CAP_NET_ADMIN), so it sleeps until something execs. Otherwise new
+processes are found by diffing the /proc directory listing at a slow
+interval, reading only the entries that appeared. Exits of matching
+processes are always waited for with a pidfd, so leaving a game is noticed
+at once either way.
+"""
+
+import configparser
+import os
+import select
+import socket
+import struct
+import time
+
+from .profiles import ProfileError
+from .settings import DEVICE, GROUP_REPORTS, changed_report_groups
+from .trace import logged
+from .transport import TransportError
+
+# linux/connector.h, linux/cn_proc.h
+NETLINK_CONNECTOR = 11
+CN_IDX_PROC = 1
+CN_VAL_PROC = 1
+PROC_CN_MCAST_LISTEN = 1
+PROC_EVENT_EXEC = 0x00000002
+NLMSG_DONE = 3
+
+NLMSGHDR = struct.Struct('=IHHII')
+CN_MSG = struct.Struct('=IIIIHH')
+PROC_EVENT = struct.Struct('=IIQ')
+EXEC_EVENT = struct.Struct('=II')
+
+# Seconds before retrying a switch that failed, e.g. while the mouse sleeps
+RETRY_INTERVAL = 30
+
+
+def default_rules_path():
+    config_home = os.environ.get('XDG_CONFIG_HOME') or os.path.expanduser("~/.config")
+    return os.path.join(config_home, "attack-shark", "autoswitch.ini")
+
+
+def load_rules(path=None):
+    """Return (rules, default profile, debounce seconds) from an autoswitch.ini"""
+    parser = configparser.ConfigParser(delimiters=('=',))
+    # Executable names are case sensitive
+    parser.optionxform = str
+    if not parser.read(path or default_rules_path()):
+        raise ProfileError(f"No rules in {path or default_rules_path()}")
+    rules = dict(parser['rules']) if parser.has_section('rules') else {}
+    default = parser.get('autoswitch', 'default', fallback=None)
+    debounce = parser.getfloat('autoswitch', 'debounce', fallback=2.0)
+    return rules, default, debounce
+
+
+def process_name(pid):
+    """Executable name of `pid`, or None if it is gone or not ours to read"""
+    try:
+        return os.path.basename(os.readlink(f'/proc/{pid}/exe'))
+    except OSError:
+        pass
+    # Other users' processes only show their (truncated) comm
+    try:
+        with open(f'/proc/{pid}/comm') as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def open_proc_connector():
+    """Subscribe to exec events, or return None without the privileges for it"""
+    try:
+        sock = socket.socket(socket.AF_NETLINK, socket.SOCK_DGRAM, NETLINK_CONNECTOR)
+    except (OSError, AttributeError):
+        return None
+    try:
+        sock.bind((os.getpid(), CN_IDX_PROC))
+        op = struct.pack('=I', PROC_CN_MCAST_LISTEN)
+        cn_msg = CN_MSG.pack(CN_IDX_PROC, CN_VAL_PROC, 0, 0, len(op), 0) + op
+        sock.send(NLMSGHDR.pack(NLMSGHDR.size + len(cn_msg), NLMSG_DONE, 0, 0, os.getpid()) + cn_msg)
+    except OSError:
+        sock.close()
+        return None
+    sock.setblocking(False)
+    return sock
+
+
+def exec_events(sock):
+    """Yield the pids from every pending exec event"""
+    while True:
+        try:
+            data = sock.recv(4096)
+        except BlockingIOError:
+            return
+        offset = NLMSGHDR.size + CN_MSG.size
+        if len(data) < offset + PROC_EVENT.size + EXEC_EVENT.size:
+            continue
+        what, _, _ = PROC_EVENT.unpack_from(data, offset)
+        if what == PROC_EVENT_EXEC:
+            _, tgid = EXEC_EVENT.unpack_from(data, offset + PROC_EVENT.size)
+            yield tgid
+
+
+class ProcessWatcher:
+    """Keeps track of which watched executables are running"""
+
+    def __init__(self, names, scan_interval=3.0):
+        self.names = set(names)
+        self.scan_interval = scan_interval
+        self.running = {}       # pid -> name, watched processes only
+        self.pidfds = {}        # pidfd -> pid
+        self.poller = select.poll()
+        self.known = set()
+        self.connector = open_proc_connector()
+        if self.connector is not None:
+            self.poller.register(self.connector, select.POLLIN)
+        # Processes that were running before we started
+        self._scan()
+
+    def _add(self, pid):
+        name = process_name(pid)
+        if name not in self.names or pid in self.running:
+            return
+        try:
+            fd = os.pidfd_open(pid)
+        except OSError:
+            return
+        self.running[pid] = name
+        self.pidfds[fd] = pid
+        self.poller.register(fd, select.POLLIN)
+
+    def _scan(self):
+        pids = {int(entry.name) for entry in os.scandir('/proc') if entry.name.isdigit()}
+        for pid in pids - self.known:
+            self._add(pid)
+        self.known = pids
+
+    def names_running(self):
+        return set(self.running.values())
+
+    def wait(self, timeout=None):
+        """Block until a watched program starts or exits, or `timeout` seconds pass
+
+        Returns True if the set of running watched programs changed.
+        """
+        before = self.names_running()
+        if self.connector is None:
+            timeout = self.scan_interval if timeout is None else min(timeout, self.scan_interval)
+        events = self.poller.poll(None if timeout is None else timeout * 1000)
+        for fd, _ in events:
+            if fd in self.pidfds:
+                pid = self.pidfds.pop(fd)
+                self.poller.unregister(fd)
+                os.close(fd)
+                self.running.pop(pid, None)
+            elif self.connector is not None and fd == self.connector.fileno():
+                for pid in exec_events(self.connector):
+                    self._add(pid)
+        if self.connector is None:
+            self._scan()
+        return self.names_running() != before
+
+    def close(self):
+        for fd in self.pidfds:
+            os.close(fd)
+        self.pidfds.clear()
+        if self.connector is not None:
+            self.connector.close()
+
+
+class AutoSwitcher:
+    """Switches to the profile of the first running program, after it stayed so for `debounce` seconds
+
+    `key` is the mouse's entry in the AppliedStateCache (see devices.state_key).
+    on_switched(name) is called after each switch.
+    """
+
+    def __init__(self, store, applied_states, transport, rules, default=None, debounce=2.0, key=DEVICE):
+        self.store = store
+        self.applied_states = applied_states
+        self.transport = transport
+        self.key = key
+        self.rules = rules
+        self.default = default
+        self.debounce = debounce
+        self.wanted = None
+        self.wanted_since = 0.0
+        self.on_switched = None
+
+    def target(self, running):
+        for name, profile in self.rules.items():
+            if name in running:
+                return profile
+        return self.default
+
+    def update(self, running, now=None):
+        """Note the running programs; returns seconds until a switch is due, or None"""
+        now = time.monotonic() if now is None else now
+        # The GUI or the command line may have switched in the meantime
+        self.store.reload()
+        target = self.target(running)
+        if target != self.wanted:
+            self.wanted = target
+            self.wanted_since = now
+        if target is None or target == self.store.active:
+            return None
+        remaining = self.wanted_since + self.debounce - now
+        if remaining > 0:
+            return remaining
+        self.switch(target)
+        return None
+
+    def switch(self, name):
+        """Send the reports of profile `name` that differ from what the mouse holds"""
+        profile = self.store.get(name)
+        # The GUI or the command line may have sent settings too
+        self.applied_states.reload()
+        groups = changed_report_groups(self.applied_states.get(self.key), profile.state)
+        ids = {GROUP_REPORTS[group] for group in groups}
+        try:
+            with logged('send', self.transport):
+                self.transport.send_reports([report for report in profile.reports if report[0] in ids])
+        except Exception:
+            # Some reports may have gone out, the device state is unknown now
+            self.applied_states.forget(self.key)
+            raise
+        self.applied_states.put(self.key, profile.state)
+        self.store.set_active(name)
+        if self.on_switched is not None:
+            self.on_switched(name)
+
+
+def run(switcher, watcher, on_error=None):
+    """Follow the watched programs forever; on_error(error) is called for each failed switch"""
+    while True:
+        try:
+            due = switcher.update(watcher.names_running())
+        except (ProfileError, TransportError, OSError) as e:
+            # Mouse asleep or unplugged: try again later, or sooner if the programs change
+            if on_error is not None:
+                on_error(e)
+            due = RETRY_INTERVAL
+        watcher.wait(due)
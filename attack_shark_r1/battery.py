@@ -0,0 +1,152 @@
+"""
+Battery history and discharge estimation
+
+Samples are kept in a fixed-size ring file (5 bytes per sample) that is
+memory-mapped, so appending and estimating never read an unbounded log.
+"""
+
+import mmap
+import os
+import struct
+import time
+
+# magic, version, capacity, index of the next write, number of samples
+HEADER = struct.Struct('<4sHIII')
+MAGIC = b'R1BH'
+VERSION = 1
+
+# unix time in seconds, charge in percent
+RECORD = struct.Struct('<IB')
+
+# Poll intervals in seconds
+MIN_INTERVAL = 60
+MAX_INTERVAL = 3600
+
+
+def default_history_path():
+    state_home = os.environ.get('XDG_STATE_HOME') or os.path.expanduser("~/.local/state")
+    return os.path.join(state_home, "attack-shark", "battery.ring")
+
+
+class BatteryHistory:
+    """Fixed-capacity ring of (timestamp, charge) samples backed by a memory-mapped file"""
+
+    def __init__(self, path=None, capacity=4096):
+        self.path = path or default_history_path()
+        self.capacity = capacity
+        size = HEADER.size + capacity * RECORD.size
+
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fresh = os.fstat(fd).st_size != size
+            if fresh:
+                os.ftruncate(fd, size)
+            self.map = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+
+        magic, version, stored_capacity, self.head, self.count = HEADER.unpack_from(self.map, 0)
+        if fresh or magic != MAGIC or version != VERSION or stored_capacity != capacity:
+            self.head = self.count = 0
+            self._write_header()
+
+    def _write_header(self):
+        HEADER.pack_into(self.map, 0, MAGIC, VERSION, self.capacity, self.head, self.count)
+
+    def reload(self):
+        """Pick up samples another process appended"""
+        _, _, _, self.head, self.count = HEADER.unpack_from(self.map, 0)
+
+    def __len__(self):
+        return self.count
+
+    def append(self, charge, timestamp=None):
+        """Record a charge reading, overwriting the oldest one when full"""
+        if timestamp is None:
+            timestamp = time.time()
+        RECORD.pack_into(self.map, HEADER.size + self.head * RECORD.size, int(timestamp), charge)
+        self.head = (self.head + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+        self._write_header()
+        self.map.flush()
+
+    def samples(self, limit=None):
+        """Return up to `limit` most recent samples, oldest first"""
+        count = self.count if limit is None else min(limit, self.count)
+        start = (self.head - count) % self.capacity
+        return [
+            RECORD.unpack_from(self.map, HEADER.size + ((start + i) % self.capacity) * RECORD.size)
+            for i in range(count)
+        ]
+
+    def last(self):
+        """Return the most recent (timestamp, charge), or None"""
+        samples = self.samples(1)
+        return samples[0] if samples else None
+
+    def discharge_run(self, limit=256):
+        """Return the recent samples since the charge last went up (i.e. since charging)"""
+        samples = self.samples(limit)
+        start = 0
+        for i in range(1, len(samples)):
+            if samples[i][1] > samples[i - 1][1]:
+                start = i
+        return samples[start:]
+
+    def discharge_rate(self, min_span=600):
+        """Return the discharge rate in percent per hour, or None if unknown
+
+        Fits a least-squares line through the current discharge run, which
+        smooths out the 10% steps the mouse reports.
+        """
+        run = self.discharge_run()
+        if len(run) < 2 or run[-1][0] - run[0][0] < min_span:
+            return None
+
+        n = len(run)
+        mean_t = sum(t for t, _ in run) / n
+        mean_c = sum(c for _, c in run) / n
+        variance = sum((t - mean_t) ** 2 for t, _ in run)
+        if variance == 0:
+            return None
+        slope = sum((t - mean_t) * (c - mean_c) for t, c in run) / variance
+        if slope >= 0:
+            return None
+        return -slope * 3600
+
+    def time_remaining(self):
+        """Return the estimated hours until the battery is empty, or None"""
+        rate = self.discharge_rate()
+        last = self.last()
+        if rate is None or last is None:
+            return None
+        return last[1] / rate
+
+    def close(self):
+        self.map.close()
+
+
+def next_poll_interval(history, previous=None):
+    """Pick the delay in seconds before the next battery query
+
+    High charge is polled rarely, low charge more often. While readings
+    don't change the mouse is most likely idle, so the interval keeps
+    doubling to avoid waking it up.
+    """
+    last = history.last()
+    if last is None:
+        return MIN_INTERVAL
+
+    charge = last[1]
+    if charge > 50:
+        interval = 15 * 60
+    elif charge > 20:
+        interval = 5 * 60
+    else:
+        interval = 2 * 60
+
+    recent = history.samples(2)
+    if previous is not None and len(recent) == 2 and recent[0][1] == recent[1][1]:
+        interval = max(interval, previous * 2)
+    return max(MIN_INTERVAL, min(interval, MAX_INTERVAL))
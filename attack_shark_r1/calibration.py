@@ -0,0 +1,231 @@
+"""
+Checking that a DPI setting delivers the counts per inch it promises
+
+Calibration moves the mouse over a known distance, e.g. along a ruler,
+a few times per setting, pausing in between. The REL_X/REL_Y events of
+each stroke are summed, and the stroke's length in counts divided by the
+distance is that stroke's effective CPI. Strokes are told apart by pauses
+of at least `pause` seconds.
+
+A session steps through DPI values by sending DPI reports, recording
+every step's event stream as dpi-NNNNN.ev (the raw evdev format, see
+attack_shark_r1.pollrate). That covers the six slots of the current
+settings, or the whole DPI_CODES table in one sweep. Recorded sessions
+are analyzed again without the mouse. All steps are analyzed in one
+vectorized pass, and a step is flagged when its median CPI drifts more
+than `tolerance` from the configured DPI. Its device code is printed
+alongside, so a bad entry in dpi.odin's table stands out.
+"""
+
+import os
+import re
+import select
+import time
+from collections import namedtuple
+
+from . import protocol
+from .errors import R1Error
+from .pollrate import EVENT_FIELDS, _numpy
+
+EV_REL = 2
+REL_X = 0
+REL_Y = 1
+
+MM_PER_INCH = 25.4
+
+# Every DPI the code table has an entry for
+DPI_TABLE = tuple((i + 1) * protocol.DPI_STEP for i in range(len(protocol.DPI_CODES)))
+
+STEP_FILE = re.compile(r'dpi-(\d+)\.ev$')
+
+Calibration = namedtuple('Calibration', [
+    'dpi',
+    'strokes',
+    'cpi',          # median over the strokes
+    'cpi_std',
+    'drift_pct',    # (cpi - dpi) / dpi
+    'flagged',
+])
+
+
+class CalibrationError(R1Error):
+    """Raised when a step can't be measured or analyzed"""
+
+
+def step_path(directory, dpi):
+    return os.path.join(directory, f"dpi-{dpi:05d}.ev")
+
+
+def stroke_counts(events, pause=0.3):
+    """Length in counts of every stroke in a structured array of input events"""
+    np = _numpy()
+    rel = events[(events['type'] == EV_REL) & (events['code'] <= REL_Y)]
+    if not len(rel):
+        return np.empty(0)
+    times = rel['sec'] + rel['usec'] * 1e-6
+    # A new stroke starts after every pause
+    stroke = np.concatenate(([0], np.cumsum(np.diff(times) >= pause)))
+    values = rel['value'].astype(np.float64)
+    is_x = rel['code'] == REL_X
+    dx = np.bincount(stroke, weights=np.where(is_x, values, 0))
+    dy = np.bincount(stroke, weights=np.where(is_x, 0, values))
+    return np.hypot(dx, dy)
+
+
+def analyze(steps, distance_mm, tolerance=0.05, min_counts=10):
+    """Calibrations for [(dpi, stroke counts)], all steps in one vectorized pass
+
+    Strokes shorter than `min_counts` are twitches, not strokes, and are
+    ignored. A step without strokes is flagged with a CPI of 0.
+    """
+    np = _numpy()
+    inches = distance_mm / MM_PER_INCH
+    dpis = np.array([dpi for dpi, _ in steps], dtype=np.float64)
+    cpi = np.concatenate([np.asarray(counts, dtype=np.float64) for _, counts in steps] or [np.empty(0)]) / inches
+    group = np.repeat(np.arange(len(steps)), [len(counts) for _, counts in steps])
+    keep = cpi * inches >= min_counts
+    cpi, group = cpi[keep], group[keep]
+
+    n = np.bincount(group, minlength=len(steps))
+    total = np.bincount(group, weights=cpi, minlength=len(steps))
+    squares = np.bincount(group, weights=cpi * cpi, minlength=len(steps))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.where(n > 0, total / n, 0.0)
+        std = np.sqrt(np.maximum(np.where(n > 0, squares / n, 0.0) - mean * mean, 0.0))
+
+    # Medians per group: sort by group, then by value, and pick the middle of each run
+    order = np.lexsort((cpi, group))
+    ordered = cpi[order]
+    starts = np.concatenate(([0], np.cumsum(n)[:-1]))
+    low = ordered[np.clip(starts + (n - 1) // 2, 0, max(len(ordered) - 1, 0))] if len(ordered) else np.zeros(len(steps))
+    high = ordered[np.clip(starts + n // 2, 0, max(len(ordered) - 1, 0))] if len(ordered) else np.zeros(len(steps))
+    median = np.where(n > 0, (low + high) / 2, 0.0)
+
+    drift = np.where(dpis > 0, (median - dpis) / dpis, 0.0)
+    flagged = (n == 0) | (np.abs(drift) > tolerance)
+    return [
+        Calibration(int(dpis[i]), int(n[i]), round(float(median[i]), 1), round(float(std[i]), 1),
+                    round(float(drift[i]) * 100, 2), bool(flagged[i]))
+        for i in range(len(steps))
+    ]
+
+
+def load_session(directory, pause=0.3):
+    """[(dpi, stroke counts)] of every step recorded in `directory`, by DPI"""
+    np = _numpy()
+    dtype = np.dtype(EVENT_FIELDS)
+    steps = []
+    try:
+        names = sorted(os.listdir(directory))
+    except OSError as e:
+        raise CalibrationError(f"Cannot read {directory}: {e.strerror}") from None
+    for name in names:
+        match = STEP_FILE.match(name)
+        if match:
+            events = np.fromfile(os.path.join(directory, name), dtype=dtype)
+            steps.append((int(match.group(1)), stroke_counts(events, pause)))
+    if not steps:
+        raise CalibrationError(f"No dpi-NNNNN.ev recordings in {directory}")
+    return steps
+
+
+def record_strokes(path, strokes, pause=0.3, timeout=60, record_path=None, on_stroke=None):
+    """Record the event device at `path` until `strokes` strokes ended with a pause
+
+    Returns the events as a structured array and writes the raw stream to
+    `record_path` if given. on_stroke(n) is called as each stroke ends.
+    """
+    np = _numpy()
+    dtype = np.dtype(EVENT_FIELDS)
+    try:
+        fd = os.open(path, os.O_RDONLY | os.O_NONBLOCK)
+    except OSError as e:
+        raise CalibrationError(f"Cannot open {path}: {e.strerror}") from None
+    data = bytearray()
+    done = 0
+    moving = False
+    last_motion = 0.0
+    end = time.monotonic() + timeout
+    try:
+        while done < strokes:
+            now = time.monotonic()
+            if now >= end:
+                raise CalibrationError(f"Only {done} of {strokes} strokes within {timeout:g} s")
+            if moving and now - last_motion >= pause:
+                moving = False
+                done += 1
+                if on_stroke is not None:
+                    on_stroke(done)
+                continue
+            readable, _, _ = select.select([fd], [], [], min(pause / 4, end - now))
+            if not readable:
+                continue
+            try:
+                chunk = os.read(fd, 4096)
+            except BlockingIOError:
+                continue
+            if not chunk:
+                raise CalibrationError(f"{path} went away after {done} strokes")
+            data += chunk
+            events = np.frombuffer(chunk, dtype=dtype, count=len(chunk) // dtype.itemsize)
+            if np.any((events['type'] == EV_REL) & (events['code'] <= REL_Y)):
+                moving = True
+                last_motion = time.monotonic()
+    finally:
+        os.close(fd)
+    if record_path is not None:
+        with open(record_path, 'wb') as f:
+            f.write(data)
+    return np.frombuffer(bytes(data), dtype=dtype, count=len(data) // dtype.itemsize)
+
+
+def slot_steps(state):
+    """(dpi, state) per enabled slot of `state`, each with that slot active"""
+    return [(dpi, state._replace(active_dpi=slot))
+            for slot, dpi in enumerate(state.dpis, start=1) if dpi]
+
+
+def sweep_steps(state, dpis=DPI_TABLE):
+    """(dpi, state) per DPI in `dpis`, each set in slot 1 and active"""
+    return [(dpi, state._replace(dpis=(dpi,) + tuple(state.dpis[1:]), active_dpi=1)) for dpi in dpis]
+
+
+def run_session(transport, steps, event_path, directory, strokes=5, pause=0.3, timeout=60,
+                restore=None, send_timeout=None, on_step=None, on_stroke=None):
+    """Send each step's DPI report, record its strokes into `directory`; returns [(dpi, stroke counts)]
+
+    on_step(i, dpi) is called before recording step i. `restore`, the
+    state the mouse had, is sent again at the end, even after a failure.
+    """
+    os.makedirs(directory, exist_ok=True)
+    measured = []
+    try:
+        for i, (dpi, state) in enumerate(steps):
+            transport.apply(state, {'dpi'}, timeout=send_timeout)
+            if on_step is not None:
+                on_step(i, dpi)
+            events = record_strokes(event_path, strokes, pause, timeout,
+                                    record_path=step_path(directory, dpi), on_stroke=on_stroke)
+            measured.append((dpi, stroke_counts(events, pause)))
+    finally:
+        if restore is not None:
+            transport.apply(restore, {'dpi'}, timeout=send_timeout)
+    return measured
+
+
+def code_of(dpi):
+    """Device code and flags dpi.odin and set_dpis use for `dpi`, as text"""
+    index = protocol.dpi_index(dpi)
+    return (f"code {protocol.DPI_CODES[index]:#04x}, high range {protocol.DPI_HIGH_RANGE[index]}, "
+            f">12K {int(dpi > 12000)}")
+
+
+def format_results(results):
+    lines = [f"{'dpi':>6} {'strokes':>7} {'cpi':>9} {'std':>7} {'drift %':>8}"]
+    for result in results:
+        line = (f"{result.dpi:>6} {result.strokes:>7} {result.cpi:>9.1f} {result.cpi_std:>7.1f} "
+                f"{result.drift_pct:>+8.2f}")
+        if result.flagged:
+            line += f"  DRIFT ({code_of(result.dpi)})"
+        lines.append(line)
+    return '\n'.join(lines)
@@ -0,0 +1,167 @@
+"""
+Reading, checking and replaying the driver's -capture logs
+
+A capture starts with b"R1CAP\\0" and a format version (u16le), followed by
+one record per USB transfer: microseconds since the capture started (u64le),
+direction (0 host to device, 1 device to host), the control transfer's
+wValue or the interrupt endpoint (u16le), the payload length (u16le) and
+the payload. Records are parsed straight out of one memoryview of the
+file; a payload is a slice of it and is only copied when printed.
+
+A record cut short, e.g. because the driver was killed while writing it,
+ends the capture.
+"""
+
+import struct
+import time
+from collections import namedtuple
+
+from . import protocol
+from .errors import R1Error
+
+MAGIC = b'R1CAP\0'
+VERSION = 1
+
+HEADER = struct.Struct('<6sH')
+RECORD = struct.Struct('<QBHH')
+
+OUT = 0
+IN = 1
+
+# payload is a memoryview into the capture
+Record = namedtuple('Record', ['time_us', 'direction', 'value', 'payload'])
+
+# acked is None when the capture didn't wait for an ack, e.g. for a wired mouse
+Replayed = namedtuple('Replayed', ['time_us', 'value', 'late_us', 'acked'])
+
+DECODERS = {
+    protocol.REPORT_DPI: protocol.decode_dpi_report,
+    protocol.REPORT_TIMES: protocol.decode_times_report,
+    protocol.REPORT_POLLING: protocol.decode_polling_report,
+}
+ENCODERS = {
+    protocol.REPORT_DPI: protocol.encode_dpi_report,
+    protocol.REPORT_TIMES: protocol.encode_times_report,
+    protocol.REPORT_POLLING: protocol.encode_polling_report,
+}
+
+
+class CaptureError(R1Error):
+    """Raised for files that aren't captures or use an unknown version"""
+
+
+def iter_records(data):
+    """Yield the Records of a capture held in `data` (bytes, bytearray or mmap)"""
+    view = memoryview(data)
+    if len(view) < HEADER.size:
+        raise CaptureError("Not a capture: too short")
+    magic, version = HEADER.unpack_from(view)
+    if magic != MAGIC:
+        raise CaptureError("Not a capture: bad magic")
+    if version != VERSION:
+        raise CaptureError(f"Unsupported capture version {version}")
+
+    unpack = RECORD.unpack_from
+    offset = HEADER.size
+    end = len(view)
+    while offset + RECORD.size <= end:
+        time_us, direction, value, length = unpack(view, offset)
+        offset += RECORD.size
+        if offset + length > end:
+            return
+        yield Record(time_us, direction, value, view[offset:offset + length])
+        offset += length
+
+
+def read_capture(path):
+    """All records of the capture at `path`"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    return list(iter_records(data))
+
+
+def is_ack(payload):
+    return len(payload) > 2 and payload[2] == protocol.ACK
+
+
+def describe(record):
+    """Decoded meaning of a record, e.g. "polling_rate=1000" or "ack" """
+    if record.direction == IN:
+        if is_ack(record.payload):
+            return "ack"
+        if len(record.payload) > 4:
+            return f"status, charge {record.payload[4] * 10}%"
+        return "input"
+    decode = DECODERS.get(record.value)
+    if decode is None:
+        return "unknown report"
+    try:
+        settings = decode(record.payload)
+    except ValueError as e:
+        return f"undecodable: {e}"
+    if record.value == protocol.REPORT_DPI:
+        dpis, active_dpi, ripple_control, angle_snap = settings
+        return (f"dpis={' '.join(map(str, dpis))} active_dpi={active_dpi} "
+                f"ripple_control={ripple_control} angle_snap={angle_snap}")
+    if record.value == protocol.REPORT_TIMES:
+        sleep_time, deep_sleep_time, key_response_time = settings
+        return f"sleep_time={sleep_time:g} deep_sleep_time={deep_sleep_time} key_response_time={key_response_time}"
+    return f"polling_rate={settings}"
+
+
+def format_record(record):
+    direction = 'OUT' if record.direction == OUT else 'IN '
+    return (f"{record.time_us / 1000:10.3f} ms  {direction} {record.value:#06x}  "
+            f"{record.payload.hex()}  {describe(record)}")
+
+
+def check(records):
+    """Re-encode every captured report from its decoded settings; describe each difference
+
+    An empty list means the encoders in attack_shark_r1.protocol produce
+    exactly the bytes that were captured.
+    """
+    mismatches = []
+    for record in records:
+        if record.direction != OUT or record.value not in DECODERS:
+            continue
+        try:
+            settings = DECODERS[record.value](record.payload)
+            args = settings if isinstance(settings, tuple) else (settings,)
+            encoded = ENCODERS[record.value](*args)
+        except ValueError as e:
+            mismatches.append(f"{record.time_us} us, report {record.value:#x}: {e}")
+            continue
+        if encoded != record.payload:
+            mismatches.append(f"{record.time_us} us, report {record.value:#x}: captured "
+                              f"{record.payload.hex()}, encoders give {encoded.hex()}")
+    return mismatches
+
+
+def replay(records, transport, speed=1.0):
+    """Send the captured control transfers through `transport` at their original pace
+
+    `transport` is a ReportTransport, normally a simulated device. Every
+    transfer goes out once its capture time, divided by `speed`, has passed;
+    if the receiver acked it in the capture, an ack is waited for again.
+    Returns a Replayed per control transfer, with how late it was sent.
+    """
+    results = []
+    start = time.monotonic()
+    for i, record in enumerate(records):
+        if record.direction != OUT:
+            continue
+        scheduled = record.time_us / 1e6 / speed
+        delay = scheduled - (time.monotonic() - start)
+        if delay > 0:
+            time.sleep(delay)
+        late_us = int((time.monotonic() - start - scheduled) * 1e6)
+        transport.write_feature(record.value, record.payload)
+
+        acked = None
+        following = records[i + 1] if i + 1 < len(records) else None
+        if following is not None and following.direction == IN and is_ack(following.payload):
+            response = transport.read_input(transport.ack_timeout)
+            acked = response is not None and is_ack(response)
+        results.append(Replayed(record.time_us, record.value, late_us, acked))
+    return results
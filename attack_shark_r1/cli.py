@@ -0,0 +1,628 @@
+"""
+Command line entry point, usable from hotkeys and scripts:
+
+    python3 -m attack_shark_r1 profile switch fps
+    python3 -m attack_shark_r1 profile next
+    python3 -m attack_shark_r1 apply --polling-rate 500 --dpi 1=1600
+    python3 -m attack_shark_r1 query
+    python3 -m attack_shark_r1 devices
+    python3 -m attack_shark_r1 apply --all-devices --profile fps
+    python3 -m attack_shark_r1 capture show apply.r1cap
+    python3 -m attack_shark_r1 pollrate --duration 5
+    python3 -m attack_shark_r1 calibrate sweep --distance-mm 100 --out sweep/
+    python3 -m attack_shark_r1 metrics serve
+    python3 -m attack_shark_r1 service --transport libusb
+    python3 -m attack_shark_r1 macro play copy-paste
+    python3 -m attack_shark_r1 autoswitch
+    python3 -m attack_shark_r1 hotplug
+    python3 -m attack_shark_r1 gui
+
+Everything but `gui` runs without importing GTK, and modules only some
+commands need are imported by those commands. Their errors derive from
+errors.R1Error, so main() reports them without importing them first.
+"""
+
+import argparse
+import sys
+import time
+
+from .devices import apply_to_all, describe, list_devices, state_key
+from .errors import R1Error, UsageError
+from .profiles import ProfileStore, switch_profile
+from .protocol import DPI_MAX, DPI_MIN
+from .settings import DEFAULT_STATE, REPORT_GROUPS, AppliedStateCache, changed_report_groups
+from .trace import log_record, logged, make_record
+from .transport import TRANSPORTS, ReportTransport, TransportError, open_transport
+from .validation import validate
+
+
+def transport_kwargs(args, device=None):
+    kwargs = {}
+    # The config file also gives the values of disabled DPI slots
+    if args.config_path and (args.transport == 'driver' or issubclass(TRANSPORTS[args.transport], ReportTransport)):
+        kwargs['config_path'] = args.config_path
+    device = device or args.device
+    if device:
+        kwargs['device'] = device
+    return kwargs
+
+
+def print_error(error):
+    """Report an error a watcher carries on after, the way main() reports the fatal ones"""
+    print(f"ERROR: {error}", file=sys.stderr, flush=True)
+
+
+def cmd_profile_list(args):
+    store = ProfileStore(args.profiles)
+    for name in store.names():
+        print(f"{'*' if name == store.active else ' '} {name}")
+
+
+def cmd_profile_show(args):
+    profile = ProfileStore(args.profiles).get(args.name)
+    for field, value in profile.state._asdict().items():
+        print(f"{field} = {value}")
+    for report_id, payload in profile.reports:
+        print(f"report {report_id:#x} = {payload.hex()}")
+
+
+def cmd_profile_switch(args):
+    store = ProfileStore(args.profiles)
+    name = store.next_name() if args.command == 'next' else args.name
+    transport = open_transport(args.transport, **transport_kwargs(args))
+    try:
+        with logged('send', transport):
+            profile = switch_profile(store, name, transport, timeout=args.timeout)
+    finally:
+        transport.close()
+    # Keep the GUI's idea of what the mouse holds in sync
+    AppliedStateCache().put(state_key(args.device), profile.state)
+    print(f"Switched to {name}")
+
+
+def cmd_profile_delete(args):
+    ProfileStore(args.profiles).delete(args.name)
+
+
+def parse_bool(value):
+    if value.lower() in ('true', '1', 'yes', 'on'):
+        return True
+    if value.lower() in ('false', '0', 'no', 'off'):
+        return False
+    raise argparse.ArgumentTypeError(f"expected true or false, got {value!r}")
+
+
+def parse_dpi(value):
+    slot, _, dpi = value.partition('=')
+    try:
+        return int(slot), int(dpi)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected SLOT=DPI, got {value!r}") from None
+
+
+def config_state(args):
+    """The settings of the driver's config file, which it falls back to for flags it isn't given"""
+    from .config import ConfigStore, default_config_path
+
+    try:
+        return ConfigStore().load(args.config_path or default_config_path()).state
+    except OSError:
+        return DEFAULT_STATE
+
+
+def cmd_apply(args):
+    cache = AppliedStateCache()
+    applied = cache.get(state_key(args.device))
+    if args.profile:
+        state = ProfileStore(args.profiles).get(args.profile).state
+    else:
+        state = applied or config_state(args)
+
+    changes = {
+        field: getattr(args, field)
+        for field in ('polling_rate', 'active_dpi', 'ripple_control', 'angle_snap',
+                      'sleep_time', 'deep_sleep_time', 'key_response_time')
+        if getattr(args, field) is not None
+    }
+    if args.dpi:
+        dpis = list(state.dpis)
+        for slot, dpi in args.dpi:
+            if not 1 <= slot <= 6:
+                raise UsageError(f"DPI slot must be 1-6, got {slot}")
+            dpis[slot - 1] = dpi
+        changes['dpis'] = tuple(dpis)
+    state = state._replace(**changes)
+
+    problems = validate(state, allow_disabled_dpis=True)
+    if problems:
+        raise UsageError(problems[0].message)
+
+    if args.all_devices:
+        apply_all(args, cache, state)
+        return
+
+    if args.full:
+        groups = set(REPORT_GROUPS)
+    elif applied is None and not args.profile:
+        # What the mouse holds is unknown, e.g. after a failed apply: send what was asked
+        # for, not a guess at everything else
+        groups = {group for group, fields in REPORT_GROUPS.items() if any(field in changes for field in fields)}
+        if not groups:
+            print("No settings given and the applied ones are unknown, nothing to send (--full sends all)")
+            return
+    else:
+        groups = changed_report_groups(applied, state)
+    if not groups:
+        print("Settings already applied, nothing to send")
+        return
+    transport = open_transport(args.transport, **transport_kwargs(args))
+    try:
+        with logged('apply', transport):
+            transport.apply(state, groups, timeout=args.timeout)
+    except Exception:
+        # Some reports may have gone out, the device state is unknown now
+        cache.forget(state_key(args.device))
+        raise
+    finally:
+        transport.close()
+    # The groups not sent are still unknown, don't record a guess for them
+    if applied is not None or args.profile or groups == set(REPORT_GROUPS):
+        cache.put(state_key(args.device), state)
+
+
+def apply_all(args, cache, state):
+    """Send every report to every connected R1 at once"""
+    device_ids = [device.id for device in list_devices()]
+    if not device_ids:
+        raise TransportError("No Attack Shark R1 found")
+    results = apply_to_all(device_ids, lambda device: open_transport(args.transport, **transport_kwargs(args, device)),
+                           state, timeout=args.timeout, config_path=args.config_path)
+    failed = 0
+    for result in results:
+        log_record(make_record('apply-all', 'all', [], 0, result.elapsed, result.error))
+        if result.error is None:
+            cache.put(state_key(result.device), state)
+            print(f"{result.device}: applied in {result.elapsed * 1000:.0f} ms")
+        else:
+            failed += 1
+            cache.forget(state_key(result.device))
+            print(f"{result.device}: ERROR: {result.error}")
+    if failed:
+        raise TransportError(f"{failed} of {len(results)} devices failed")
+
+
+def cmd_query(args):
+    transport = open_transport(args.transport, **transport_kwargs(args))
+    try:
+        print(transport.query_charge(timeout=args.timeout))
+    finally:
+        transport.close()
+
+
+def cmd_devices(args):
+    for device in list_devices():
+        print(describe(device))
+
+
+def cmd_capture_show(args):
+    from . import capture
+
+    for record in capture.read_capture(args.file):
+        print(capture.format_record(record))
+
+
+def cmd_capture_check(args):
+    from . import capture
+
+    mismatches = capture.check(capture.read_capture(args.file))
+    for mismatch in mismatches:
+        print(mismatch)
+    if mismatches:
+        raise capture.CaptureError(f"{len(mismatches)} captured reports differ from what the encoders produce")
+    print("All captured reports match the encoders")
+
+
+def cmd_capture_replay(args):
+    from . import capture
+
+    records = capture.read_capture(args.file)
+    transport = open_transport(args.transport, **({'device': args.device} if args.device else {}))
+    try:
+        results = capture.replay(records, transport, speed=args.speed)
+    finally:
+        transport.close()
+    if not results:
+        print("No control transfers to replay")
+        return
+    late = sorted(result.late_us for result in results)
+    waited = [result.acked for result in results if result.acked is not None]
+    print(f"Replayed {len(results)} transfers: late by p50 {late[len(late) // 2]} us, max {late[-1]} us; "
+          f"{sum(waited)} of {len(waited)} acks received")
+
+
+def cmd_pollrate(args):
+    from . import pollrate
+
+    expected = args.expected
+    if expected is None:
+        applied = AppliedStateCache().get(state_key(args.device))
+        expected = applied.polling_rate if applied is not None else DEFAULT_STATE.polling_rate
+
+    if args.dump:
+        times, overruns = pollrate.read_dump(args.dump)
+    else:
+        path = args.event or pollrate.find_event_device()
+        if path is None:
+            raise pollrate.PollRateError("No Attack Shark R1 input device found, pass --event")
+        print(f"Move the mouse for {args.duration:g} s...", file=sys.stderr)
+        times, overruns = pollrate.measure(path, args.duration, record_path=args.record)
+
+    report = pollrate.analyze(times, expected, overruns)
+    print(pollrate.summarize(report))
+    print(f"{report.reports} reports, {report.intervals} intervals counted, "
+          f"jitter mean {report.jitter_mean_us:+.1f} us, p99 {report.jitter_p99_us:.0f} us")
+    if args.histogram:
+        print(pollrate.format_histogram(report))
+
+
+def cmd_calibrate(args):
+    from . import calibration, pollrate
+
+    if args.command == 'analyze':
+        steps = calibration.load_session(args.directory, pause=args.pause)
+    else:
+        path = args.event or pollrate.find_event_device()
+        if path is None:
+            raise calibration.CalibrationError("No Attack Shark R1 input device found, pass --event")
+        cache = AppliedStateCache()
+        state = cache.get(state_key(args.device)) or DEFAULT_STATE
+        if args.command == 'slots':
+            plan = calibration.slot_steps(state)
+        else:
+            plan = calibration.sweep_steps(state, [dpi for dpi in calibration.DPI_TABLE
+                                                   if args.start <= dpi <= args.stop])
+
+        def on_step(i, dpi):
+            print(f"[{i + 1}/{len(plan)}] {dpi} DPI: move {args.distance_mm:g} mm {args.strokes} times, "
+                  f"pausing in between", file=sys.stderr)
+
+        transport = open_transport(args.transport, **transport_kwargs(args))
+        try:
+            steps = calibration.run_session(
+                transport, plan, path, args.out, strokes=args.strokes, pause=args.pause,
+                restore=state, send_timeout=args.timeout, on_step=on_step,
+                on_stroke=lambda n: print(f"  stroke {n}", file=sys.stderr))
+        except Exception:
+            # The DPI report may not have gone back to what the cache says
+            cache.forget(state_key(args.device))
+            raise
+        finally:
+            transport.close()
+
+    results = calibration.analyze(steps, args.distance_mm, tolerance=args.tolerance / 100)
+    print(calibration.format_results(results))
+    flagged = sum(result.flagged for result in results)
+    if flagged:
+        print(f"{flagged} of {len(results)} settings drift more than {args.tolerance:g}%")
+
+
+def cmd_metrics(args):
+    from . import metrics
+
+    # A one-off textfile run has no earlier reads to build on, it counts the whole (capped) log
+    once = args.command == 'textfile' and args.once
+    exporter = metrics.Metrics(args.trace_log, metrics.open_battery(args.battery), from_start=once)
+    try:
+        if args.command == 'serve':
+            print(f"Serving metrics on http://{args.host}:{args.port}/metrics", file=sys.stderr)
+            metrics.serve(exporter, args.port, args.host)
+            return
+        while True:
+            exporter.refresh()
+            metrics.write_textfile(exporter, args.directory)
+            if args.once:
+                return
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        pass
+
+
+def cmd_service(args):
+    from . import service
+
+    if args.transport == 'service':
+        raise TransportError("The service can't send through itself, pick the transport it should own")
+    owner = service.DeviceOwner(
+        lambda: open_transport(args.transport, **transport_kwargs(args)),
+        AppliedStateCache(), state_key(args.device), ProfileStore(args.profiles), timeout=args.timeout,
+        base=config_state(args))
+    service.serve(owner)
+
+
+def cmd_macro(args):
+    from . import macros, pollrate
+    from .config import ConfigStore, default_config_path
+
+    config_store = ConfigStore()
+    config_path = args.config_path or default_config_path()
+    if args.command == 'record':
+        path = args.event or pollrate.find_event_device()
+        if path is None:
+            raise macros.MacroError("No Attack Shark R1 input device found, pass --event")
+        print(f"Recording {path} for {args.duration:g} s...", file=sys.stderr)
+        steps = macros.record(path, args.duration)
+        if not steps:
+            raise macros.MacroError("No keys or buttons were pressed")
+        print(steps)
+        if args.save:
+            try:
+                config = config_store.load(config_path)
+                state, gui, defined = config.state, config.gui, dict(config.macros)
+            except FileNotFoundError:
+                state, gui, defined = DEFAULT_STATE, None, {}
+            defined[args.save] = macros.Macro(args.save, steps, 1)
+            config_store.save(config_path, state, gui, defined)
+        return
+
+    try:
+        defined = config_store.load(config_path).macros
+    except FileNotFoundError:
+        defined = {}
+    if args.command == 'list':
+        for macro in defined.values():
+            print(f"{macro.name}: {macro.steps}" + (f" (x{macro.repeat})" if macro.repeat != 1 else ""))
+        return
+    if args.name not in defined:
+        raise macros.MacroError(f"No macro named {args.name!r} in {config_path}")
+    macro = defined[args.name]
+    compiled = macros.compile_macro(macro.steps, macro.repeat)
+    if args.command == 'show':
+        print(macros.describe(compiled))
+        return
+
+    if args.realtime and not macros.realtime():
+        print("Not allowed to use SCHED_FIFO, playing at normal priority; the timing may slip "
+              "while every CPU is busy", file=sys.stderr)
+    sink = macros.MockSink(len(compiled.times)) if args.mock else macros.UinputSink(compiled.codes)
+    try:
+        late = macros.play(compiled, sink)
+    except KeyboardInterrupt:
+        return
+    finally:
+        sink.close()
+    print(f"{len(compiled.times)} moments, at most {late / 1e3:.0f} us late")
+
+
+def cmd_autoswitch(args):
+    from . import autoswitch
+
+    store = ProfileStore(args.profiles)
+    rules, default, debounce = autoswitch.load_rules(args.rules)
+    for profile in set(rules.values()) | {default} - {None}:
+        store.get(profile)
+    transport = open_transport(args.transport, **transport_kwargs(args))
+    watcher = autoswitch.ProcessWatcher(rules, scan_interval=args.scan_interval)
+    switcher = autoswitch.AutoSwitcher(store, AppliedStateCache(), transport, rules, default, debounce,
+                                       key=state_key(args.device))
+    switcher.on_switched = lambda name: print(f"Switched to {name}", flush=True)
+    try:
+        autoswitch.run(switcher, watcher, on_error=print_error)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+        transport.close()
+
+
+def cmd_hotplug(args):
+    from . import hotplug
+    from .config import ConfigStore, default_config_path
+
+    store = ProfileStore(args.profiles)
+    config_store = ConfigStore()
+    config_path = args.config_path or default_config_path()
+    reapplier = hotplug.Reapplier(
+        AppliedStateCache(),
+        lambda: open_transport(args.transport, **transport_kwargs(args)),
+        lambda applied: hotplug.wanted_settings(applied, store, config_store, config_path),
+        settle=args.settle, sysfs=args.sysfs, timeout=args.timeout, device=args.device)
+    reapplier.on_reapplied = lambda state: print("Settings reapplied", flush=True)
+
+    sources = [hotplug.UeventSource()]
+    try:
+        sources.append(hotplug.LogindSource())
+    except OSError as e:
+        print(f"Not following suspend and resume: {e}", file=sys.stderr)
+    try:
+        hotplug.run(reapplier, sources, on_error=print_error)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for source in sources:
+            source.close()
+
+
+def cmd_gui(args):
+    from .gui import main
+
+    main()
+
+
+def add_transport_arguments(parser):
+    parser.add_argument('--transport', choices=sorted(TRANSPORTS), default='driver',
+                        help="how to reach the mouse (default: driver)")
+    parser.add_argument('--config-path', help="driver config file, for the driver transport")
+    parser.add_argument('--timeout', type=float, default=10, help="give up after this many seconds")
+    parser.add_argument('--device', metavar='ID', help="R1 to use, as listed by `devices` (default: the first found)")
+
+
+def add_profiles_argument(parser):
+    parser.add_argument('--profiles', metavar='PATH',
+                        help="profile file (default $XDG_CONFIG_HOME/attack-shark/profiles.json)")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="attack_shark_r1", description="Attack Shark R1 tools")
+    commands = parser.add_subparsers(dest='area', required=True)
+
+    profile = commands.add_parser('profile', help="list, switch and delete named profiles")
+    add_profiles_argument(profile)
+    actions = profile.add_subparsers(dest='command', required=True)
+
+    actions.add_parser('list', help="list profiles, the active one marked with *").set_defaults(func=cmd_profile_list)
+
+    show = actions.add_parser('show', help="print a profile's settings and reports")
+    show.add_argument('name')
+    show.set_defaults(func=cmd_profile_show)
+
+    delete = actions.add_parser('delete', help="remove a profile")
+    delete.add_argument('name')
+    delete.set_defaults(func=cmd_profile_delete)
+
+    switch = actions.add_parser('switch', help="send a profile to the mouse")
+    switch.add_argument('name')
+    following = actions.add_parser('next', help="switch to the profile after the active one")
+    for sub in (switch, following):
+        add_transport_arguments(sub)
+        sub.set_defaults(func=cmd_profile_switch)
+
+    apply = commands.add_parser('apply', help="send settings, only the reports that changed unless --full")
+    apply.add_argument('--profile', help="start from this profile instead of the last applied settings")
+    add_profiles_argument(apply)
+    apply.add_argument('--polling-rate', type=int)
+    apply.add_argument('--dpi', type=parse_dpi, action='append', metavar='SLOT=DPI', help="0 disables a slot")
+    apply.add_argument('--active-dpi', type=int)
+    apply.add_argument('--ripple-control', type=parse_bool, metavar='BOOL')
+    apply.add_argument('--angle-snap', type=parse_bool, metavar='BOOL')
+    apply.add_argument('--sleep-time', type=float)
+    apply.add_argument('--deep-sleep-time', type=int)
+    apply.add_argument('--key-response-time', type=int)
+    apply.add_argument('--full', action='store_true', help="send every report")
+    apply.add_argument('--all-devices', action='store_true', help="send every report to every connected R1 at once")
+    add_transport_arguments(apply)
+    apply.set_defaults(func=cmd_apply)
+
+    query = commands.add_parser('query', help="print the battery charge")
+    add_transport_arguments(query)
+    query.set_defaults(func=cmd_query)
+
+    commands.add_parser('devices', help="list connected R1s by id").set_defaults(func=cmd_devices)
+
+    captures = commands.add_parser('capture', help="inspect and replay captures made with the driver's -capture")
+    actions = captures.add_subparsers(dest='command', required=True)
+    show = actions.add_parser('show', help="print every transfer with its decoded settings")
+    show.set_defaults(func=cmd_capture_show)
+    verify = actions.add_parser('check', help="compare the captured reports with what the encoders produce")
+    verify.set_defaults(func=cmd_capture_check)
+    replay = actions.add_parser('replay', help="send the captured reports again with their original timing")
+    replay.add_argument('--speed', type=float, default=1.0, help="replay this many times faster")
+    replay.add_argument('--transport', choices=sorted(name for name, factory in TRANSPORTS.items()
+                                                      if issubclass(factory, ReportTransport)),
+                        default='sim', help="device to replay against (default: sim, the simulated mouse)")
+    replay.add_argument('--device', metavar='ID', help="R1 to use, as listed by `devices`")
+    replay.set_defaults(func=cmd_capture_replay)
+    for sub in (show, verify, replay):
+        sub.add_argument('file')
+
+    rate = commands.add_parser('pollrate', help="measure the report rate the mouse delivers while it moves")
+    source = rate.add_mutually_exclusive_group()
+    source.add_argument('--event', metavar='PATH', help="evdev node (default: the R1's pointer)")
+    source.add_argument('--dump', metavar='FILE', help="analyze a recorded evdev stream instead")
+    rate.add_argument('--duration', type=float, default=5.0, help="seconds to measure")
+    rate.add_argument('--record', metavar='FILE', help="also write the raw event stream here")
+    rate.add_argument('--expected', type=int, choices=(125, 250, 500, 1000),
+                      help="configured rate (default: the last applied one)")
+    rate.add_argument('--device', metavar='ID', help="R1 whose last applied rate is expected")
+    rate.add_argument('--histogram', action='store_true', help="print a histogram of the intervals")
+    rate.set_defaults(func=cmd_pollrate)
+
+    calibrate = commands.add_parser('calibrate', help="measure the counts per inch each DPI setting delivers")
+    actions = calibrate.add_subparsers(dest='command', required=True)
+    slots = actions.add_parser('slots', help="measure the enabled slots of the last applied settings")
+    sweep = actions.add_parser('sweep', help="measure every DPI of the code table in one session")
+    sweep.add_argument('--start', type=int, default=DPI_MIN, metavar='DPI', help="first DPI to measure")
+    sweep.add_argument('--stop', type=int, default=DPI_MAX, metavar='DPI', help="last DPI to measure")
+    analyze = actions.add_parser('analyze', help="analyze a session recorded by slots or sweep")
+    analyze.add_argument('directory')
+    for sub in (slots, sweep):
+        sub.add_argument('--event', metavar='PATH', help="evdev node (default: the R1's pointer)")
+        sub.add_argument('--out', metavar='DIR', default='calibration',
+                         help="directory for the recorded dpi-NNNNN.ev streams (default: calibration)")
+        sub.add_argument('--strokes', type=int, default=5, help="strokes per setting")
+        add_transport_arguments(sub)
+    for sub in (slots, sweep, analyze):
+        sub.add_argument('--distance-mm', type=float, default=100, help="length of one stroke (default: 100)")
+        sub.add_argument('--tolerance', type=float, default=5, metavar='PERCENT',
+                         help="flag settings drifting more than this (default: 5)")
+        sub.add_argument('--pause', type=float, default=0.3, help="seconds without motion that end a stroke")
+        sub.set_defaults(func=cmd_calibrate)
+
+    exporter = commands.add_parser('metrics', help="export battery, apply timing and error metrics for scraping")
+    actions = exporter.add_subparsers(dest='command', required=True)
+    serve = actions.add_parser('serve', help="serve OpenMetrics over HTTP")
+    serve.add_argument('--port', type=int, default=9469)
+    serve.add_argument('--host', default='127.0.0.1', help="address to listen on (default: localhost only)")
+    textfile = actions.add_parser('textfile', help="keep a file up to date for node-exporter's textfile collector")
+    textfile.add_argument('directory', help="the collector's directory")
+    textfile.add_argument('--interval', type=float, default=15, help="seconds between updates")
+    textfile.add_argument('--once', action='store_true', help="write the file once and exit")
+    for sub in (serve, textfile):
+        sub.add_argument('--trace-log', metavar='PATH',
+                         help="apply trace log (default $XDG_STATE_HOME/attack-shark/apply-trace.jsonl)")
+        sub.add_argument('--battery', metavar='PATH',
+                         help="battery history (default $XDG_STATE_HOME/attack-shark/battery.ring)")
+        sub.set_defaults(func=cmd_metrics)
+
+    macro = commands.add_parser('macro', help="list, play and record key macros kept in the config file")
+    actions = macro.add_subparsers(dest='command', required=True)
+    listing = actions.add_parser('list', help="list the defined macros")
+    show = actions.add_parser('show', help="print when each key of a macro is pressed and released")
+    show.add_argument('name')
+    play = actions.add_parser('play', help="type a macro through a virtual input device")
+    play.add_argument('name')
+    play.add_argument('--mock', action='store_true', help="play into memory instead of /dev/uinput")
+    play.add_argument('--no-realtime', dest='realtime', action='store_false',
+                      help="play at normal priority instead of under SCHED_FIFO")
+    record = actions.add_parser('record', help="print the steps of the keys and buttons pressed")
+    record.add_argument('--event', metavar='PATH', help="evdev node (default: the R1's pointer)")
+    record.add_argument('--duration', type=float, default=5.0, help="seconds to record")
+    record.add_argument('--save', metavar='NAME', help="also keep the steps as this macro")
+    for sub in (listing, show, play, record):
+        sub.add_argument('--config-path', metavar='PATH',
+                         help="config file (default $XDG_CONFIG_HOME/attack-shark-r1.ini)")
+        sub.set_defaults(func=cmd_macro)
+
+    watch = commands.add_parser('autoswitch', help="switch profiles as configured programs start and stop")
+    watch.add_argument('--rules', metavar='PATH', help="rules file (default $XDG_CONFIG_HOME/attack-shark/autoswitch.ini)")
+    add_profiles_argument(watch)
+    watch.add_argument('--scan-interval', type=float, default=3.0,
+                       help="seconds between /proc scans when exec events are unavailable")
+    add_transport_arguments(watch)
+    watch.set_defaults(func=cmd_autoswitch)
+
+    replug = commands.add_parser('hotplug', help="reapply settings when the mouse is plugged in or the system resumes")
+    add_profiles_argument(replug)
+    replug.add_argument('--settle', type=float, default=1.0,
+                        help="seconds without events before a burst counts as over")
+    replug.add_argument('--sysfs', default='/sys', help="sysfs mount point, for checking the mouse is there")
+    add_transport_arguments(replug)
+    replug.set_defaults(func=cmd_hotplug)
+
+    owner = commands.add_parser('service', help="own the mouse and offer it to other programs on the session bus")
+    add_profiles_argument(owner)
+    add_transport_arguments(owner)
+    owner.set_defaults(func=cmd_service, transport='libusb')
+
+    commands.add_parser('gui', help="start the GTK 4 window").set_defaults(func=cmd_gui)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        args.func(args)
+    except (R1Error, OSError) as e:
+        print_error(e)
+        return 1
+    return 0
@@ -0,0 +1,248 @@
+"""
+The driver's INI config, read and written natively
+
+Settings use the keys main.odin's load_config reads from the file's global
+section; the GUI's own preferences go in a [gui] section and macros in
+[macro:NAME] sections (see attack_shark_r1.macros), which the driver never
+looks at. Parsed files are cached on (mtime, size), so loading an
+unchanged file again costs a single stat(). Writes go to a temporary file
+that is fsynced and renamed over the config, so a crash leaves either the
+old or the new file, never half of one.
+"""
+
+import json
+import os
+from collections import namedtuple
+
+from .macros import macros_from_sections, render_macros
+from .settings import DEFAULT_DPIS, DEFAULT_STATE, AppliedState
+from .validation import validate
+
+GUI_SECTION = 'gui'
+
+# GUI preferences kept in [gui] and their defaults, which also give their types
+GUI_DEFAULTS = {
+    'transport': 'driver',
+    'battery_monitor': True,
+    'live_apply': False,
+    'live_apply_debounce_ms': 300,
+    'trace_applies': False,
+}
+
+# strconv.parse_bool's spellings
+TRUE = ('1', 't', 'T', 'true', 'TRUE', 'True')
+FALSE = ('0', 'f', 'F', 'false', 'FALSE', 'False')
+
+# `state` holds DEFAULT_STATE's value for every field listed in `problems`;
+# `macros` is {name: macros.Macro}; `driver_dpis` are the dpis as the driver
+# reads them, with the values of the slots the GUI disabled
+ConfigFile = namedtuple('ConfigFile', ['state', 'gui', 'problems', 'macros', 'driver_dpis'])
+
+
+def default_config_path():
+    """The first file the driver looks for"""
+    config_home = os.environ.get('XDG_CONFIG_HOME') or os.path.expanduser("~/.config")
+    return os.path.join(config_home, "attack-shark-r1.ini")
+
+
+def legacy_json_path():
+    """Where the GUI used to save its settings as JSON"""
+    return os.path.expanduser("~/.config/attack-shark/config.json")
+
+
+def parse_ini(text):
+    """Split INI text into {section: {key: value}}; "" is the global section"""
+    sections = {'': {}}
+    current = sections['']
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line[0] in '#;':
+            continue
+        if line.startswith('[') and line.endswith(']'):
+            current = sections.setdefault(line[1:-1].strip(), {})
+            continue
+        key, sep, value = line.partition('=')
+        if sep:
+            current[key.strip()] = value.strip()
+    return sections
+
+
+def _number(text, kind):
+    # Unparsable text is kept so validation reports it as invalid
+    try:
+        return kind(text)
+    except ValueError:
+        return text
+
+
+def _bool(text):
+    if text in TRUE:
+        return True
+    if text in FALSE:
+        return False
+    return text
+
+
+def _values(settings):
+    """Convert the driver's keys like load_config does; missing keys become None"""
+    def get(key, convert):
+        text = settings.get(key)
+        return None if text is None else convert(text)
+
+    dpis = settings.get('dpis')
+    return {
+        # load_config looks the rate up as a string
+        'polling_rate': get('polling_rate', lambda t: int(t) if t in ('125', '250', '500', '1000') else t),
+        'dpis': None if dpis is None else tuple(_number(dpi, int) for dpi in dpis.split()),
+        'active_dpi': get('active_dpi', lambda t: _number(t, int)),
+        'sleep_time': get('sleep_time', lambda t: _number(t, float)),
+        'deep_sleep_time': get('deep_sleep_time', lambda t: _number(t, int)),
+        'key_response_time': get('key_response_time', lambda t: _number(t, int)),
+        'angle_snap': get('angle_snap', _bool),
+        'ripple_control': get('ripple_control', _bool),
+    }
+
+
+def _gui_values(section):
+    gui = dict(GUI_DEFAULTS)
+    for key, default in GUI_DEFAULTS.items():
+        text = section.get(key)
+        if text is None:
+            continue
+        if isinstance(default, bool):
+            value = _bool(text)
+        elif isinstance(default, int):
+            value = _number(text, int)
+        else:
+            value = text
+        if type(value) is type(default):
+            gui[key] = value
+    return gui
+
+
+def parse_config(text):
+    """Parse a config file's text into a ConfigFile"""
+    sections = parse_ini(text)
+    values = _values(sections[''])
+    state = AppliedState(**values)
+    problems = validate(state)
+
+    bad = {problem.field for problem in problems}
+    state = state._replace(**{field: getattr(DEFAULT_STATE, field) for field in bad})
+    driver_dpis = DEFAULT_DPIS if 'dpis' in bad else state.dpis
+
+    # Slots the GUI had disabled are written with a placeholder the driver accepts
+    section = sections.get(GUI_SECTION, {})
+    disabled = {int(slot) for slot in section.get('disabled_dpi_slots', '').split() if slot.isdigit()}
+    if disabled:
+        state = state._replace(dpis=tuple(0 if slot in disabled else dpi
+                                          for slot, dpi in enumerate(state.dpis, start=1)))
+    return ConfigFile(state, _gui_values(section), problems, macros_from_sections(sections), driver_dpis)
+
+
+def render_config(state, gui=None, macros=None):
+    """INI text for `state` in the layout of the shipped attack-shark-r1.ini"""
+    # Disabled slots need a value the driver accepts; it is what they are sent as (see settings.encode_reports)
+    dpis = ' '.join(str(dpi or fallback) for dpi, fallback in zip(state.dpis, DEFAULT_DPIS))
+    lines = [
+        f"polling_rate      = {state.polling_rate}",
+        "",
+        f"sleep_time        = {state.sleep_time:g}",
+        f"deep_sleep_time   = {state.deep_sleep_time}",
+        f"key_response_time = {state.key_response_time}",
+        "",
+        f"dpis = {dpis}",
+        "# selected dpi 1-6",
+        f"active_dpi = {state.active_dpi}",
+        "",
+        f"ripple_control = {str(state.ripple_control).lower()}",
+        f"angle_snap     = {str(state.angle_snap).lower()}",
+    ]
+    if gui is not None:
+        lines += ["", f"[{GUI_SECTION}]"]
+        for key, value in gui.items():
+            lines.append(f"{key} = {str(value).lower() if isinstance(value, bool) else value}")
+        disabled = [str(slot) for slot, dpi in enumerate(state.dpis, start=1) if dpi == 0]
+        if disabled:
+            lines.append(f"disabled_dpi_slots = {' '.join(disabled)}")
+    if macros:
+        lines += render_macros(macros)
+    return '\n'.join(lines) + '\n'
+
+
+def write_atomic(path, text):
+    """Replace `path` with `text` so readers see the old or the new file, never a mix"""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    # Make the rename itself durable
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class ConfigStore:
+    """Loads and saves config files, re-parsing a file only when it changed"""
+
+    def __init__(self):
+        self.cache = {}
+
+    def load(self, path):
+        """Return the ConfigFile at `path`; raises OSError if it can't be read"""
+        st = os.stat(path)
+        stamp = (st.st_mtime_ns, st.st_size)
+        cached = self.cache.get(path)
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+        with open(path, 'r') as f:
+            config = parse_config(f.read())
+        self.cache[path] = (stamp, config)
+        return config
+
+    def save(self, path, state, gui=None, macros=None):
+        """Write `state` (and GUI preferences and macros) to `path` atomically"""
+        text = render_config(state, gui, macros)
+        write_atomic(path, text)
+        st = os.stat(path)
+        self.cache[path] = ((st.st_mtime_ns, st.st_size), parse_config(text))
+
+
+def read_legacy_json(path):
+    """Read a config.json saved by older GUI versions as (state, gui)"""
+    with open(path, 'r') as f:
+        data = json.load(f)
+    dpi = data.get('dpi', {})
+    state = AppliedState(
+        polling_rate=data.get('polling_rate', DEFAULT_STATE.polling_rate),
+        dpis=tuple(dpi.get(str(i), 800 if i == 1 else 0) for i in range(1, 7)),
+        active_dpi=data.get('active_dpi', DEFAULT_STATE.active_dpi),
+        ripple_control=data.get('ripple_control', DEFAULT_STATE.ripple_control),
+        angle_snap=data.get('angle_snap', DEFAULT_STATE.angle_snap),
+        sleep_time=data.get('sleep_time', DEFAULT_STATE.sleep_time),
+        deep_sleep_time=data.get('deep_sleep_time', DEFAULT_STATE.deep_sleep_time),
+        key_response_time=data.get('key_response_time', DEFAULT_STATE.key_response_time),
+    )
+    # The JSON used the same names for the preferences
+    gui = {key: data.get(key, default) for key, default in GUI_DEFAULTS.items()}
+    return state, gui
+
+
+def migrate_legacy_json(store, json_path, ini_path):
+    """Convert the old JSON config once, if there is no INI config yet; True if it did"""
+    if os.path.exists(ini_path) or not os.path.exists(json_path):
+        return False
+    try:
+        state, gui = read_legacy_json(json_path)
+    except (OSError, ValueError, AttributeError):
+        return False
+    if validate(state, allow_disabled_dpis=True):
+        return False
+    store.save(ini_path, state, gui)
+    return True
@@ -0,0 +1,105 @@
+"""
+Finding every connected R1 and configuring them all at once
+
+Devices are named by their USB bus and port path, e.g. 3-1.4: the name
+the kernel gives them under /sys/bus/usb/devices and the driver prints
+with -list-devices. It stays the same across replugs into the same port,
+unlike bus addresses, and also works for receivers without a serial number.
+"""
+
+import os
+import time
+from collections import namedtuple
+
+from .settings import DEVICE, REPORT_GROUPS, encode_reports
+from .transport import PID, VID, WIRED_PID
+
+# serial is None when the device has none
+Device = namedtuple('Device', ['id', 'wired', 'serial'])
+
+# error is None if the apply succeeded
+DeviceResult = namedtuple('DeviceResult', ['device', 'error', 'elapsed'])
+
+
+def _read(path):
+    with open(path) as f:
+        return f.read().strip()
+
+
+def list_devices(sysfs='/sys'):
+    """Every connected receiver and wired R1, sorted by id"""
+    devices = []
+    try:
+        entries = list(os.scandir(os.path.join(sysfs, 'bus', 'usb', 'devices')))
+    except OSError:
+        return devices
+    for entry in entries:
+        try:
+            vid = int(_read(os.path.join(entry.path, 'idVendor')), 16)
+            pid = int(_read(os.path.join(entry.path, 'idProduct')), 16)
+        except (OSError, ValueError):
+            continue
+        if vid != VID or pid not in (PID, WIRED_PID):
+            continue
+        try:
+            serial = _read(os.path.join(entry.path, 'serial')) or None
+        except OSError:
+            serial = None
+        devices.append(Device(entry.name, pid == WIRED_PID, serial))
+    return sorted(devices)
+
+
+def describe(device):
+    """One line for pickers and listings, e.g. "3-1.4 wireless (serial 1234)" """
+    text = f"{device.id} {'wired' if device.wired else 'wireless'}"
+    if device.serial:
+        text += f" (serial {device.serial})"
+    return text
+
+
+def state_key(device_id, sysfs='/sys'):
+    """Key of a device in the AppliedStateCache
+
+    The first R1 found (device_id None) is keyed by its id when it is the
+    only one connected, so picking it by id shares its entry. With none or
+    several connected it can't be told which one it is, and it keeps the
+    plain key.
+    """
+    if device_id is None:
+        devices = list_devices(sysfs)
+        if len(devices) != 1:
+            return DEVICE
+        device_id = devices[0].id
+    return f"{DEVICE}@{device_id}"
+
+
+def apply_to_all(device_ids, connect, state, timeout=None, config_path=None):
+    """Send every report of `state` to all devices in parallel, one worker each
+
+    `connect(device_id)` opens a transport for one device. Disabled DPI
+    slots take the values of the config file at `config_path` (see
+    settings.encode_reports). Returns a
+    DeviceResult per device, in the order of `device_ids`; one device
+    failing doesn't stop the others.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    # Encoded once, every worker sends the same bytes
+    reports = encode_reports(state, REPORT_GROUPS, config_path)
+
+    def apply(device_id):
+        start = time.monotonic()
+        try:
+            transport = connect(device_id)
+            try:
+                transport.send_reports(reports, timeout)
+            finally:
+                transport.close()
+        except Exception as e:
+            return DeviceResult(device_id, e, time.monotonic() - start)
+        return DeviceResult(device_id, None, time.monotonic() - start)
+
+    if not device_ids:
+        return []
+    with ThreadPoolExecutor(max_workers=len(device_ids)) as pool:
+        return list(pool.map(apply, device_ids))
@@ -0,0 +1,15 @@
+"""
+Base of the package's exceptions
+
+Every module keeps its own exception class (TransportError, ProfileError,
+...), derived from R1Error, so the command line can report any of them
+without importing the modules that define them.
+"""
+
+
+class R1Error(Exception):
+    """Base of the errors reported as "ERROR: ..." rather than a traceback"""
+
+
+class UsageError(R1Error):
+    """Raised for command line arguments or settings that can't be used"""
@@ -0,0 +1,552 @@
+"""
+Running driver commands from the GLib main loop
+
+DriverSession keeps one `attack-shark-r1-driver -session` process open,
+CommandExecutor serializes every command sent to the mouse through it, a
+one-shot driver run or a direct transport. Needs PyGObject (Gio/GLib).
+"""
+
+import queue
+import threading
+import time
+
+from gi.repository import GLib, Gio
+
+from .devices import apply_to_all
+from .settings import driver_args, report_args
+from .trace import Tracer, make_record, parse_trace_line, split_trace
+from .transport import DRIVER, TRANSPORTS, ReportTransport, open_transport
+
+
+# Seconds a closing session gets to release the mouse before it is killed
+CLOSE_TIMEOUT = 2
+
+
+class DriverError(Exception):
+    """Raised when the driver exits with an error or rejects a command"""
+
+
+class SessionError(DriverError):
+    """Raised when the driver session fails or rejects a command"""
+
+
+class SessionStartError(SessionError):
+    """Raised when the driver session could not be started"""
+
+
+class CommandCancelled(Exception):
+    """Raised for a command cancelled from the UI"""
+
+
+class CommandTimeout(CommandCancelled):
+    """Raised for a command that did not finish within its timeout"""
+
+
+class QueueFull(Exception):
+    """Raised when too many commands are waiting to run"""
+
+
+def spawn_driver(args, flags):
+    """Start the driver as a Gio.Subprocess, raising FileNotFoundError if it is missing"""
+    try:
+        return Gio.Subprocess.new([DRIVER] + args, flags)
+    except GLib.Error as e:
+        if e.matches(GLib.spawn_error_quark(), GLib.SpawnError.NOENT):
+            raise FileNotFoundError(DRIVER) from e
+        raise DriverError(e.message) from e
+
+
+class DriverSession:
+    """Long-lived `attack-shark-r1-driver -session` process holding the mouse open
+
+    The driver claims the interface once and then reads one command per line
+    from stdin, answering each with "ok", "ok <charge>" or "error <message>".
+    All I/O is asynchronous and completes on the GLib main loop.
+
+    With `trace` set the session is started with -trace; the traces printed
+    before "ready" and before each reply are collected for take_traces().
+    """
+
+    def __init__(self):
+        self.process = None
+        self.stdout = None
+        self.config_path = None
+        self.device = None
+        self.trace = False
+        self.traces = []
+        self.exiting = None         # closed process that may still hold the mouse
+        self.on_exited = []
+
+    def take_traces(self):
+        """Return and clear the traces received since the last call"""
+        traces, self.traces = self.traces, []
+        return traces
+
+    def _start(self, config_path, device, cancellable, on_done):
+        """Spawn the driver in session mode and wait until it has opened the mouse"""
+        args = ['-session']
+        if config_path:
+            args.append(f'-config-path={config_path}')
+        if device:
+            args.append(f'-device={device}')
+        if self.trace:
+            args.append('-trace')
+
+        self.process = spawn_driver(
+            args,
+            Gio.SubprocessFlags.STDIN_PIPE | Gio.SubprocessFlags.STDOUT_PIPE | Gio.SubprocessFlags.STDERR_MERGE
+        )
+        self.stdout = Gio.DataInputStream.new(self.process.get_stdout_pipe())
+        self.config_path = config_path
+        self.device = device
+
+        # The driver may print config warnings before it is ready
+        output = []
+
+        def on_line(stream, result):
+            try:
+                line, _ = stream.read_line_finish_utf8(result)
+            except GLib.Error as e:
+                self.kill()
+                on_done(SessionStartError(e.message))
+                return
+            if line is None:
+                self.kill()
+                on_done(SessionStartError('\n'.join(output) or "Driver session exited"))
+            elif line.strip() == 'ready':
+                on_done(None)
+            elif (trace := parse_trace_line(line)) is not None:
+                self.traces.append(trace)
+                stream.read_line_async(GLib.PRIORITY_DEFAULT, cancellable, on_line)
+            else:
+                output.append(line.strip())
+                stream.read_line_async(GLib.PRIORITY_DEFAULT, cancellable, on_line)
+
+        self.stdout.read_line_async(GLib.PRIORITY_DEFAULT, cancellable, on_line)
+
+    def _send(self, args, cancellable, on_done):
+        """Write one command line and wait for its reply"""
+        try:
+            self.process.get_stdin_pipe().write_all((' '.join(args) + '\n').encode(), cancellable)
+        except GLib.Error as e:
+            self.kill()
+            on_done(None, SessionError(e.message))
+            return
+
+        def on_reply(stream, result):
+            try:
+                line, _ = stream.read_line_finish_utf8(result)
+            except GLib.Error as e:
+                self.kill()
+                on_done(None, SessionError(e.message))
+                return
+            if line is None:
+                self.kill()
+                on_done(None, SessionError("Driver session exited unexpectedly"))
+                return
+            if (trace := parse_trace_line(line)) is not None:
+                self.traces.append(trace)
+                stream.read_line_async(GLib.PRIORITY_DEFAULT, cancellable, on_reply)
+                return
+
+            status, _, message = line.strip().partition(' ')
+            if status != 'ok':
+                on_done(None, SessionError(message))
+            else:
+                on_done(message, None)
+
+        self.stdout.read_line_async(GLib.PRIORITY_DEFAULT, cancellable, on_reply)
+
+    def request(self, args, config_path, cancellable, on_done, device=None):
+        """Send one command to the session, starting it if needed
+
+        on_done(reply, error) is called on the main loop. A session holds one
+        mouse, so it is restarted when `device` changes.
+        """
+        if self.process is not None and (config_path, device) != (self.config_path, self.device):
+            self.close()
+
+        if self.process is not None:
+            self._send(args, cancellable, on_done)
+            return
+
+        def on_started(error):
+            if error is not None:
+                on_done(None, error)
+            else:
+                self._send(args, cancellable, on_done)
+
+        def start():
+            try:
+                self._start(config_path, device, cancellable, on_started)
+            except Exception as e:
+                on_done(None, e)
+
+        # The previous session may still hold the interface
+        self.when_closed(start)
+
+    def kill(self):
+        """Terminate the session immediately, e.g. when a command hangs
+
+        Like after close(), a new session waits until this one has exited.
+        """
+        process, self.process = self.process, None
+        if process is not None:
+            process.force_exit()
+            self._track_exit(process)
+
+    def close(self):
+        """Ask the driver to release the mouse and exit
+
+        The exit is awaited in the background; see when_closed(). A driver
+        that doesn't exit within CLOSE_TIMEOUT seconds is killed.
+        """
+        process, self.process = self.process, None
+        if process is None:
+            return
+        try:
+            process.get_stdin_pipe().write_all(b'quit\n', None)
+            process.get_stdin_pipe().close(None)
+        except GLib.Error:
+            process.force_exit()
+        timeout_source = GLib.timeout_add_seconds(CLOSE_TIMEOUT, lambda: process.force_exit() or GLib.SOURCE_REMOVE)
+        self._track_exit(process, timeout_source)
+
+    def _track_exit(self, process, timeout_source=None):
+        # The driver holds the interface until it has exited
+        self.exiting = process
+
+        def on_exit(process, result):
+            if timeout_source is not None:
+                GLib.source_remove(timeout_source)
+            try:
+                process.wait_finish(result)
+            except GLib.Error:
+                pass
+            if self.exiting is process:
+                self.exiting = None
+                on_exited, self.on_exited = self.on_exited, []
+                for callback in on_exited:
+                    callback()
+
+        process.wait_async(None, on_exit)
+
+    def when_closed(self, callback):
+        """Call callback() once a closed session has exited, right away if none is exiting"""
+        if self.exiting is None:
+            callback()
+        else:
+            self.on_exited.append(callback)
+
+
+class Command:
+    """An operation queued on the CommandExecutor
+
+    `prepare` is called right before the command runs and returns the
+    operation, ('apply', state, groups, reapply), ('send', state, reports)
+    for already encoded reports, ('query',), ('apply-all', state, device_ids)
+    to configure several mice at once, or None if there is nothing left to
+    do. Commands sharing a `key` are coalesced: a
+    newer one replaces a pending older one.
+    """
+
+    def __init__(self, prepare, on_done, key=None, timeout=10):
+        self.prepare = prepare
+        self.on_done = on_done
+        self.key = key
+        self.timeout = timeout
+        self.cancellable = None
+        self.process = None
+        self.direct = False
+        self.timeout_source = None
+        # Timing of the run, see CommandExecutor.trace
+        self.operation = None
+        self.submitted = None
+        self.started = None
+        self.mode = None
+        self.traces = []
+
+
+def operation_args(operation, deadline_ms, trace=False):
+    """Translate an executor operation into driver flags
+
+    The driver gives up on unacknowledged reports once `deadline_ms` has
+    passed, so it reports an unreachable mouse instead of hanging.
+    """
+    if operation[0] == 'query':
+        args = ['-query-charge']
+    elif operation[0] == 'send':
+        args = report_args(operation[2])
+    else:
+        _, state, groups, reapply = operation
+        args = driver_args(state, groups, reapply=reapply)
+    args.append(f'-deadline-ms={deadline_ms}')
+    if trace:
+        args.append('-trace')
+    return args
+
+
+class CommandExecutor:
+    """Runs mouse commands one at a time from the GLib main loop
+
+    Only one command talks to the mouse at any time, so concurrent clicks
+    never fight over the USB interface. Waiting commands are kept in a
+    bounded queue; for a coalescing key only the latest command is kept.
+
+    Commands go to the driver binary by default. When `transport` names a
+    direct transport (see attack_shark_r1.transport) they run on a single
+    worker thread that keeps that transport open between commands. They
+    reach the R1 whose id is `device` (see attack_shark_r1.devices), or the
+    first one found. 'apply-all' commands always run on the worker thread,
+    which hands every device its own thread and transport; the output
+    passed to on_done is the list of DeviceResults.
+
+    on_trace(key, record) is called right before every command's on_done
+    with its elapsed time and error; with `trace` set the record also has
+    the command's phases (see attack_shark_r1.trace).
+    """
+
+    def __init__(self, session, max_pending=8):
+        self.session = session
+        self.max_pending = max_pending
+        self.use_session = True
+        self.config_path = None
+        self.transport = 'driver'
+        self.device = None
+        self.pending = []
+        self.current = None
+        self.on_busy_changed = None
+        self.trace = False
+        self.on_trace = None
+
+        # Only touched from the worker thread
+        self.jobs = None
+        self.direct = None
+        self.direct_key = None
+
+    def submit(self, command):
+        """Queue a command, replacing a stale pending one with the same key"""
+        command.submitted = time.monotonic()
+        if command.key is not None:
+            self.pending = [c for c in self.pending if c.key != command.key]
+        if len(self.pending) >= self.max_pending:
+            command.on_done(None, QueueFull("Too many commands waiting for the driver"))
+            return
+        self.pending.append(command)
+        self._run_next()
+
+    def busy(self):
+        return self.current is not None or bool(self.pending)
+
+    def cancel(self):
+        """Drop waiting commands and abort the running one"""
+        pending, self.pending = self.pending, []
+        for command in pending:
+            command.on_done(None, CommandCancelled("Cancelled"))
+        if self.current is not None:
+            self._abort(self.current, CommandCancelled("Cancelled"))
+
+    def _notify_busy(self):
+        if self.on_busy_changed is not None:
+            self.on_busy_changed(self.busy())
+
+    def _run_next(self):
+        while self.current is None and self.pending:
+            command = self.pending.pop(0)
+            try:
+                operation = command.prepare()
+            except Exception as e:
+                command.on_done(None, e)
+                continue
+            if operation is None:
+                command.on_done(None, None)
+                continue
+
+            self.current = command
+            command.started = time.monotonic()
+            command.operation = operation[0]
+            command.cancellable = Gio.Cancellable()
+            command.timeout_source = GLib.timeout_add_seconds(command.timeout, self._on_timeout, command)
+            # Leave the driver time to report why it gave up before our own timeout
+            deadline_ms = max(100, command.timeout * 1000 - 500)
+            try:
+                if operation[0] == 'apply-all':
+                    self._run_all(command, operation, deadline_ms / 1000)
+                elif self.transport != 'driver':
+                    self._run_direct(command, operation, deadline_ms / 1000)
+                elif self.use_session:
+                    self._run_in_session(command, operation_args(operation, deadline_ms, self.trace))
+                else:
+                    self._run_oneshot(command, operation_args(operation, deadline_ms, self.trace))
+            except Exception as e:
+                self._finish(command, None, e)
+        self._notify_busy()
+
+    def _run_direct(self, command, operation, timeout):
+        command.direct = True
+        command.mode = 'direct'
+        key = (self.transport, self.device)
+        tracer = Tracer() if self.trace else None
+
+        def work():
+            try:
+                if self.direct is None or self.direct_key != key:
+                    self._close_direct()
+                    if tracer is not None:
+                        with tracer.span('open'):
+                            self.direct = self._open(*key)
+                    else:
+                        self.direct = self._open(*key)
+                    self.direct_key = key
+                self.direct.tracer = tracer
+                if operation[0] == 'query':
+                    output = str(self.direct.query_charge(timeout))
+                elif operation[0] == 'send':
+                    self.direct.send_reports(operation[2], timeout)
+                    output = ''
+                else:
+                    _, state, groups, reapply = operation
+                    self.direct.apply(state, groups, reapply=reapply, timeout=timeout)
+                    output = ''
+                error = None
+            except Exception as e:
+                # The device may be gone, reopen it next time
+                self._close_direct()
+                output, error = None, e
+            if tracer is not None:
+                command.traces.append(tracer.trace())
+            GLib.idle_add(self._finish, command, output, error)
+
+        # A session closed for the switch may still hold the interface
+        self.session.when_closed(lambda: self._submit_work(work))
+
+    def _open(self, name, device):
+        kwargs = {}
+        # The config file also gives the values of disabled DPI slots
+        if self.config_path and (name == 'driver' or issubclass(TRANSPORTS[name], ReportTransport)):
+            kwargs['config_path'] = self.config_path
+        if device:
+            kwargs['device'] = device
+        return open_transport(name, **kwargs)
+
+    def _run_all(self, command, operation, timeout):
+        command.direct = True
+        command.mode = 'all'
+        _, state, device_ids = operation
+        name = self.transport
+        # Every device gets its own transport; the session's claim would be in the way
+        self.session.close()
+
+        def work():
+            self._close_direct()
+            results = apply_to_all(device_ids, lambda device: self._open(name, device), state, timeout,
+                                   self.config_path)
+            GLib.idle_add(self._finish, command, results, None)
+
+        self.session.when_closed(lambda: self._submit_work(work))
+
+    def _submit_work(self, work):
+        if self.jobs is None:
+            self.jobs = queue.Queue()
+            threading.Thread(target=self._worker, daemon=True).start()
+        self.jobs.put(work)
+
+    def _worker(self):
+        while True:
+            self.jobs.get()()
+
+    def _close_direct(self):
+        if self.direct is not None:
+            try:
+                self.direct.close()
+            except Exception:
+                pass
+        self.direct = None
+
+    def close(self):
+        """Release a direct transport's device"""
+        if self.jobs is not None:
+            self.jobs.put(self._close_direct)
+
+    def _run_in_session(self, command, args):
+        command.mode = 'session'
+        self.session.trace = self.trace
+
+        def on_reply(reply, error):
+            command.traces.extend(self.session.take_traces())
+            # A driver without -session support, or one that could not open the
+            # mouse, still gets a one-shot attempt with its own error reporting
+            if isinstance(error, SessionStartError) and command is self.current:
+                try:
+                    self._run_oneshot(command, args)
+                except Exception as e:
+                    self._finish(command, None, e)
+                return
+            self._finish(command, reply, error)
+
+        self.session.request(args, self.config_path, command.cancellable, on_reply, self.device)
+
+    def _run_oneshot(self, command, args):
+        command.mode = 'oneshot'
+        if self.device:
+            args = [f'-device={self.device}'] + args
+        if self.config_path:
+            args = [f'-config-path={self.config_path}'] + args
+        self.session.when_closed(lambda: self._spawn_oneshot(command, args))
+
+    def _spawn_oneshot(self, command, args):
+        # Cancelled or timed out while the session was exiting
+        if command is not self.current:
+            return
+        try:
+            command.process = spawn_driver(args, Gio.SubprocessFlags.STDOUT_PIPE | Gio.SubprocessFlags.STDERR_PIPE)
+        except Exception as e:
+            self._finish(command, None, e)
+            return
+
+        def on_exit(process, result):
+            try:
+                _, stdout, stderr = process.communicate_utf8_finish(result)
+            except GLib.Error as e:
+                self._finish(command, None, DriverError(e.message))
+                return
+            stdout, traces = split_trace(stdout or '')
+            command.traces.extend(traces)
+            if process.get_successful():
+                self._finish(command, (stdout or '').strip(), None)
+            else:
+                message = (stderr or stdout or '').strip()
+                self._finish(command, None, DriverError(message.removeprefix("ERROR: ")))
+
+        command.process.communicate_utf8_async(None, command.cancellable, on_exit)
+
+    def _on_timeout(self, command):
+        command.timeout_source = None
+        if command is self.current:
+            self._abort(command, CommandTimeout(f"Driver did not answer within {command.timeout} s"))
+        return GLib.SOURCE_REMOVE
+
+    def _abort(self, command, error):
+        command.cancellable.cancel()
+        if command.process is not None:
+            command.process.force_exit()
+        elif not command.direct:
+            # The session is stuck mid-command and can't be reused
+            self.session.kill()
+        self._finish(command, None, error)
+
+    def _finish(self, command, output, error):
+        # Late completions of aborted commands are ignored
+        if command is not self.current:
+            return False
+        self.current = None
+        if command.timeout_source is not None:
+            GLib.source_remove(command.timeout_source)
+            command.timeout_source = None
+        if self.on_trace is not None:
+            record = make_record(command.operation, command.mode, command.traces,
+                                 command.started - command.submitted, time.monotonic() - command.started, error)
+            self.on_trace(command.key, record)
+        command.on_done(output, error)
+        self._run_next()
+        return False
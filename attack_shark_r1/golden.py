@@ -0,0 +1,41 @@
+"""
+Golden report vectors for attack_shark_r1.protocol
+
+Each entry is an encoder name, its arguments and the bytes set_dpis,
+set_times or set_polling_rate in main.odin send for the same settings.
+"""
+
+from . import protocol
+
+GOLDEN_VECTORS = [
+    ('encode_dpi_report', ([800, 1600, 3200, 4000, 5000, 12000], 3, False, False),
+     "04380100003f000012254b5e758d0000000000000001000003ff000000ff000000"
+     "ffffff0000ffffff00ffff4000ffffff020f5a00000000"),
+    ('encode_dpi_report', ([800, 800, 800, 800, 800, 800], 1, False, False),
+     "04380100003f00001212121212120000000000000000000001ff000000ff000000"
+     "ffffff0000ffffff00ffff4000ffffff020de100000000"),
+    ('encode_dpi_report', ([100, 10100, 12100, 18000, 400, 10000], 6, True, True),
+     "04380101013f0c0c02768ed309eb0000000100000000000006ff000000ff000000"
+     "ffffff0000ffffff00ffff4000ffffff02106200000000"),
+    ('encode_dpi_report', ([18000, 18000, 18000, 18000, 18000, 18000], 2, True, False),
+     "04380100013f3f3fd3d3d3d3d3d30000000000000000000002ff000000ff000000"
+     "ffffff0000ffffff00ffff4000ffffff0212e700000000"),
+    ('encode_times_report', (6, 12, 4), "050f010003c80000ff0c0201d80000"),
+    ('encode_times_report', (0.5, 1, 50), "050f010003180000ff011901340000"),
+    ('encode_times_report', (30, 60, 4), "050f010033c80000ff3c0201380000"),
+    ('encode_times_report', (2.3, 37, 8), "050f010023580000ff040401820000"),
+    ('encode_polling_report', (125,), "06090108f700000000"),
+    ('encode_polling_report', (250,), "06090104fb00000000"),
+    ('encode_polling_report', (500,), "06090102fd00000000"),
+    ('encode_polling_report', (1000,), "06090101fe00000000"),
+]
+
+
+def check():
+    """Encode every golden vector and return a description of each mismatch"""
+    mismatches = []
+    for name, args, expected in GOLDEN_VECTORS:
+        actual = getattr(protocol, name)(*args).hex()
+        if actual != expected:
+            mismatches.append(f"{name}{args}: expected {expected}, got {actual}")
+    return mismatches
@@ -0,0 +1,1800 @@
+"""
+Attack Shark R1 Driver GUI - GTK4 Version (Complete)
+"""
+
+import gi
+gi.require_version('Gtk', '4.0')
+from gi.repository import Gtk, GLib, Gio
+
+import os
+import threading
+
+from . import macros, pollrate, service, telemetry
+from .battery import BatteryHistory, next_poll_interval
+from .config import ConfigStore, default_config_path, legacy_json_path, migrate_legacy_json
+from .devices import describe, list_devices, state_key
+from .executor import Command, CommandCancelled, CommandExecutor, CommandTimeout, DriverError, DriverSession, QueueFull
+from .profiles import ProfileError, ProfileStore
+from .settings import AppliedState, AppliedStateCache, REPORT_GROUPS, changed_report_groups
+from .trace import TraceLog, log_record, summarize
+from .transport import TransportError
+from .validation import validate, validate_dpi, validate_field
+
+
+class AttackSharkWindow(Gtk.ApplicationWindow):
+    def __init__(self, app):
+        super().__init__(application=app)
+
+        # Load config file path; the driver reads the same file
+        self.config_path = default_config_path()
+        self.config_store = ConfigStore()
+        migrate_legacy_json(self.config_store, legacy_json_path(), self.config_path)
+
+        # Create variables
+        self.create_variables()
+
+        # Driver process kept open between applies and queries, and the queue
+        # that serializes every command sent through it
+        self.session = DriverSession()
+        self.executor = CommandExecutor(self.session)
+        self.executor.on_busy_changed = self.on_executor_busy_changed
+        self.executor.on_trace = self.on_command_traced
+
+        # Phase timings of traced commands, kept until their on_done picks them up
+        self.trace_log = TraceLog()
+        self.traces = {}
+
+        # What the mouse currently holds, so applies only send what changed
+        self.applied_states = AppliedStateCache()
+
+        # Mouse commands go to, None for the first R1 found
+        self.device_id = None
+        self.device_ids = [None]
+
+        # Charge readings from manual and background queries
+        self.battery_history = BatteryHistory()
+
+        # Named settings sets, shared with `python3 -m attack_shark_r1 profile`
+        self.profiles = ProfileStore()
+
+        # Build UI
+        self.build_ui()
+
+        # Set window properties
+        self.set_default_size(700, 850)
+        self.set_title("Attack Shark R1 Driver")
+
+        # Release the mouse when the window goes away
+        self.connect("close-request", self.on_close_request)
+
+        # Try to load existing config
+        self.load_config()
+
+        # Show the last known charge right away, then keep it up to date
+        self.update_battery_label()
+        if self.battery_monitor:
+            self.schedule_battery_query(5)
+
+        # Follow what other clients of the session service send
+        self.session_bus = None
+        Gio.bus_get(Gio.BusType.SESSION, None, self.on_session_bus)
+
+    def create_variables(self):
+        """Create variables for settings"""
+        self.active_dpi = 1
+        self.angle_snap = False
+        self.deep_sleep_time = 5
+        self.dpi_values = {i: 800 if i == 1 else 0 for i in range(1, 7)}
+        self.key_response_time = 8
+        self.polling_rate = 1000
+        self.ripple_control = False
+        self.sleep_time = 2.0
+        self.reapply_config = False
+        self.use_session = True
+        self.transport = 'driver'
+        self.live_apply = False
+        self.live_apply_delay = 300
+        self.live_apply_source = None
+        self.updating_ui = False
+        self.command_timeout = 10
+        self.field_problems = {}
+        self.battery_monitor = True
+        self.battery_source = None
+        self.battery_interval = None
+        self.trace_applies = False
+        self.deferred_sections = []
+        self.built_sections = set()
+        self.motion_ring = None
+        self.motion_reader = None
+        self.telemetry_tick = None
+        self.telemetry_drawn = 0
+        self.telemetry_seconds = 2
+        self.macros = {}
+        self.macro_playing = False
+
+    def build_ui(self):
+        """Build the GTK4 UI"""
+        # Main vertical box
+        main_box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=10)
+        self.set_child(main_box)
+
+        # Header bar
+        header_bar = Gtk.HeaderBar()
+        main_box.append(header_bar)
+
+        # Title
+        title = Gtk.Label(label="Attack Shark R1 Driver")
+        title.get_style_context().add_class("title")
+        header_bar.set_title_widget(title)
+
+        # Create scrolled window
+        scrolled = Gtk.ScrolledWindow()
+        scrolled.set_vexpand(True)
+        main_box.append(scrolled)
+
+        # Main content box
+        content_box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=10)
+        content_box.set_margin_top(10)
+        content_box.set_margin_bottom(10)
+        content_box.set_margin_start(10)
+        content_box.set_margin_end(10)
+        scrolled.set_child(content_box)
+
+        # Format info section
+        self.defer_section(content_box, 'format_info', self.create_format_info_section)
+
+        # Configuration section
+        self.create_config_section(content_box)
+
+        # Profiles section
+        self.defer_section(content_box, 'profiles', self.create_profile_section)
+
+        # Polling Rate section
+        self.create_polling_rate_section(content_box)
+
+        # DPI section
+        self.create_dpi_section(content_box)
+
+        # Performance section
+        self.defer_section(content_box, 'performance', self.create_performance_section)
+
+        # Power section
+        self.defer_section(content_box, 'power', self.create_power_section)
+
+        # Macros section
+        self.defer_section(content_box, 'macros', self.create_macro_section)
+
+        # Motion telemetry section
+        self.defer_section(content_box, 'telemetry', self.create_telemetry_section)
+
+        # Buttons section
+        self.create_button_section(content_box)
+
+        # Status bar
+        self.create_status_bar(main_box)
+
+        # The rest is built one section per main loop iteration after the first frame
+        GLib.idle_add(self.build_deferred_section)
+
+    def defer_section(self, parent, name, create):
+        """Reserve a section's place in `parent` and build it once the window is up"""
+        placeholder = Gtk.Box(orientation=Gtk.Orientation.VERTICAL)
+        parent.append(placeholder)
+        self.deferred_sections.append((name, placeholder, create))
+
+    def build_deferred_section(self):
+        """Build the next deferred section from its current settings"""
+        name, placeholder, create = self.deferred_sections.pop(0)
+        self.updating_ui = True
+        try:
+            create(placeholder)
+        finally:
+            self.updating_ui = False
+        self.built_sections.add(name)
+        return bool(self.deferred_sections)
+
+    def create_format_info_section(self, parent):
+        """Create format information section"""
+        frame = Gtk.Frame()
+        frame.set_margin_top(5)
+        frame.set_margin_bottom(5)
+
+        box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=5)
+        box.set_margin_top(10)
+        box.set_margin_bottom(10)
+        box.set_margin_start(10)
+        box.set_margin_end(10)
+        frame.set_child(box)
+
+        label = Gtk.Label(label="<b>Argument Format</b>")
+        label.set_use_markup(True)
+        label.set_halign(Gtk.Align.START)
+        box.append(label)
+
+        info_text = "Based on error messages, the correct format is:\n• Regular flags: -flag=value  (e.g., -polling-rate=500)\n• DPI flag (map type): -dpi:key=value  (e.g., -dpi:1=800)\n• Standalone flags: -flag  (e.g., -query-charge, -reapply-config)"
+
+        info_label = Gtk.Label(label=info_text)
+        info_label.set_wrap(True)
+        info_label.set_halign(Gtk.Align.START)
+        info_label.set_margin_top(5)
+        box.append(info_label)
+
+        parent.append(frame)
+
+    def create_config_section(self, parent):
+        """Create config file section"""
+        frame = Gtk.Frame()
+        frame.set_margin_top(5)
+        frame.set_margin_bottom(5)
+
+        box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=10)
+        box.set_margin_top(10)
+        box.set_margin_bottom(10)
+        box.set_margin_start(10)
+        box.set_margin_end(10)
+        frame.set_child(box)
+
+        label = Gtk.Label(label="<b>Configuration</b>")
+        label.set_use_markup(True)
+        label.set_halign(Gtk.Align.START)
+        box.append(label)
+
+        # Config path
+        config_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=10)
+        config_label = Gtk.Label(label="Config Path:")
+        config_label.set_halign(Gtk.Align.START)
+        config_box.append(config_label)
+
+        self.config_entry = Gtk.Entry()
+        self.config_entry.set_text(self.config_path)
+        self.config_entry.set_hexpand(True)
+        config_box.append(self.config_entry)
+
+        browse_button = Gtk.Button(label="Browse")
+        browse_button.connect("clicked", self.on_browse_config)
+        config_box.append(browse_button)
+
+        box.append(config_box)
+
+        # Reapply config
+        reapply_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=10)
+        reapply_label = Gtk.Label(label="Reapply entire config on save:")
+        reapply_label.set_halign(Gtk.Align.START)
+        reapply_box.append(reapply_label)
+
+        self.reapply_switch = Gtk.Switch()
+        self.reapply_switch.set_active(self.reapply_config)
+        self.reapply_switch.connect("state-set", self.on_reapply_changed)
+        reapply_box.append(self.reapply_switch)
+
+        box.append(reapply_box)
+
+        # Persistent session
+        session_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=10)
+        session_label = Gtk.Label(label="Keep driver session open:")
+        session_label.set_halign(Gtk.Align.START)
+        session_box.append(session_label)
+
+        self.session_switch = Gtk.Switch()
+        self.session_switch.set_active(self.use_session)
+        self.session_switch.connect("state-set", self.on_session_changed)
+        session_box.append(self.session_switch)
+
+        box.append(session_box)
+
+        # Transport
+        transport_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=10)
+        transport_label = Gtk.Label(label="Send settings through:")
+        transport_label.set_halign(Gtk.Align.START)
+        transport_box.append(transport_label)
+
+        self.transport_names = ['driver', 'hidraw', 'libusb', 'sim', 'service']
+        self.transport_combo = Gtk.DropDown.new_from_strings(
+            ["Driver", "Direct (hidraw)", "Direct (libusb)", "Simulated mouse", "Session service"])
+        self.transport_combo.set_selected(self.transport_names.index(self.transport))
+        self.transport_combo.connect("notify::selected", self.on_transport_changed)
+        transport_box.append(self.transport_combo)
+
+        box.append(transport_box)
+
+        # Device
+        device_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=10)
+        device_label = Gtk.Label(label="Device:")
+        device_label.set_halign(Gtk.Align.START)
+        device_box.append(device_label)
+
+        self.device_names = Gtk.StringList()
+        self.device_combo = Gtk.DropDown(model=self.device_names)
+        self.device_combo.set_hexpand(True)
+        self.device_combo.connect("notify::selected", self.on_device_changed)
+        device_box.append(self.device_combo)
+
+        refresh_button = Gtk.Button(label="Refresh")
+        refresh_button.connect("clicked", lambda button: self.refresh_devices())
+        device_box.append(refresh_button)
+
+        box.append(device_box)
+        self.refresh_devices()
+
+        # Live apply
+        live_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=10)
+        live_label = Gtk.Label(label="Apply changes live:")
+        live_label.set_halign(Gtk.Align.START)
+        live_box.append(live_label)
+
+        self.live_switch = Gtk.Switch()
+        self.live_switch.set_active(self.live_apply)
+        self.live_switch.connect("state-set", self.on_live_apply_changed)
+        live_box.append(self.live_switch)
+
+        delay_label = Gtk.Label(label="Debounce:")
+        live_box.append(delay_label)
+
+        self.live_delay_spin = Gtk.SpinButton.new_with_range(50, 5000, 50)
+        self.live_delay_spin.set_value(self.live_apply_delay)
+        self.live_delay_spin.connect("value-changed", self.on_live_apply_delay_changed)
+        live_box.append(self.live_delay_spin)
+
+        unit_label = Gtk.Label(label="ms")
+        live_box.append(unit_label)
+
+        box.append(live_box)
+
+        # Background battery monitor
+        battery_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=10)
+        battery_label = Gtk.Label(label="Monitor battery in background:")
+        battery_label.set_halign(Gtk.Align.START)
+        battery_box.append(battery_label)
+
+        self.battery_switch = Gtk.Switch()
+        self.battery_switch.set_active(self.battery_monitor)
+        self.battery_switch.connect("state-set", self.on_battery_monitor_changed)
+        battery_box.append(self.battery_switch)
+
+        box.append(battery_box)
+
+        # Apply tracing
+        trace_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=10)
+        trace_label = Gtk.Label(label="Trace apply timings:")
+        trace_label.set_halign(Gtk.Align.START)
+        trace_box.append(trace_label)
+
+        self.trace_switch = Gtk.Switch()
+        self.trace_switch.set_active(self.trace_applies)
+        self.trace_switch.set_tooltip_text(f"Show where apply time goes and log it to {self.trace_log.path}")
+        self.trace_switch.connect("state-set", self.on_trace_changed)
+        trace_box.append(self.trace_switch)
+
+        box.append(trace_box)
+
+        # Query charge button
+        query_button = Gtk.Button(label="Query Battery Charge")
+        query_button.connect("clicked", self.on_query_charge)
+        query_button.set_halign(Gtk.Align.CENTER)
+        query_button.set_margin_top(10)
+        box.append(query_button)
+
+        parent.append(frame)
+
+    def create_profile_section(self, parent):
+        """Create profiles section"""
+        frame = Gtk.Frame()
+        frame.set_margin_top(5)
+        frame.set_margin_bottom(5)
+
+        box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=10)
+        box.set_margin_top(10)
+        box.set_margin_bottom(10)
+        box.set_margin_start(10)
+        box.set_margin_end(10)
+        frame.set_child(box)
+
+        label = Gtk.Label(label="<b>Profiles</b>")
+        label.set_use_markup(True)
+        label.set_halign(Gtk.Align.START)
+        box.append(label)
+
+        # Saved profiles
+        switch_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=10)
+        switch_label = Gtk.Label(label="Profile:")
+        switch_label.set_halign(Gtk.Align.START)
+        switch_box.append(switch_label)
+
+        self.profile_names = Gtk.StringList()
+        self.profile_combo = Gtk.DropDown(model=self.profile_names)
+        self.profile_combo.set_hexpand(True)
+        switch_box.append(self.profile_combo)
+
+        switch_button = Gtk.Button(label="Switch")
+        switch_button.connect("clicked", self.on_switch_profile)
+        switch_box.append(switch_button)
+
+        delete_button = Gtk.Button(label="Delete")
+        delete_button.connect("clicked", self.on_delete_profile)
+        switch_box.append(delete_button)
+
+        box.append(switch_box)
+
+        # Save current settings as a profile
+        save_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=10)
+        save_label = Gtk.Label(label="Save current settings as:")
+        save_label.set_halign(Gtk.Align.START)
+        save_box.append(save_label)
+
+        self.profile_entry = Gtk.Entry()
+        self.profile_entry.set_placeholder_text("e.g. FPS")
+        self.profile_entry.set_hexpand(True)
+        save_box.append(self.profile_entry)
+
+        save_button = Gtk.Button(label="Save Profile")
+        save_button.connect("clicked", self.on_save_profile)
+        save_box.append(save_button)
+
+        box.append(save_box)
+
+        self.refresh_profiles()
+
+        parent.append(frame)
+
+    def create_polling_rate_section(self, parent):
+        """Create polling rate section"""
+        frame = Gtk.Frame()
+        frame.set_margin_top(5)
+        frame.set_margin_bottom(5)
+
+        box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=5)
+        box.set_margin_top(10)
+        box.set_margin_bottom(10)
+        box.set_margin_start(10)
+        box.set_margin_end(10)
+        frame.set_child(box)
+
+        label = Gtk.Label(label="<b>Polling Rate (Hz)</b>")
+        label.set_use_markup(True)
+        label.set_halign(Gtk.Align.START)
+        box.append(label)
+
+        rates = [125, 250, 500, 1000]
+        self.polling_buttons = {}
+
+        for rate in rates:
+            rate_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=10)
+            rate_label = Gtk.Label(label=f"{rate} Hz")
+            rate_label.set_halign(Gtk.Align.START)
+            rate_box.append(rate_label)
+
+            radio = Gtk.CheckButton()
+            if not self.polling_buttons:
+                radio.set_active(rate == self.polling_rate)
+            else:
+                radio.set_group(self.polling_buttons[rates[0]])
+                radio.set_active(rate == self.polling_rate)
+            radio.connect("toggled", self.on_polling_rate_changed, rate)
+            self.polling_buttons[rate] = radio
+            rate_box.append(radio)
+
+            box.append(rate_box)
+
+        # Measured rate, from the mouse's input events
+        verify_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=10)
+        self.verify_rate_button = Gtk.Button(label="Verify")
+        self.verify_rate_button.set_tooltip_text("Measure the rate the mouse delivers while you move it")
+        self.verify_rate_button.connect("clicked", self.on_verify_polling_rate)
+        verify_box.append(self.verify_rate_button)
+
+        self.measured_rate_label = Gtk.Label(label="Not measured")
+        self.measured_rate_label.set_halign(Gtk.Align.START)
+        verify_box.append(self.measured_rate_label)
+
+        box.append(verify_box)
+
+        parent.append(frame)
+
+    def on_verify_polling_rate(self, button):
+        """Measure the delivered polling rate on a thread while the user moves the mouse"""
+        path = pollrate.find_event_device()
+        if path is None:
+            self.update_status("No Attack Shark R1 input device found")
+            return
+        expected = self.polling_rate
+        duration = 3
+
+        def work():
+            try:
+                times, overruns = pollrate.measure(path, duration)
+                result, error = pollrate.analyze(times, expected, overruns), None
+            except pollrate.PollRateError as e:
+                result, error = None, e
+            GLib.idle_add(on_done, result, error)
+
+        def on_done(result, error):
+            self.verify_rate_button.set_sensitive(True)
+            if error is not None:
+                self.measured_rate_label.set_text("Not measured")
+                self.update_status(f"Polling rate not measured: {error}")
+            else:
+                self.measured_rate_label.set_text(pollrate.summarize(result))
+                self.update_status("Polling rate measured")
+            return False
+
+        self.verify_rate_button.set_sensitive(False)
+        self.measured_rate_label.set_text(f"Move the mouse for {duration} s...")
+        threading.Thread(target=work, daemon=True).start()
+
+    def create_dpi_section(self, parent):
+        """Create DPI settings section"""
+        frame = Gtk.Frame()
+        frame.set_margin_top(5)
+        frame.set_margin_bottom(5)
+
+        box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=5)
+        box.set_margin_top(10)
+        box.set_margin_bottom(10)
+        box.set_margin_start(10)
+        box.set_margin_end(10)
+        frame.set_child(box)
+
+        label = Gtk.Label(label="<b>DPI Settings</b>")
+        label.set_use_markup(True)
+        label.set_halign(Gtk.Align.START)
+        box.append(label)
+
+        # Active DPI
+        active_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=10)
+        active_label = Gtk.Label(label="Active DPI Slot:")
+        active_label.set_halign(Gtk.Align.START)
+        active_box.append(active_label)
+
+        self.active_dpi_combo = Gtk.DropDown.new_from_strings([str(i) for i in range(1, 7)])
+        self.active_dpi_combo.set_selected(self.active_dpi - 1)
+        self.active_dpi_combo.connect("notify::selected", self.on_active_dpi_changed)
+        active_box.append(self.active_dpi_combo)
+
+        box.append(active_box)
+
+        # DPI values for each slot
+        self.dpi_entries = {}
+        self.dpi_switches = {}
+
+        for i in range(1, 7):
+            dpi_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=10)
+            dpi_label = Gtk.Label(label=f"Slot {i} DPI:")
+            dpi_label.set_halign(Gtk.Align.START)
+            dpi_box.append(dpi_label)
+
+            # Entry for DPI value
+            entry = Gtk.Entry()
+            entry.set_text(str(self.dpi_values[i]))
+            entry.set_width_chars(8)
+            entry.connect("changed", self.on_dpi_entry_changed, i)
+            self.dpi_entries[i] = entry
+            dpi_box.append(entry)
+
+            # Switch for enabled/disabled
+            switch = Gtk.Switch()
+            switch.set_active(self.dpi_values[i] > 0)
+            switch.connect("state-set", self.on_dpi_switch_changed, i)
+            self.dpi_switches[i] = switch
+            dpi_box.append(switch)
+
+            box.append(dpi_box)
+
+        parent.append(frame)
+
+    def create_performance_section(self, parent):
+        """Create performance settings section"""
+        frame = Gtk.Frame()
+        frame.set_margin_top(5)
+        frame.set_margin_bottom(5)
+
+        box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=10)
+        box.set_margin_top(10)
+        box.set_margin_bottom(10)
+        box.set_margin_start(10)
+        box.set_margin_end(10)
+        frame.set_child(box)
+
+        label = Gtk.Label(label="<b>Performance Settings</b>")
+        label.set_use_markup(True)
+        label.set_halign(Gtk.Align.START)
+        box.append(label)
+
+        # Key response time
+        response_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=10)
+        response_label = Gtk.Label(label="Key Response Time (4-50ms, even):")
+        response_label.set_halign(Gtk.Align.START)
+        response_box.append(response_label)
+
+        self.response_spin = Gtk.SpinButton.new_with_range(4, 50, 2)
+        self.response_spin.set_value(self.key_response_time)
+        self.response_spin.connect("value-changed", self.on_response_time_changed)
+        response_box.append(self.response_spin)
+
+        unit_label = Gtk.Label(label="ms")
+        response_box.append(unit_label)
+
+        box.append(response_box)
+
+        # Angle snap
+        angle_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=10)
+        angle_label = Gtk.Label(label="Angle Snap:")
+        angle_label.set_halign(Gtk.Align.START)
+        angle_box.append(angle_label)
+
+        self.angle_switch = Gtk.Switch()
+        self.angle_switch.set_active(self.angle_snap)
+        self.angle_switch.connect("state-set", self.on_angle_snap_changed)
+        angle_box.append(self.angle_switch)
+
+        box.append(angle_box)
+
+        # Ripple control
+        ripple_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=10)
+        ripple_label = Gtk.Label(label="Ripple Control:")
+        ripple_label.set_halign(Gtk.Align.START)
+        ripple_box.append(ripple_label)
+
+        self.ripple_switch = Gtk.Switch()
+        self.ripple_switch.set_active(self.ripple_control)
+        self.ripple_switch.connect("state-set", self.on_ripple_control_changed)
+        ripple_box.append(self.ripple_switch)
+
+        box.append(ripple_box)
+
+        parent.append(frame)
+
+    def create_macro_section(self, parent):
+        """Create macros section"""
+        frame = Gtk.Frame()
+        frame.set_margin_top(5)
+        frame.set_margin_bottom(5)
+
+        box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=10)
+        box.set_margin_top(10)
+        box.set_margin_bottom(10)
+        box.set_margin_start(10)
+        box.set_margin_end(10)
+        frame.set_child(box)
+
+        label = Gtk.Label(label="<b>Macros</b>")
+        label.set_use_markup(True)
+        label.set_halign(Gtk.Align.START)
+        box.append(label)
+
+        # Defined macros
+        play_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=10)
+        play_label = Gtk.Label(label="Macro:")
+        play_label.set_halign(Gtk.Align.START)
+        play_box.append(play_label)
+
+        self.macro_names = Gtk.StringList()
+        self.macro_combo = Gtk.DropDown(model=self.macro_names)
+        self.macro_combo.set_hexpand(True)
+        self.macro_combo.connect("notify::selected", self.on_macro_selected)
+        play_box.append(self.macro_combo)
+
+        self.play_macro_button = Gtk.Button(label="Play")
+        self.play_macro_button.set_tooltip_text("Type the macro through a virtual input device")
+        self.play_macro_button.connect("clicked", self.on_play_macro)
+        play_box.append(self.play_macro_button)
+
+        delete_button = Gtk.Button(label="Delete")
+        delete_button.connect("clicked", self.on_delete_macro)
+        play_box.append(delete_button)
+
+        box.append(play_box)
+
+        # Define or change a macro
+        edit_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=10)
+        self.macro_name_entry = Gtk.Entry()
+        self.macro_name_entry.set_placeholder_text("Name")
+        edit_box.append(self.macro_name_entry)
+
+        self.macro_steps_entry = Gtk.Entry()
+        self.macro_steps_entry.set_placeholder_text("e.g. KEY_LEFTCTRL down, KEY_C, 50ms, KEY_V, KEY_LEFTCTRL up")
+        self.macro_steps_entry.set_hexpand(True)
+        edit_box.append(self.macro_steps_entry)
+
+        repeat_label = Gtk.Label(label="×")
+        edit_box.append(repeat_label)
+
+        self.macro_repeat_spin = Gtk.SpinButton.new_with_range(1, 1000, 1)
+        edit_box.append(self.macro_repeat_spin)
+
+        save_button = Gtk.Button(label="Save Macro")
+        save_button.connect("clicked", self.on_save_macro)
+        edit_box.append(save_button)
+
+        box.append(edit_box)
+
+        hint = Gtk.Label(label="Macros are kept in the config file, use Save Config to keep changes.")
+        hint.set_halign(Gtk.Align.START)
+        box.append(hint)
+
+        self.refresh_macros()
+
+        parent.append(frame)
+
+    def refresh_macros(self, selected=None):
+        """List the macros of the config, selecting `selected` if given"""
+        names = sorted(self.macros)
+        self.macro_names.splice(0, self.macro_names.get_n_items(), names)
+        if selected in names:
+            self.macro_combo.set_selected(names.index(selected))
+
+    def selected_macro(self):
+        item = self.macro_combo.get_selected_item()
+        return self.macros.get(item.get_string()) if item is not None else None
+
+    def on_macro_selected(self, combo, pspec):
+        """Show the selected macro for editing"""
+        macro = self.selected_macro()
+        if macro is None:
+            return
+        self.macro_name_entry.set_text(macro.name)
+        self.macro_steps_entry.set_text(macro.steps)
+        self.macro_repeat_spin.set_value(macro.repeat)
+
+    def on_save_macro(self, button):
+        """Handle save macro button click"""
+        name = self.macro_name_entry.get_text().strip()
+        steps = self.macro_steps_entry.get_text().strip()
+        repeat = self.macro_repeat_spin.get_value_as_int()
+        if not name or ']' in name:
+            self.update_status("Not saved: give the macro a name without ]")
+            return
+        try:
+            macros.compile_macro(steps, repeat)
+        except macros.MacroError as e:
+            self.update_status(f"Not saved: {e}")
+            return
+        self.macros[name] = macros.Macro(name, steps, repeat)
+        self.refresh_macros(name)
+        self.update_status(f"Macro {name} saved, Save Config to keep it")
+
+    def on_delete_macro(self, button):
+        """Handle delete macro button click"""
+        macro = self.selected_macro()
+        if macro is None:
+            return
+        del self.macros[macro.name]
+        self.refresh_macros()
+        self.update_status(f"Macro {macro.name} deleted, Save Config to keep it")
+
+    def on_play_macro(self, button):
+        """Play the selected macro on a thread, through uinput"""
+        macro = self.selected_macro()
+        if macro is None or self.macro_playing:
+            return
+        try:
+            compiled = macros.compile_macro(macro.steps, macro.repeat)
+        except macros.MacroError as e:
+            self.update_status(f"Macro {macro.name} not played: {e}")
+            return
+
+        def work():
+            try:
+                sink = macros.UinputSink(compiled.codes)
+                try:
+                    realtime = macros.realtime()
+                    late = macros.play(compiled, sink)
+                finally:
+                    sink.close()
+                error = None
+            except (macros.MacroError, OSError) as e:
+                realtime, late, error = False, None, e
+            GLib.idle_add(on_done, realtime, late, error)
+
+        def on_done(realtime, late, error):
+            self.macro_playing = False
+            self.play_macro_button.set_sensitive(True)
+            if error is not None:
+                self.update_status(f"Macro {macro.name} not played: {error}")
+            else:
+                priority = "" if realtime else " (not allowed to use SCHED_FIFO, played at normal priority)"
+                self.update_status(f"Macro {macro.name} played, at most {late / 1e6:.2f} ms late{priority}")
+            return False
+
+        self.macro_playing = True
+        self.play_macro_button.set_sensitive(False)
+        threading.Thread(target=work, daemon=True).start()
+
+    def create_telemetry_section(self, parent):
+        """Create live motion telemetry section"""
+        frame = Gtk.Frame()
+        frame.set_margin_top(5)
+        frame.set_margin_bottom(5)
+
+        box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=10)
+        box.set_margin_top(10)
+        box.set_margin_bottom(10)
+        box.set_margin_start(10)
+        box.set_margin_end(10)
+        frame.set_child(box)
+
+        label = Gtk.Label(label="<b>Motion Telemetry</b>")
+        label.set_use_markup(True)
+        label.set_halign(Gtk.Align.START)
+        box.append(label)
+
+        # Start and stop
+        control_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=10)
+        self.telemetry_button = Gtk.ToggleButton(label="Show Live Motion")
+        self.telemetry_button.set_tooltip_text("Plot the mouse's reports while you move it")
+        self.telemetry_button.connect("toggled", self.on_telemetry_toggled)
+        control_box.append(self.telemetry_button)
+
+        self.telemetry_label = Gtk.Label(label="Stopped")
+        self.telemetry_label.set_halign(Gtk.Align.START)
+        control_box.append(self.telemetry_label)
+
+        box.append(control_box)
+
+        # Deltas on top, report intervals below
+        self.telemetry_area = Gtk.DrawingArea()
+        self.telemetry_area.set_content_height(180)
+        self.telemetry_area.set_hexpand(True)
+        self.telemetry_area.set_draw_func(self.draw_telemetry)
+        box.append(self.telemetry_area)
+
+        legend = Gtk.Label(label=f"Counts per report: x blue, y red. Interval between reports "
+                                 f"(0-10 ms): green. Last {self.telemetry_seconds} s.")
+        legend.set_halign(Gtk.Align.START)
+        box.append(legend)
+
+        parent.append(frame)
+
+    def on_telemetry_toggled(self, button):
+        """Start or stop reading the mouse's input events"""
+        if button.get_active():
+            self.start_telemetry()
+        else:
+            self.stop_telemetry()
+
+    def start_telemetry(self):
+        if self.motion_reader is not None:
+            return
+        path = pollrate.find_event_device()
+        if path is None:
+            self.stop_telemetry("No Attack Shark R1 input device found")
+            return
+        try:
+            ring = telemetry.MotionRing()
+            reader = telemetry.MotionReader(path, ring)
+            reader.start()
+        except pollrate.PollRateError as e:
+            self.stop_telemetry(str(e))
+            return
+        except OSError as e:
+            self.stop_telemetry(f"Cannot open {path}: {e.strerror}")
+            return
+
+        # Frames copy out of the ring into these, so drawing allocates nothing per report
+        self.motion_ring = ring
+        self.motion_reader = reader
+        self.telemetry_buffers = tuple(ring.np.empty_like(array) for array in (ring.times, ring.dx, ring.dy))
+        self.telemetry_intervals = ring.np.empty(ring.capacity, ring.np.float64)
+        self.telemetry_drawn = 0
+        self.telemetry_label.set_text("Move the mouse...")
+        # Ticks follow the display's refresh rate, which caps redraws at one per frame
+        self.telemetry_tick = self.telemetry_area.add_tick_callback(self.on_telemetry_tick)
+
+    def stop_telemetry(self, error=None):
+        if self.telemetry_tick is not None:
+            self.telemetry_area.remove_tick_callback(self.telemetry_tick)
+            self.telemetry_tick = None
+        if self.motion_reader is not None:
+            self.motion_reader.stop()
+            self.motion_reader = None
+        if error is not None:
+            self.telemetry_label.set_text("Stopped")
+            self.update_status(f"Motion telemetry stopped: {error}")
+        elif self.motion_ring is not None:
+            self.telemetry_label.set_text("Stopped")
+        if self.telemetry_button.get_active():
+            self.telemetry_button.set_active(False)
+
+    def on_telemetry_tick(self, area, frame_clock):
+        """Redraw when reports came in since the last frame"""
+        reader = self.motion_reader
+        if not reader.running():
+            self.telemetry_tick = None
+            self.stop_telemetry(reader.error)
+            return GLib.SOURCE_REMOVE
+        if self.motion_ring.written != self.telemetry_drawn:
+            self.telemetry_drawn = self.motion_ring.written
+            area.queue_draw()
+        return GLib.SOURCE_CONTINUE
+
+    def draw_telemetry(self, area, cr, width, height):
+        """Plot the last few seconds of reports, decimated to the widget's width"""
+        cr.set_source_rgb(0.1, 0.1, 0.1)
+        cr.paint()
+        if self.motion_ring is None:
+            return
+        np = self.motion_ring.np
+        times, dx, dy = self.telemetry_buffers
+        n = self.motion_ring.copy_latest(times, dx, dy)
+        if n < 2:
+            return
+        first = int(np.searchsorted(times[:n], times[n - 1] - self.telemetry_seconds))
+        if n - first < 2:
+            return
+
+        deltas_height = height * 2 // 3
+        scale = max(1, int(np.max(np.abs(dx[first:n]))), int(np.max(np.abs(dy[first:n]))))
+        self.plot_trace(cr, dx[first:n], width, 0, deltas_height, -scale, scale, (0.3, 0.5, 1.0))
+        self.plot_trace(cr, dy[first:n], width, 0, deltas_height, -scale, scale, (1.0, 0.35, 0.3))
+
+        intervals = self.telemetry_intervals[:n - first - 1]
+        np.subtract(times[first + 1:n], times[first:n - 1], out=intervals)
+        intervals *= 1000
+        np.minimum(intervals, 10, out=intervals)
+        self.plot_trace(cr, intervals, width, deltas_height, height - deltas_height, 0, 10, (0.3, 0.9, 0.4))
+
+        cr.set_source_rgb(0.4, 0.4, 0.4)
+        cr.set_line_width(1)
+        cr.move_to(0, deltas_height + 0.5)
+        cr.line_to(width, deltas_height + 0.5)
+        cr.stroke()
+
+        rate = (n - first - 1) / max(times[n - 1] - times[first], 1e-6)
+        self.telemetry_label.set_text(f"{rate:.0f} reports/s, up to {scale} counts")
+
+    def plot_trace(self, cr, values, width, top, height, low, high, color):
+        """Draw `values` between `low` and `high` as one min/max stroke per pixel column"""
+        mins, maxs = telemetry.decimate(values, width)
+        step = width / len(mins)
+        scale = height / (high - low)
+        cr.set_source_rgb(*color)
+        cr.set_line_width(1)
+        for i, (low_value, high_value) in enumerate(zip(mins.tolist(), maxs.tolist())):
+            x = i * step + 0.5
+            cr.line_to(x, top + (high - high_value) * scale)
+            cr.line_to(x, top + (high - low_value) * scale)
+        cr.stroke()
+
+    def create_power_section(self, parent):
+        """Create power settings section"""
+        frame = Gtk.Frame()
+        frame.set_margin_top(5)
+        frame.set_margin_bottom(5)
+
+        box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=10)
+        box.set_margin_top(10)
+        box.set_margin_bottom(10)
+        box.set_margin_start(10)
+        box.set_margin_end(10)
+        frame.set_child(box)
+
+        label = Gtk.Label(label="<b>Power Settings</b>")
+        label.set_use_markup(True)
+        label.set_halign(Gtk.Align.START)
+        box.append(label)
+
+        # Sleep time
+        sleep_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=10)
+        sleep_label = Gtk.Label(label="Sleep Time (0.5-30ms):")
+        sleep_label.set_halign(Gtk.Align.START)
+        sleep_box.append(sleep_label)
+
+        self.sleep_scale = Gtk.Scale.new_with_range(Gtk.Orientation.HORIZONTAL, 0.5, 30.0, 0.1)
+        self.sleep_scale.set_value(self.sleep_time)
+        self.sleep_scale.set_draw_value(True)
+        self.sleep_scale.set_hexpand(True)
+        self.sleep_scale.connect("value-changed", self.on_sleep_time_changed)
+        sleep_box.append(self.sleep_scale)
+
+        box.append(sleep_box)
+
+        # Deep sleep time
+        deep_sleep_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=10)
+        deep_sleep_label = Gtk.Label(label="Deep Sleep Time (1-60ms):")
+        deep_sleep_label.set_halign(Gtk.Align.START)
+        deep_sleep_box.append(deep_sleep_label)
+
+        self.deep_sleep_spin = Gtk.SpinButton.new_with_range(1, 60, 1)
+        self.deep_sleep_spin.set_value(self.deep_sleep_time)
+        self.deep_sleep_spin.connect("value-changed", self.on_deep_sleep_time_changed)
+        deep_sleep_box.append(self.deep_sleep_spin)
+
+        unit_label = Gtk.Label(label="ms")
+        deep_sleep_box.append(unit_label)
+
+        box.append(deep_sleep_box)
+
+        parent.append(frame)
+
+    def create_button_section(self, parent):
+        """Create action buttons section"""
+        button_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=10)
+        button_box.set_halign(Gtk.Align.CENTER)
+        button_box.set_margin_top(20)
+        button_box.set_margin_bottom(20)
+
+        # Load button
+        load_button = Gtk.Button(label="Load Config")
+        load_button.connect("clicked", self.on_load_config)
+        button_box.append(load_button)
+
+        # Save button
+        save_button = Gtk.Button(label="Save Config")
+        save_button.connect("clicked", self.on_save_config)
+        button_box.append(save_button)
+
+        # Apply button
+        apply_button = Gtk.Button(label="Apply Settings")
+        apply_button.get_style_context().add_class("suggested-action")
+        apply_button.connect("clicked", self.on_apply_settings)
+        button_box.append(apply_button)
+
+        # Apply to every connected R1 at once
+        apply_all_button = Gtk.Button(label="Apply to All")
+        apply_all_button.connect("clicked", self.on_apply_all)
+        button_box.append(apply_all_button)
+
+        # Reset button
+        reset_button = Gtk.Button(label="Reset to Defaults")
+        reset_button.connect("clicked", self.on_reset_defaults)
+        button_box.append(reset_button)
+
+        # Cancel button, only usable while a command is running or queued
+        self.cancel_button = Gtk.Button(label="Cancel")
+        self.cancel_button.set_sensitive(False)
+        self.cancel_button.connect("clicked", self.on_cancel_commands)
+        button_box.append(self.cancel_button)
+
+        parent.append(button_box)
+
+    def create_status_bar(self, parent):
+        """Create status bar"""
+        status_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=10)
+
+        self.status_bar = Gtk.Statusbar()
+        self.status_bar.set_hexpand(True)
+        self.status_context = self.status_bar.get_context_id("status")
+        self.status_bar.push(self.status_context, "Ready")
+        status_box.append(self.status_bar)
+
+        self.battery_label = Gtk.Label(label="Battery: unknown")
+        self.battery_label.set_margin_end(10)
+        status_box.append(self.battery_label)
+
+        parent.append(status_box)
+
+    # Event handlers
+    def on_browse_config(self, button):
+        """Handle browse config button click"""
+        dialog = Gtk.FileChooserNative(
+            title="Select Config File",
+            transient_for=self,
+            action=Gtk.FileChooserAction.SAVE
+        )
+
+        # Create filter
+        filter_ini = Gtk.FileFilter()
+        filter_ini.set_name("INI files")
+        filter_ini.add_pattern("*.ini")
+        dialog.add_filter(filter_ini)
+
+        dialog.set_current_name("attack-shark-r1.ini")
+
+        def on_response(dialog, response):
+            if response == Gtk.ResponseType.ACCEPT:
+                file = dialog.get_file()
+                if file:
+                    filename = file.get_path()
+                    self.config_entry.set_text(filename)
+                    self.config_path = filename
+            dialog.destroy()
+
+        dialog.connect("response", on_response)
+        dialog.show()
+
+    def on_reapply_changed(self, switch, state):
+        """Handle reapply config switch change"""
+        self.reapply_config = state
+
+    def on_session_changed(self, switch, state):
+        """Handle persistent session switch change"""
+        self.use_session = state
+        if not state:
+            self.session.close()
+
+    def on_transport_changed(self, combo, pspec):
+        """Handle transport change"""
+        self.transport = self.transport_names[combo.get_selected()]
+        if self.transport != 'driver':
+            # The direct transports need the interface the session holds
+            self.session.close()
+        else:
+            self.executor.close()
+
+    def on_session_bus(self, source, result):
+        """Subscribe to the session service's signals once the bus is there"""
+        try:
+            self.session_bus = Gio.bus_get_finish(result)
+        except GLib.Error:
+            return
+        for name, handler in (('StateChanged', self.on_service_state_changed),
+                              ('ChargeChanged', self.on_service_charge_changed)):
+            self.session_bus.signal_subscribe(service.BUS_NAME, service.INTERFACE, name, service.OBJECT_PATH,
+                                              None, Gio.DBusSignalFlags.NONE, handler)
+
+    def on_service_state_changed(self, connection, sender, path, interface, signal, parameters):
+        """Show settings the service sent, for this window or any other client"""
+        if self.transport != 'service':
+            return
+        try:
+            state = AppliedState(**service.state_changes(parameters.unpack()[0]))
+        except (TypeError, service.ServiceError):
+            return
+        self.applied_states.put(state_key(self.device_id), state)
+        self._load_state(state)
+
+    def on_service_charge_changed(self, connection, sender, path, interface, signal, parameters):
+        """Show a charge another client of the service read"""
+        if self.transport != 'service':
+            return
+        charge = parameters.unpack()[0]
+        last = self.battery_history.last()
+        if last is None or last[1] != charge:
+            self.record_charge(charge)
+
+    def refresh_devices(self):
+        """List the connected R1s, keeping the selection if it is still there"""
+        devices = list_devices()
+        self.device_ids = [None] + [device.id for device in devices]
+        selected = self.device_id if self.device_id in self.device_ids else None
+        self.device_names.splice(0, self.device_names.get_n_items(),
+                                 ["First found"] + [describe(device) for device in devices])
+        self.device_combo.set_selected(self.device_ids.index(selected))
+
+    def on_device_changed(self, combo, pspec):
+        """Handle device selection change"""
+        selected = combo.get_selected()
+        if selected >= len(self.device_ids):
+            return
+        self.device_id = self.device_ids[selected]
+
+    def on_trace_changed(self, switch, state):
+        """Handle apply tracing switch change"""
+        self.trace_applies = state
+
+    def on_command_traced(self, key, record):
+        """Log a command, and keep a traced one's record for its on_done"""
+        # The service logs what it sends itself
+        if self.transport != 'service':
+            log_record(record, self.trace_log)
+        if self.executor.trace:
+            self.traces[key] = record
+
+    def refresh_profiles(self):
+        """Show the stored profiles, selecting the active one"""
+        self.profiles.reload()
+        names = self.profiles.names()
+        self.profile_names.splice(0, self.profile_names.get_n_items(), names)
+        if self.profiles.active in names:
+            self.profile_combo.set_selected(names.index(self.profiles.active))
+
+    def selected_profile(self):
+        item = self.profile_combo.get_selected_item()
+        return item.get_string() if item is not None else None
+
+    def on_save_profile(self, button):
+        """Handle save profile button click"""
+        name = self.profile_entry.get_text().strip()
+        if self.field_problems:
+            self.update_status(f"Not saved: {next(iter(self.field_problems.values())).message}")
+            return
+        try:
+            self.profiles.save(name, self._current_state())
+        except (ProfileError, OSError) as e:
+            self.show_error_dialog("Failed to save profile", str(e))
+            self.update_status("Error saving profile")
+            return
+        self.profile_entry.set_text("")
+        self.refresh_profiles()
+        self.profile_combo.set_selected(self.profiles.names().index(name))
+        self.update_status(f"Profile {name} saved")
+
+    def on_delete_profile(self, button):
+        """Handle delete profile button click"""
+        name = self.selected_profile()
+        if name is None:
+            return
+        try:
+            self.profiles.delete(name)
+        except (ProfileError, OSError) as e:
+            self.show_error_dialog("Failed to delete profile", str(e))
+            return
+        self.refresh_profiles()
+        self.update_status(f"Profile {name} deleted")
+
+    def on_switch_profile(self, button):
+        """Show the selected profile and send its pre-encoded reports"""
+        self.refresh_profiles()
+        name = self.selected_profile()
+        if name is None:
+            self.update_status("No profile selected")
+            return
+        profile = self.profiles.get(name)
+        self._load_state(profile.state)
+        self.applied_states.reload()
+        # Resolved now, "First found" may be another mouse than last time
+        device = state_key(self.device_id)
+
+        def on_done(output, error):
+            if error is not None:
+                if not isinstance(error, QueueFull):
+                    self.applied_states.forget(device)
+                self.report_driver_error(f"Error switching to {name}", error)
+                return
+            self.applied_states.put(device, profile.state)
+            try:
+                self.profiles.set_active(name)
+            except (ProfileError, OSError):
+                pass
+            self.update_status(f"Switched to profile {name}")
+
+        self.update_status(f"Switching to profile {name}...")
+        # Replaces a pending apply, the profile overwrites all of its settings anyway
+        self.run_driver(lambda: ('send', profile.state, profile.reports), on_done, key='apply')
+
+    def _load_state(self, state):
+        """Show a settings snapshot in the window"""
+        self.polling_rate = state.polling_rate
+        self.dpi_values = {i: dpi for i, dpi in enumerate(state.dpis, start=1)}
+        self.active_dpi = state.active_dpi
+        self.ripple_control = state.ripple_control
+        self.angle_snap = state.angle_snap
+        self.sleep_time = state.sleep_time
+        self.deep_sleep_time = state.deep_sleep_time
+        self.key_response_time = state.key_response_time
+        self.update_ui_from_config()
+
+    def on_close_request(self, window):
+        """Release the driver session before the window closes"""
+        self.battery_monitor = False
+        if self.battery_source is not None:
+            GLib.source_remove(self.battery_source)
+            self.battery_source = None
+        if self.motion_reader is not None:
+            self.motion_reader.stop()
+            self.motion_reader = None
+        self.executor.cancel()
+        self.executor.close()
+        self.session.close()
+        return False
+
+    def on_cancel_commands(self, button):
+        """Handle cancel button click"""
+        self.executor.cancel()
+
+    def on_executor_busy_changed(self, busy):
+        """Only allow cancelling while the driver is working"""
+        self.cancel_button.set_sensitive(busy)
+
+    def run_driver(self, prepare, on_done, key):
+        """Queue a driver command; on_done(output, error) runs on the main loop
+
+        Commands are run one at a time, through the session when enabled. A
+        newer command with the same key replaces one that hasn't started yet.
+        """
+        self.executor.use_session = self.use_session
+        self.executor.transport = self.transport
+        self.executor.device = self.device_id
+        self.executor.trace = self.trace_applies
+        self.executor.config_path = self.config_entry.get_text()
+        self.executor.submit(Command(prepare, on_done, key=key, timeout=self.command_timeout))
+
+    def report_driver_error(self, title, error):
+        """Show a failed driver command in a dialog and the status bar"""
+        if isinstance(error, FileNotFoundError):
+            self.show_error_dialog("Driver not found", "Make sure attack-shark-r1-driver is in your PATH.")
+            self.update_status("Driver command not found")
+        elif isinstance(error, CommandTimeout):
+            self.show_error_dialog(title, str(error))
+            self.update_status("Driver timed out")
+        elif isinstance(error, CommandCancelled):
+            self.update_status("Cancelled")
+        elif isinstance(error, (DriverError, QueueFull, TransportError)):
+            self.show_error_dialog(title, f"Error: {error}")
+            # e.g. "device unreachable after 5 tries in 1250 ms"
+            reason = str(error).splitlines()[-1] if str(error) else ''
+            self.update_status(f"{title}: {reason}" if reason else title)
+        else:
+            self.show_error_dialog("Unexpected error", str(error))
+            self.update_status("Unexpected error")
+
+    def on_query_charge(self, button):
+        """Handle query charge button click"""
+        def on_done(charge, error):
+            if error is not None:
+                self.report_driver_error("Failed to query charge", error)
+                return
+            self.record_charge(charge)
+            self.show_message_dialog("Battery Charge", charge)
+            self.update_status("Battery charge queried successfully")
+
+        self.update_status("Querying battery charge...")
+        self.run_driver(lambda: ('query',), on_done, key='query')
+
+    def on_battery_monitor_changed(self, switch, state):
+        """Handle battery monitor switch change"""
+        self.battery_monitor = state
+        if state:
+            self.schedule_battery_query(5)
+        elif self.battery_source is not None:
+            GLib.source_remove(self.battery_source)
+            self.battery_source = None
+
+    def schedule_battery_query(self, delay):
+        """Query the charge in the background after `delay` seconds"""
+        if self.battery_source is not None:
+            GLib.source_remove(self.battery_source)
+        self.battery_source = GLib.timeout_add_seconds(delay, self.on_battery_timer)
+
+    def on_battery_timer(self):
+        """Query the charge without any dialog; the next delay adapts to the result"""
+        self.battery_source = None
+
+        def on_done(charge, error):
+            if not self.battery_monitor:
+                return
+            if error is None:
+                self.record_charge(charge)
+                self.battery_interval = next_poll_interval(self.battery_history, self.battery_interval)
+            else:
+                # Asleep or out of range: back off instead of trying to wake it up
+                self.battery_interval = min((self.battery_interval or 60) * 2, 3600)
+            self.schedule_battery_query(self.battery_interval)
+
+        self.run_driver(lambda: ('query',), on_done, key='battery')
+        return GLib.SOURCE_REMOVE
+
+    def record_charge(self, charge):
+        """Store a charge reading and show it in the status bar"""
+        try:
+            value = int(charge)
+        except (TypeError, ValueError):
+            return
+        # The driver reports 0 when wired, there is no battery reading then
+        if value > 0:
+            self.battery_history.append(value)
+        self.update_battery_label()
+
+    def update_battery_label(self):
+        """Show the last known charge and the estimated time left"""
+        last = self.battery_history.last()
+        if last is None:
+            self.battery_label.set_text("Battery: unknown")
+            return
+
+        text = f"Battery: {last[1]}%"
+        remaining = self.battery_history.time_remaining()
+        if remaining is not None:
+            rate = self.battery_history.discharge_rate()
+            text += f" (~{remaining:.1f} h left, {rate:.1f}%/h)"
+        self.battery_label.set_text(text)
+
+    def on_live_apply_changed(self, switch, state):
+        """Handle live apply switch change"""
+        self.live_apply = state
+        if not state and self.live_apply_source is not None:
+            GLib.source_remove(self.live_apply_source)
+            self.live_apply_source = None
+
+    def on_live_apply_delay_changed(self, spin):
+        """Handle live apply debounce change"""
+        self.live_apply_delay = spin.get_value_as_int()
+
+    def schedule_live_apply(self):
+        """Apply the settings once the widgets have been still for the debounce window
+
+        Every change restarts the timer, so a burst of changes (e.g. dragging
+        a slider) results in a single apply of the final values. The apply
+        is diff-based, so only the reports of the changed settings are sent.
+        """
+        if not self.live_apply or self.updating_ui:
+            return
+        if self.live_apply_source is not None:
+            GLib.source_remove(self.live_apply_source)
+        self.live_apply_source = GLib.timeout_add(self.live_apply_delay, self.on_live_apply_timeout)
+
+    def on_live_apply_timeout(self):
+        """Apply the settings after the debounce window"""
+        self.live_apply_source = None
+        self.apply_settings(full=False)
+        return GLib.SOURCE_REMOVE
+
+    def on_polling_rate_changed(self, button, rate):
+        """Handle polling rate change"""
+        if button.get_active():
+            self.polling_rate = rate
+            self.schedule_live_apply()
+
+    def on_active_dpi_changed(self, combo, pspec):
+        """Handle active DPI change"""
+        self.active_dpi = combo.get_selected() + 1
+        self.schedule_live_apply()
+
+    def on_dpi_entry_changed(self, entry, slot):
+        """Handle DPI entry change"""
+        try:
+            value = int(entry.get_text())
+        except ValueError:
+            value = None
+
+        problem = validate_dpi(slot, value, allow_disabled=True)
+        self.show_field_problem(entry, f'dpi{slot}', problem)
+        if problem is not None:
+            return
+
+        self.dpi_values[slot] = value
+        self.dpi_switches[slot].set_active(value > 0)
+        self.schedule_live_apply()
+
+    def on_dpi_switch_changed(self, switch, state, slot):
+        """Handle DPI switch change"""
+        if not state:
+            self.dpi_values[slot] = 0
+            self.dpi_entries[slot].set_text("0")
+
+    def on_response_time_changed(self, spin):
+        """Handle key response time change"""
+        self.key_response_time = spin.get_value_as_int()
+        problem = validate_field('key_response_time', self.key_response_time)
+        self.show_field_problem(spin, 'key_response_time', problem)
+        if problem is None:
+            self.schedule_live_apply()
+
+    def on_angle_snap_changed(self, switch, state):
+        """Handle angle snap change"""
+        self.angle_snap = state
+        self.schedule_live_apply()
+
+    def on_ripple_control_changed(self, switch, state):
+        """Handle ripple control change"""
+        self.ripple_control = state
+        self.schedule_live_apply()
+
+    def on_sleep_time_changed(self, scale):
+        """Handle sleep time change"""
+        self.sleep_time = scale.get_value()
+        problem = validate_field('sleep_time', self.sleep_time)
+        self.show_field_problem(scale, 'sleep_time', problem)
+        if problem is None:
+            self.schedule_live_apply()
+
+    def on_deep_sleep_time_changed(self, spin):
+        """Handle deep sleep time change"""
+        self.deep_sleep_time = spin.get_value_as_int()
+        problem = validate_field('deep_sleep_time', self.deep_sleep_time)
+        self.show_field_problem(spin, 'deep_sleep_time', problem)
+        if problem is None:
+            self.schedule_live_apply()
+
+    def show_field_problem(self, widget, key, problem):
+        """Mark a widget as invalid (or valid again) and remember it to block applies"""
+        if problem is None:
+            if self.field_problems.pop(key, None) is not None:
+                widget.remove_css_class("error")
+                widget.set_tooltip_text(None)
+            return
+
+        self.field_problems[key] = problem
+        widget.add_css_class("error")
+        widget.set_tooltip_text(problem.message)
+        self.update_status(problem.message)
+
+    def on_load_config(self, button):
+        """Handle load config button click"""
+        config_file = self.config_entry.get_text()
+
+        if not os.path.exists(config_file):
+            self.show_error_dialog("Config file not found", config_file)
+            self.update_status(f"Config file not found: {config_file}")
+            return
+
+        try:
+            config = self.config_store.load(config_file)
+        except Exception as e:
+            self.show_error_dialog("Failed to load config", str(e))
+            self.update_status("Error loading config")
+            return
+
+        self.transport = config.gui['transport']
+        if self.transport not in self.transport_names:
+            self.transport = 'driver'
+        self.battery_monitor = config.gui['battery_monitor']
+        self.live_apply = config.gui['live_apply']
+        self.live_apply_delay = config.gui['live_apply_debounce_ms']
+        self.trace_applies = config.gui['trace_applies']
+        self.macros = dict(config.macros)
+
+        # Fields the file got wrong keep their defaults
+        self._load_state(config.state)
+
+        if config.problems:
+            self.update_status(f"Config loaded from {config_file}, defaults used for invalid settings: {config.problems[0].message}")
+        else:
+            self.update_status(f"Config loaded from {config_file}")
+
+    def update_ui_from_config(self):
+        """Update UI elements from loaded config"""
+        # Loading values into the widgets is not a user edit, don't live-apply it
+        self.updating_ui = True
+        try:
+            self._update_widgets()
+        finally:
+            self.updating_ui = False
+
+    def _update_widgets(self):
+        """Push the current settings into the widgets"""
+        # Update polling rate
+        for rate, button in self.polling_buttons.items():
+            button.set_active(rate == self.polling_rate)
+
+        # Update active DPI
+        self.active_dpi_combo.set_selected(self.active_dpi - 1)
+
+        # Update DPI values
+        for i in range(1, 7):
+            self.dpi_entries[i].set_text(str(self.dpi_values[i]))
+            self.dpi_switches[i].set_active(self.dpi_values[i] > 0)
+
+        # Sections that are not built yet pick the settings up when they are
+        if 'performance' in self.built_sections:
+            # Update response time
+            self.response_spin.set_value(self.key_response_time)
+
+            # Update switches
+            self.angle_switch.set_active(self.angle_snap)
+            self.ripple_switch.set_active(self.ripple_control)
+
+        if 'power' in self.built_sections:
+            # Update sleep times
+            self.sleep_scale.set_value(self.sleep_time)
+            self.deep_sleep_spin.set_value(self.deep_sleep_time)
+
+        # Update transport
+        self.transport_combo.set_selected(self.transport_names.index(self.transport))
+
+        # Update battery monitor
+        self.battery_switch.set_active(self.battery_monitor)
+
+        # Update live apply
+        self.live_switch.set_active(self.live_apply)
+        self.live_delay_spin.set_value(self.live_apply_delay)
+
+        # Update apply tracing
+        self.trace_switch.set_active(self.trace_applies)
+
+        if 'macros' in self.built_sections:
+            self.refresh_macros()
+
+    def on_save_config(self, button):
+        """Handle save config button click"""
+        config_file = self.config_entry.get_text()
+
+        if not config_file:
+            self.show_error_dialog("Error", "Please specify a config file path")
+            return
+
+        # The driver refuses to start from a file it can't parse
+        state = self._current_state()
+        problems = list(self.field_problems.values()) or validate(state, allow_disabled_dpis=True)
+        if problems:
+            self.update_status(f"Not saved: {problems[0].message}")
+            return
+
+        gui = {
+            'transport': self.transport,
+            'battery_monitor': self.battery_monitor,
+            'live_apply': self.live_apply,
+            'live_apply_debounce_ms': self.live_apply_delay,
+            'trace_applies': self.trace_applies,
+        }
+
+        try:
+            self.config_store.save(config_file, state, gui, self.macros)
+
+            self.update_status(f"Config saved to {config_file}")
+
+            # If reapply is checked, apply after saving
+            if self.reapply_config:
+                self.on_apply_settings(None)
+
+        except Exception as e:
+            self.show_error_dialog("Failed to save config", str(e))
+            self.update_status("Error saving config")
+
+    def on_apply_settings(self, button):
+        """Handle apply settings button click"""
+        self.apply_settings(full=self.reapply_config)
+
+    def apply_settings(self, full):
+        """Send the settings that differ from the last applied state, or all of them
+
+        The difference is computed when the apply actually starts, so an
+        apply queued behind another one only sends what is still missing.
+        """
+        state = self._current_state()
+        reapply = full and self.reapply_config
+
+        # Never spend a driver run or USB traffic on settings the driver rejects
+        problems = list(self.field_problems.values()) or validate(state, allow_disabled_dpis=True)
+        if problems:
+            self.update_status(f"Not applied: {problems[0].message}")
+            return
+
+        device = state_key(self.device_id)
+
+        def prepare():
+            if full:
+                groups = set(REPORT_GROUPS)
+            else:
+                # The command line and the daemons may have sent settings since
+                self.applied_states.reload()
+                groups = changed_report_groups(self.applied_states.get(device), state)
+            if not groups:
+                return None
+            return ('apply', state, groups, reapply)
+
+        def on_done(output, error):
+            trace = self.traces.pop('apply', None)
+            if error is not None:
+                # A failed apply may have sent some reports, so the device state is unknown
+                if not isinstance(error, QueueFull):
+                    self.applied_states.forget(device)
+                self.report_driver_error("Error applying settings", error)
+                return
+            if output is None:
+                self.update_status("Settings already applied, nothing to send")
+                return
+
+            self.applied_states.put(device, state)
+            if output:
+                self.show_message_dialog("Success", output)
+            if trace is not None:
+                self.update_status(f"Settings applied in {summarize(trace)}")
+            else:
+                self.update_status("Settings applied successfully")
+
+        self.update_status("Applying settings...")
+        self.run_driver(prepare, on_done, key='apply')
+
+    def on_apply_all(self, button):
+        """Send every setting to all connected R1s at once, one worker per device"""
+        state = self._current_state()
+        problems = list(self.field_problems.values()) or validate(state, allow_disabled_dpis=True)
+        if problems:
+            self.update_status(f"Not applied: {problems[0].message}")
+            return
+
+        self.refresh_devices()
+        device_ids = self.device_ids[1:]
+        if not device_ids:
+            self.update_status("No Attack Shark R1 found")
+            return
+
+        def on_done(results, error):
+            self.traces.pop('apply', None)
+            if error is not None:
+                for device_id in device_ids:
+                    self.applied_states.forget(state_key(device_id))
+                self.report_driver_error("Error applying settings", error)
+                return
+
+            failures = []
+            for result in results:
+                if result.error is None:
+                    self.applied_states.put(state_key(result.device), state)
+                else:
+                    self.applied_states.forget(state_key(result.device))
+                    failures.append(f"{result.device}: {result.error}")
+            slowest = max(result.elapsed for result in results)
+            applied = len(results) - len(failures)
+            self.update_status(f"Applied to {applied} of {len(results)} devices in {slowest * 1000:.0f} ms")
+            if failures:
+                self.show_error_dialog("Some devices were not configured", '\n'.join(failures))
+
+        self.update_status(f"Applying settings to {len(device_ids)} devices...")
+        self.run_driver(lambda: ('apply-all', state, device_ids), on_done, key='apply')
+
+    def _current_state(self):
+        """Snapshot the settings shown in the window"""
+        return AppliedState(
+            polling_rate=self.polling_rate,
+            dpis=tuple(self.dpi_values[i] for i in range(1, 7)),
+            active_dpi=self.active_dpi,
+            ripple_control=self.ripple_control,
+            angle_snap=self.angle_snap,
+            sleep_time=round(self.sleep_time, 1),
+            deep_sleep_time=self.deep_sleep_time,
+            key_response_time=self.key_response_time,
+        )
+
+    def on_reset_defaults(self, button):
+        """Handle reset to defaults button click"""
+        dialog = Gtk.MessageDialog(
+            transient_for=self,
+            modal=True,
+            message_type=Gtk.MessageType.QUESTION,
+            buttons=Gtk.ButtonsType.YES_NO,
+            text="Reset Settings",
+            secondary_text="Are you sure you want to reset all settings to defaults?"
+        )
+
+        def on_response(dialog, response):
+            if response == Gtk.ResponseType.YES:
+                self.reset_to_defaults()
+            dialog.destroy()
+
+        dialog.connect("response", on_response)
+        dialog.show()
+
+    def reset_to_defaults(self):
+        """Reset all settings to defaults"""
+        self.active_dpi = 1
+        self.angle_snap = False
+        self.deep_sleep_time = 5
+        self.dpi_values = {i: 800 if i == 1 else 0 for i in range(1, 7)}
+        self.key_response_time = 8
+        self.polling_rate = 1000
+        self.ripple_control = False
+        self.sleep_time = 2.0
+
+        self.update_ui_from_config()
+        self.update_status("Settings reset to defaults")
+
+    def load_config(self):
+        """Load initial config"""
+        config_file = self.config_path
+        if os.path.exists(config_file):
+            self.on_load_config(None)
+
+    # UI helper methods
+    def show_message_dialog(self, title, message):
+        """Show a message dialog"""
+        dialog = Gtk.MessageDialog(
+            transient_for=self,
+            modal=True,
+            message_type=Gtk.MessageType.INFO,
+            buttons=Gtk.ButtonsType.OK,
+            text=title,
+            secondary_text=message
+        )
+        dialog.connect("response", lambda d, r: d.destroy())
+        dialog.show()
+
+    def show_error_dialog(self, title, message):
+        """Show an error dialog"""
+        dialog = Gtk.MessageDialog(
+            transient_for=self,
+            modal=True,
+            message_type=Gtk.MessageType.ERROR,
+            buttons=Gtk.ButtonsType.OK,
+            text=title,
+            secondary_text=message
+        )
+        dialog.connect("response", lambda d, r: d.destroy())
+        dialog.show()
+
+    def update_status(self, message):
+        """Update status bar"""
+        self.status_bar.remove_all(self.status_context)
+        self.status_bar.push(self.status_context, message)
+
+class AttackSharkApp(Gtk.Application):
+    def __init__(self):
+        super().__init__(application_id="com.github.attackshark.r1driver")
+
+    def do_activate(self):
+        win = AttackSharkWindow(self)
+        win.present()
+
+def main():
+    app = AttackSharkApp()
+    app.run()
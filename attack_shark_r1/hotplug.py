@@ -0,0 +1,344 @@
+"""
+Reapplying settings when the mouse is plugged in again or the system resumes
+
+Connections come from the kernel's uevents for the IDs in
+99-attack-shark-r1.rules: the receiver (1d57:fa60) and the wired mouse
+(1d57:fa61). Suspend and resume come from logind's PrepareForSleep signal,
+read from `gdbus monitor`. One plug produces a burst of events, for the
+USB device, its interfaces and the hidraw nodes, so events are coalesced
+into a single check once they have been quiet for `settle` seconds. That
+also gives udev time to apply the rules' permissions.
+
+Only 'add' and 'resume' schedule a check; 'sleep' drops a pending one, so
+nothing is sent while the system suspends. With --device, uevents of other
+R1s are ignored. The check only sends anything when the applied state
+cache has no entry for the mouse, e.g. after a failed apply, or when its
+entry is stale: put before the latest event. If the GUI or the command
+line applied since, nothing is sent. What gets sent is the state last
+applied to the mouse, as the cache recorded it, so unsaved GUI settings and
+profile switches survive. Only for a mouse nothing was ever recorded for is
+it the active profile, or the settings in the driver's config file when no
+profile is active.
+
+Sources are plain file descriptors, so a socketpair fed with
+format_uevent() messages, a pipe fed with gdbus lines and a directory
+laid out like /sys stand in for the kernel and logind.
+"""
+
+import fcntl
+import os
+import re
+import select
+import socket
+import subprocess
+import time
+
+from .devices import list_devices, state_key
+from .profiles import ProfileError
+from .settings import REPORT_GROUPS, encode_reports
+from .trace import logged
+from .transport import PID, VID, WIRED_PID, TransportError
+
+# linux/netlink.h
+NETLINK_KOBJECT_UEVENT = 15
+KERNEL_GROUP = 1
+
+PIDS = (PID, WIRED_PID)
+
+LOGIND_MONITOR = ['gdbus', 'monitor', '--system', '--dest', 'org.freedesktop.login1',
+                  '--object-path', '/org/freedesktop/login1']
+
+# Seconds before retrying a reapply that failed, e.g. while the mouse sleeps
+RETRY_INTERVAL = 30
+
+# Events after which the mouse may have lost its settings
+REAPPLY_EVENTS = ('add', 'resume')
+
+# USB device names in a DEVPATH, e.g. 3-1.4 (see attack_shark_r1.devices)
+USB_DEVICE = re.compile(r'\d+-[\d.]+')
+
+
+def parse_uevent(data):
+    """Split a kernel uevent into (action, {key: value}); None for udev's own format"""
+    header, *fields = data.split(b'\0')
+    if b'@' not in header:
+        return None
+    env = {}
+    for field in fields:
+        key, sep, value = field.partition(b'=')
+        if sep:
+            env[key.decode(errors='replace')] = value.decode(errors='replace')
+    return env.get('ACTION', header.partition(b'@')[0].decode(errors='replace')), env
+
+
+def format_uevent(action, devpath, **env):
+    """A uevent as the kernel sends it, for feeding a UeventSource by hand"""
+    fields = dict(ACTION=action, DEVPATH=devpath, **env)
+    return b'\0'.join([f'{action}@{devpath}'.encode()] +
+                      [f'{key}={value}'.encode() for key, value in fields.items()]) + b'\0'
+
+
+def _is_ours(vid, pid):
+    try:
+        return int(vid, 16) == VID and int(pid, 16) in PIDS
+    except ValueError:
+        return False
+
+
+def is_mouse_event(env):
+    """Whether a uevent is about the receiver or the wired mouse"""
+    # USB devices and interfaces: PRODUCT=1d57/fa60/100
+    vid, _, rest = env.get('PRODUCT', '').partition('/')
+    if _is_ours(vid, rest.partition('/')[0]):
+        return True
+    # HID devices: HID_ID=0003:00001D57:0000FA60
+    fields = env.get('HID_ID', '').split(':')
+    return len(fields) == 3 and _is_ours(fields[1], fields[2])
+
+
+def device_of(env):
+    """Id of the USB device a uevent belongs to, from its DEVPATH; None if there is none"""
+    names = [part for part in env.get('DEVPATH', '').split('/') if USB_DEVICE.fullmatch(part)]
+    return names[-1] if names else None
+
+
+def mouse_present(sysfs='/sys', device=None):
+    """Whether the receiver or the wired mouse (the one at `device`, if given) is plugged in"""
+    return any(device is None or found.id == device for found in list_devices(sysfs))
+
+
+def open_uevent_socket():
+    """Subscribe to the kernel's uevents; raises OSError where netlink isn't available"""
+    try:
+        sock = socket.socket(socket.AF_NETLINK, socket.SOCK_DGRAM, NETLINK_KOBJECT_UEVENT)
+    except AttributeError:
+        raise OSError("Netlink sockets are not available") from None
+    try:
+        sock.bind((0, KERNEL_GROUP))
+    except OSError:
+        sock.close()
+        raise
+    return sock
+
+
+class UeventSource:
+    """('add' or 'remove', device id) events of the mouse, from the kernel or any socket speaking its format"""
+
+    def __init__(self, sock=None):
+        self.sock = sock if sock is not None else open_uevent_socket()
+        self.sock.setblocking(False)
+        self.closed = False
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def events(self):
+        events = []
+        while True:
+            try:
+                data = self.sock.recv(65536)
+            except BlockingIOError:
+                return events
+            if not data:
+                self.closed = True
+                return events
+            parsed = parse_uevent(data)
+            if parsed is None:
+                continue
+            action, env = parsed
+            if action in ('add', 'remove') and is_mouse_event(env):
+                events.append((action, device_of(env)))
+
+    def close(self):
+        self.sock.close()
+
+
+class LogindSource:
+    """('sleep' or 'resume', None) events from lines printed by gdbus monitor
+
+    Without `fd`, gdbus is started on the system bus.
+    """
+
+    def __init__(self, fd=None):
+        self.process = None
+        if fd is None:
+            self.process = subprocess.Popen(LOGIND_MONITOR, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+            fd = self.process.stdout.fileno()
+        self.fd = fd
+        fcntl.fcntl(fd, fcntl.F_SETFL, fcntl.fcntl(fd, fcntl.F_GETFL) | os.O_NONBLOCK)
+        self.buffer = b''
+        self.closed = False
+
+    def fileno(self):
+        return self.fd
+
+    def events(self):
+        while True:
+            try:
+                data = os.read(self.fd, 4096)
+            except BlockingIOError:
+                break
+            if not data:
+                self.closed = True
+                break
+            self.buffer += data
+        *lines, self.buffer = self.buffer.split(b'\n')
+        events = []
+        for line in lines:
+            # /org/freedesktop/login1: org.freedesktop.login1.Manager.PrepareForSleep (true,)
+            if b'.PrepareForSleep ' in line:
+                events.append(('sleep' if b'(true' in line else 'resume', None))
+        return events
+
+    def close(self):
+        if self.process is not None:
+            self.process.terminate()
+            self.process.wait()
+            self.process.stdout.close()
+        else:
+            os.close(self.fd)
+
+
+def wanted_settings(applied, profiles, config_store, config_path):
+    """(state, reports) the mouse should hold
+
+    That is `applied`, the state last applied to it, if known; else the
+    active profile's, else the config file's.
+    """
+    if applied is not None:
+        return applied, tuple(encode_reports(applied, REPORT_GROUPS, config_path))
+    profiles.reload()
+    if profiles.active is not None:
+        profile = profiles.get(profiles.active)
+        return profile.state, profile.reports
+    config = config_store.load(config_path)
+    return config.state, tuple(encode_reports(config.state, REPORT_GROUPS, config_path))
+
+
+class Reapplier:
+    """Sends the wanted settings once a burst of events settled, if the cached state can't be trusted
+
+    `connect` opens a transport; one is opened per reapply, since an
+    open hidraw or libusb handle doesn't survive unplugging. wanted(applied)
+    returns the (state, reports) to send, given the state last seen in the
+    cache for the mouse, or None. With `device` only the R1 with that id is
+    watched for (see attack_shark_r1.devices). on_reapplied(state) is
+    called after each reapply.
+    """
+
+    def __init__(self, applied_states, connect, wanted, settle=1.0, sysfs='/sys', timeout=None, device=None):
+        self.applied_states = applied_states
+        self.device = device
+        self.connect = connect
+        self.wanted = wanted
+        self.settle = settle
+        self.sysfs = sysfs
+        self.timeout = timeout
+        self.changed_at = None      # wall clock time of the latest event
+        self.due_at = None          # monotonic time the burst counts as settled
+        # Last cached state seen per key, kept when a failed apply drops the entry
+        self.last_applied = {}
+        self.on_reapplied = None
+
+    def note(self, kind, device=None, now=None):
+        """Record an event of the R1 `device` (None: any or unknown); returns whether a check is due
+
+        'add' and 'resume' push the check back by `settle` seconds, 'sleep'
+        cancels it, and 'remove' or another R1's events change nothing.
+        """
+        if self.device is not None and device is not None and device != self.device:
+            return self.due_at is not None
+        if kind == 'sleep':
+            self.due_at = None
+        elif kind in REAPPLY_EVENTS:
+            now = time.monotonic() if now is None else now
+            self.changed_at = time.time()
+            self.due_at = now + self.settle
+        return self.due_at is not None
+
+    def defer(self, seconds, now=None):
+        now = time.monotonic() if now is None else now
+        self.due_at = now + seconds
+
+    def key(self):
+        # Resolved when needed, the first found R1 is keyed by its id (see devices.state_key)
+        return state_key(self.device, self.sysfs)
+
+    def stale(self):
+        """Whether the mouse's cached state is unknown or was put before the latest event"""
+        self.applied_states.reload()
+        key = self.key()
+        applied = self.applied_states.get(key)
+        if applied is None:
+            return True
+        self.last_applied[key] = applied
+        written_at = self.applied_states.written_at(key)
+        return self.changed_at is not None and (written_at is None or written_at < self.changed_at)
+
+    def check(self, now=None):
+        """Reapply if due and needed; returns seconds until the next check, or None"""
+        now = time.monotonic() if now is None else now
+        if self.due_at is not None and now < self.due_at:
+            return self.due_at - now
+        self.due_at = None
+        # Unplugged or gone to sleep: the next add or resume brings us back
+        if not mouse_present(self.sysfs, self.device) or not self.stale():
+            return None
+        self.reapply()
+        return None
+
+    def reapply(self):
+        key = self.key()
+        state, reports = self.wanted(self.last_applied.get(key))
+        transport = self.connect()
+        try:
+            with logged('send', transport):
+                transport.send_reports(reports, self.timeout)
+        except Exception:
+            # Some reports may have gone out, the device state is unknown now
+            self.applied_states.forget(key)
+            raise
+        finally:
+            transport.close()
+        self.applied_states.put(key, state)
+        if self.on_reapplied is not None:
+            self.on_reapplied(state)
+
+
+def run(reapplier, sources, on_error=None):
+    """Follow the sources until all of them closed and nothing is due
+
+    on_error(error) is called for each failed reapply, which is retried
+    after RETRY_INTERVAL seconds.
+    """
+    poller = select.poll()
+    by_fd = {}
+    for source in sources:
+        poller.register(source, select.POLLIN)
+        by_fd[source.fileno()] = source
+
+    # The mouse may have been plugged in while nobody was watching
+    due = 0
+    while by_fd or due is not None:
+        if due is not None:
+            try:
+                due = reapplier.check()
+            except (ProfileError, TransportError, OSError) as e:
+                if on_error is not None:
+                    on_error(e)
+                reapplier.defer(RETRY_INTERVAL)
+                due = RETRY_INTERVAL
+        if not by_fd:
+            if due is not None:
+                time.sleep(due)
+            continue
+        for fd, _ in poller.poll(None if due is None else due * 1000):
+            source = by_fd[fd]
+            for kind, device in source.events():
+                if reapplier.note(kind, device):
+                    due = reapplier.settle
+                elif kind == 'sleep':
+                    due = None
+            if source.closed:
+                poller.unregister(fd)
+                del by_fd[fd]
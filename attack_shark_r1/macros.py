@@ -0,0 +1,372 @@
+"""
+Macros: key and button sequences played back through /dev/uinput
+
+A macro is a line of comma separated steps, kept as [macro:NAME]
+sections of the config file next to the settings:
+
+    [macro:copy-paste]
+    steps = KEY_LEFTCTRL down, KEY_C, 50ms, KEY_V, KEY_LEFTCTRL up
+    repeat = 1
+
+A step is a key or button name from linux/input-event-codes.h, optionally
+followed by "down" or "up" (alone it is a tap: down, TAP_MS, up), or a
+delay like "50ms". Keys still held at the end are released.
+
+compile_macro() turns the steps into a CompiledMacro: the time of every
+distinct moment and one buffer holding the packed input events (each
+followed by a SYN_REPORT) to write at each of them, so playing costs one
+write per moment. play() sleeps until shortly before each moment on the
+monotonic clock and spins the rest of the way, which keeps the timing
+within a fraction of a millisecond under load. realtime() raises the
+calling thread to SCHED_FIFO where allowed; playback asks for it by
+default, since with every CPU busy only SCHED_FIFO keeps it from waiting
+out other processes' time slices. On the main thread the garbage collector
+is paused while playing; it is process wide, so other threads leave it be.
+
+Macros are played through a UinputSink, a virtual input device, or into a
+MockSink that records when each write happened, for tests and
+benchmarks/bench_macro_jitter.py. Recording reads EV_KEY events from an
+evdev node (record()).
+"""
+
+import fcntl
+import gc
+import os
+import re
+import select
+import struct
+import threading
+import time
+from array import array
+from collections import namedtuple
+
+from .errors import R1Error
+
+EV_SYN = 0
+EV_KEY = 1
+EV_REL = 2
+SYN_REPORT = 0
+REL_X = 0
+REL_Y = 1
+
+# struct input_event on 64-bit; uinput ignores the time and stamps events itself
+EVENT = struct.Struct('<qqHHi')
+
+SECTION_PREFIX = 'macro:'
+
+TAP_MS = 15
+
+# Time before a moment spent spinning instead of sleeping
+SPIN_NS = 1_500_000
+
+# linux/uinput.h
+UI_DEV_CREATE = 0x5501
+UI_DEV_DESTROY = 0x5502
+UI_DEV_SETUP = 0x405c5503
+UI_SET_EVBIT = 0x40045564
+UI_SET_KEYBIT = 0x40045565
+UI_SET_RELBIT = 0x40045566
+# struct uinput_setup: struct input_id, name[80], ff_effects_max
+UINPUT_SETUP = struct.Struct('<HHHH80sI')
+BUS_VIRTUAL = 0x06
+
+
+def _key_codes():
+    codes = {'KEY_ESC': 1, 'KEY_MINUS': 12, 'KEY_EQUAL': 13, 'KEY_BACKSPACE': 14, 'KEY_TAB': 15,
+             'KEY_LEFTBRACE': 26, 'KEY_RIGHTBRACE': 27, 'KEY_ENTER': 28, 'KEY_LEFTCTRL': 29,
+             'KEY_SEMICOLON': 39, 'KEY_APOSTROPHE': 40, 'KEY_GRAVE': 41, 'KEY_LEFTSHIFT': 42,
+             'KEY_BACKSLASH': 43, 'KEY_COMMA': 51, 'KEY_DOT': 52, 'KEY_SLASH': 53, 'KEY_RIGHTSHIFT': 54,
+             'KEY_LEFTALT': 56, 'KEY_SPACE': 57, 'KEY_CAPSLOCK': 58, 'KEY_F11': 87, 'KEY_F12': 88,
+             'KEY_RIGHTCTRL': 97, 'KEY_RIGHTALT': 100, 'KEY_HOME': 102, 'KEY_UP': 103, 'KEY_PAGEUP': 104,
+             'KEY_LEFT': 105, 'KEY_RIGHT': 106, 'KEY_END': 107, 'KEY_DOWN': 108, 'KEY_PAGEDOWN': 109,
+             'KEY_INSERT': 110, 'KEY_DELETE': 111, 'KEY_MUTE': 113, 'KEY_VOLUMEDOWN': 114,
+             'KEY_VOLUMEUP': 115, 'KEY_LEFTMETA': 125, 'KEY_RIGHTMETA': 126,
+             'BTN_LEFT': 0x110, 'BTN_RIGHT': 0x111, 'BTN_MIDDLE': 0x112, 'BTN_SIDE': 0x113,
+             'BTN_EXTRA': 0x114, 'BTN_FORWARD': 0x115, 'BTN_BACK': 0x116}
+    for i, digit in enumerate('1234567890'):
+        codes[f'KEY_{digit}'] = 2 + i
+    for row, first in (('QWERTYUIOP', 16), ('ASDFGHJKL', 30), ('ZXCVBNM', 44)):
+        for i, letter in enumerate(row):
+            codes[f'KEY_{letter}'] = first + i
+    for i in range(10):
+        codes[f'KEY_F{i + 1}'] = 59 + i
+    return codes
+
+
+KEY_CODES = _key_codes()
+KEY_NAMES = {code: name for name, code in KEY_CODES.items()}
+
+Macro = namedtuple('Macro', ['name', 'steps', 'repeat'])
+
+# times: ns after the start per moment; data[offsets[i]:offsets[i + 1]] is written at times[i]
+CompiledMacro = namedtuple('CompiledMacro', ['times', 'offsets', 'data', 'codes'])
+
+
+class MacroError(R1Error):
+    """Raised for macros that don't parse, aren't defined, or can't be played"""
+
+
+def parse_steps(text):
+    """[(code, value)] for key steps and [(None, ns)] for delays, from a steps line"""
+    steps = []
+    for part in text.split(','):
+        words = part.split()
+        if not words:
+            continue
+        delay = re.fullmatch(r'(\d+(?:\.\d+)?)ms', words[0])
+        if delay and len(words) == 1:
+            steps.append((None, int(float(delay.group(1)) * 1_000_000)))
+            continue
+        name = words[0].upper()
+        code = KEY_CODES.get(name)
+        if code is None and re.fullmatch(r'(KEY|BTN)_\d+', name):
+            code = int(name.partition('_')[2])
+        if code is None:
+            raise MacroError(f"Unknown key {words[0]!r}")
+        action = words[1].lower() if len(words) > 1 else 'tap'
+        if len(words) > 2 or action not in ('down', 'up', 'tap'):
+            raise MacroError(f"Expected down, up or tap after {words[0]}, got {' '.join(words[1:])!r}")
+        if action == 'tap':
+            steps += [(code, 1), (None, TAP_MS * 1_000_000), (code, 0)]
+        else:
+            steps.append((code, 1 if action == 'down' else 0))
+    if not steps:
+        raise MacroError("A macro needs at least one step")
+    return steps
+
+
+def compile_macro(steps, repeat=1):
+    """Compile a steps line into a CompiledMacro"""
+    if repeat < 1:
+        raise MacroError("repeat must be at least 1")
+    parsed = parse_steps(steps)
+    times = array('q')
+    offsets = array('I', [0])
+    data = bytearray()
+    held = set()
+    codes = set()
+    now = 0
+
+    def press(code, value):
+        if not times or times[-1] != now:
+            if times:
+                offsets.append(len(data))
+            times.append(now)
+        data.extend(EVENT.pack(0, 0, EV_KEY, code, value))
+        data.extend(EVENT.pack(0, 0, EV_SYN, SYN_REPORT, 0))
+
+    for _ in range(repeat):
+        for code, value in parsed:
+            if code is None:
+                now += value
+                continue
+            press(code, value)
+            codes.add(code)
+            (held.add if value else held.discard)(code)
+    # Never leave a key stuck down
+    for code in sorted(held):
+        press(code, 0)
+    offsets.append(len(data))
+    return CompiledMacro(times, offsets, bytes(data), frozenset(codes))
+
+
+def describe(macro):
+    """Readable events of a CompiledMacro, one line per moment"""
+    lines = []
+    for i, moment in enumerate(macro.times):
+        frame = macro.data[macro.offsets[i]:macro.offsets[i + 1]]
+        keys = []
+        for _, _, kind, code, value in EVENT.iter_unpack(frame):
+            if kind == EV_KEY:
+                keys.append(f"{KEY_NAMES.get(code, code)} {'down' if value else 'up'}")
+        lines.append(f"{moment / 1e6:9.3f} ms  {', '.join(keys)}")
+    return '\n'.join(lines)
+
+
+def macros_from_sections(sections):
+    """{name: Macro} from the [macro:NAME] sections of a parsed INI file"""
+    macros = {}
+    for section, values in sections.items():
+        if not section.startswith(SECTION_PREFIX):
+            continue
+        name = section[len(SECTION_PREFIX):].strip()
+        try:
+            repeat = int(values.get('repeat', '1'))
+        except ValueError:
+            repeat = 1
+        macros[name] = Macro(name, values.get('steps', ''), repeat)
+    return macros
+
+
+def render_macros(macros):
+    """INI lines of the [macro:NAME] sections"""
+    lines = []
+    for macro in macros.values():
+        lines += ["", f"[{SECTION_PREFIX}{macro.name}]", f"steps = {macro.steps}"]
+        if macro.repeat != 1:
+            lines.append(f"repeat = {macro.repeat}")
+    return lines
+
+
+def realtime(priority=10):
+    """Put the calling thread under SCHED_FIFO; False where that isn't permitted"""
+    try:
+        os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(priority))
+    except (AttributeError, OSError):
+        return False
+    return True
+
+
+def play(macro, sink, lateness=None, clock=time.monotonic_ns, spin_ns=SPIN_NS, should_stop=None):
+    """Write every moment of a CompiledMacro to `sink` on time; returns the worst lateness in ns
+
+    `lateness`, a preallocated array('q') with room for every moment, gets
+    how late each write was. should_stop() is checked between moments.
+    """
+    times, offsets = macro.times, macro.offsets
+    view = memoryview(macro.data)
+    write = sink.write
+    worst = 0
+    # Pausing the collector would pause it for every thread, e.g. the GUI's
+    collecting = gc.isenabled() and threading.current_thread() is threading.main_thread()
+    if collecting:
+        gc.disable()
+    try:
+        start = clock()
+        for i in range(len(times)):
+            target = start + times[i]
+            remaining = target - clock()
+            if remaining > spin_ns:
+                if should_stop is not None and should_stop():
+                    break
+                time.sleep((remaining - spin_ns) / 1e9)
+            while clock() < target:
+                pass
+            write(view[offsets[i]:offsets[i + 1]])
+            late = clock() - target
+            if lateness is not None:
+                lateness[i] = late
+            worst = max(worst, late)
+    finally:
+        if collecting:
+            gc.enable()
+    return worst
+
+
+class UinputSink:
+    """A virtual input device that can send the keys and buttons in `codes`"""
+
+    def __init__(self, codes, name="Attack Shark R1 macros", path='/dev/uinput', settle=0.2):
+        try:
+            self.fd = os.open(path, os.O_WRONLY | os.O_NONBLOCK)
+        except OSError as e:
+            raise MacroError(f"Cannot open {path}: {e.strerror}") from None
+        try:
+            fcntl.ioctl(self.fd, UI_SET_EVBIT, EV_KEY)
+            for code in sorted(codes):
+                fcntl.ioctl(self.fd, UI_SET_KEYBIT, code)
+            if any(code >= KEY_CODES['BTN_LEFT'] for code in codes):
+                # Buttons alone don't make a pointer, desktops want some motion axes too
+                fcntl.ioctl(self.fd, UI_SET_EVBIT, EV_REL)
+                fcntl.ioctl(self.fd, UI_SET_RELBIT, REL_X)
+                fcntl.ioctl(self.fd, UI_SET_RELBIT, REL_Y)
+            fcntl.ioctl(self.fd, UI_DEV_SETUP, UINPUT_SETUP.pack(BUS_VIRTUAL, 0x1d57, 0, 1, name.encode()[:79], 0))
+            fcntl.ioctl(self.fd, UI_DEV_CREATE)
+        except OSError as e:
+            os.close(self.fd)
+            raise MacroError(f"Cannot create the uinput device: {e.strerror}") from None
+        # Give udev and the desktop time to pick the new device up
+        time.sleep(settle)
+
+    def write(self, data):
+        os.write(self.fd, data)
+
+    def close(self):
+        if self.fd is not None:
+            try:
+                fcntl.ioctl(self.fd, UI_DEV_DESTROY)
+            finally:
+                os.close(self.fd)
+                self.fd = None
+
+
+class MockSink:
+    """Records when each write happened and what it held, in preallocated arrays"""
+
+    def __init__(self, capacity=4096, clock=time.monotonic_ns):
+        self.clock = clock
+        self.times = array('q', bytes(8 * capacity))
+        self.data = []
+        self.count = 0
+
+    def write(self, data):
+        self.times[self.count] = self.clock()
+        self.count += 1
+        self.data.append(bytes(data))
+
+    def events(self):
+        """(type, code, value) of everything written"""
+        return [(kind, code, value) for data in self.data for _, _, kind, code, value in EVENT.iter_unpack(data)]
+
+    def close(self):
+        pass
+
+
+def record(path, duration, should_stop=None, keep_rest_ms=1):
+    """A steps line from the key and button events of the evdev node at `path`
+
+    Delays shorter than `keep_rest_ms` are dropped, and a press followed by
+    its release with nothing in between is written as a tap when it took
+    about TAP_MS.
+    """
+    try:
+        fd = os.open(path, os.O_RDONLY | os.O_NONBLOCK)
+    except OSError as e:
+        raise MacroError(f"Cannot open {path}: {e.strerror}") from None
+    presses = []
+    pending = b''
+    end = time.monotonic() + duration
+    try:
+        while True:
+            left = end - time.monotonic()
+            if left <= 0 or (should_stop is not None and should_stop()):
+                break
+            readable, _, _ = select.select([fd], [], [], min(left, 0.25))
+            if not readable:
+                continue
+            try:
+                data = pending + os.read(fd, EVENT.size * 64)
+            except BlockingIOError:
+                continue
+            whole = len(data) - len(data) % EVENT.size
+            pending = data[whole:]
+            for sec, usec, kind, code, value in EVENT.iter_unpack(data[:whole]):
+                # 2 is autorepeat
+                if kind == EV_KEY and value in (0, 1):
+                    presses.append((sec * 1_000_000_000 + usec * 1000, code, value))
+    finally:
+        os.close(fd)
+    return steps_from_presses(presses, keep_rest_ms)
+
+
+def steps_from_presses(presses, keep_rest_ms=1):
+    """A steps line from [(time in ns, code, value)]"""
+    steps = []
+    i = 0
+    last = None
+    while i < len(presses):
+        moment, code, value = presses[i]
+        if last is not None and moment - last >= keep_rest_ms * 1_000_000:
+            steps.append(f"{round((moment - last) / 1e6)}ms")
+        name = KEY_NAMES.get(code, f"KEY_{code}")
+        following = presses[i + 1] if i + 1 < len(presses) else None
+        if (value == 1 and following is not None and following[1:] == (code, 0) and
+                abs(following[0] - moment - TAP_MS * 1_000_000) < 5_000_000):
+            steps.append(name)
+            last = following[0]
+            i += 2
+            continue
+        steps.append(f"{name} {'down' if value else 'up'}")
+        last = moment
+        i += 1
+    return ', '.join(steps)
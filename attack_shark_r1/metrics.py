@@ -0,0 +1,309 @@
+"""
+Mouse health metrics for scraping: battery, apply timings, ack retries and errors
+
+The exporter never talks to the mouse. It follows what the processes that
+do already write: the battery history ring (attack_shark_r1.battery) and
+the apply trace log (attack_shark_r1.trace, written by every apply path).
+Each refresh reads only the trace records appended since the last one and
+folds them into counters and histograms allocated up front, so a scrape
+costs a stat, maybe a short read, and formatting the numbers.
+
+Metrics are served as OpenMetrics (or Prometheus text) over HTTP on
+localhost, or written to a node-exporter textfile collector directory:
+
+    python3 -m attack_shark_r1 metrics serve --port 9469
+    python3 -m attack_shark_r1 metrics textfile /var/lib/node_exporter/textfile
+"""
+
+import json
+import os
+import re
+import threading
+from array import array
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from .battery import BatteryHistory, default_history_path
+from .trace import default_log_path
+
+OPERATIONS = ('apply', 'send', 'apply-all', 'query')
+
+# Phases of a trace, plus what the caller measures around them
+PHASES = ('queued', 'overhead', 'config', 'init', 'open', 'detach', 'claim', 'report', 'charge', 'attach')
+
+# Error names the driver prints: CfgErr, libusb.Error and AckErr in main.odin
+CONFIG_ERRORS = (
+    'PollRateNotProvided', 'DpiValuesNotProvided', 'ActiveDpiNotProvided', 'InvalidActiveDpiValue',
+    'InvalidPollRate', 'InvalidDpiValue', 'NotEnoughDpiValues', 'TooMuchDpiValues',
+    'SleepTimeNotProvided', 'InvalidSleepTime', 'DeepSleepTimeNotProvided', 'InvalidDeepSleepTime',
+    'KeyRespTimeNotProvided', 'InvalidKeyRespTime', 'AngleSnapNotProvided', 'InvalidAngleSnap',
+    'RippleControlNotProvided', 'InvalidRippleControl', 'InvalidReport',
+)
+LIBUSB_ERRORS = (
+    'IO', 'INVALID_PARAM', 'ACCESS', 'NO_DEVICE', 'NOT_FOUND', 'BUSY', 'TIMEOUT', 'OVERFLOW',
+    'PIPE', 'INTERRUPTED', 'NO_MEM', 'NOT_SUPPORTED', 'OTHER',
+)
+ERROR_KINDS = ([(name, 'config') for name in CONFIG_ERRORS] + [(name, 'libusb') for name in LIBUSB_ERRORS] +
+               [('DeviceUnreachable', 'ack'), ('other', 'other')])
+ERROR_INDEX = {name: i for i, (name, _) in enumerate(ERROR_KINDS)}
+
+# errno values pyusb reports for the same libusb errors, for the libusb transport
+ERRNO_ERRORS = {5: 'IO', 13: 'ACCESS', 19: 'NO_DEVICE', 2: 'NOT_FOUND', 16: 'BUSY', 110: 'TIMEOUT',
+                75: 'OVERFLOW', 32: 'PIPE', 4: 'INTERRUPTED', 12: 'NO_MEM'}
+
+APPLY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+TRIES_BUCKETS = (1, 2, 3, 4, 5)
+
+TEXTFILE_NAME = 'attack_shark_r1.prom'
+
+OPENMETRICS_TYPE = 'application/openmetrics-text; version=1.0.0; charset=utf-8'
+PROMETHEUS_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def error_kind(message):
+    """The driver error name in an error message, or 'other'"""
+    if 'unreachable' in message.lower():
+        return 'DeviceUnreachable'
+    match = re.search(r'\[Errno (\d+)\]', message)
+    if match and int(match.group(1)) in ERRNO_ERRORS:
+        return ERRNO_ERRORS[int(match.group(1))]
+    for token in re.findall(r'[A-Za-z_]+', message):
+        if token in ERROR_INDEX:
+            return token
+    return 'other'
+
+
+class Histogram:
+    """Cumulative histogram with fixed bucket bounds"""
+
+    def __init__(self, bounds):
+        self.bounds = array('d', bounds)
+        self.counts = array('Q', bytes(8 * (len(bounds) + 1)))
+        self.sum = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.bounds):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.sum += value
+
+    def lines(self, name):
+        total = 0
+        for bound, count in zip(self.bounds, self.counts):
+            total += count
+            yield f'{name}_bucket{{le="{bound!r}"}} {total}'
+        total += self.counts[-1]
+        yield f'{name}_bucket{{le="+Inf"}} {total}'
+        yield f'{name}_sum {self.sum!r}'
+        yield f'{name}_count {total}'
+
+
+class TraceFollower:
+    """Reads the trace records appended to a JSON-lines log since the last read
+
+    The first read skips what is already there, unless `from_start`: the
+    counters of a restarted exporter start over, like any exporter's. When
+    the log was rotated (see attack_shark_r1.trace.TraceLog), the rest of
+    the old one is read from its .1 name before the new one.
+    """
+
+    def __init__(self, path, from_start=False):
+        self.path = path
+        self.offset = 0
+        self.inode = None
+        self.started = from_start
+
+    def read(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            # Whatever gets logged from now on is new
+            self.started = True
+            return []
+        if not self.started:
+            self.started = True
+            self.inode, self.offset = stat.st_ino, stat.st_size
+            return []
+        records = []
+        if stat.st_ino != self.inode:
+            if self.inode is not None:
+                records = self._read_rotated()
+            self.inode, self.offset = stat.st_ino, 0
+        elif stat.st_size < self.offset:
+            # Truncated: start over
+            self.offset = 0
+        return records + self._read_from(self.path, stat.st_size)
+
+    def _read_rotated(self):
+        try:
+            stat = os.stat(self.path + '.1')
+        except FileNotFoundError:
+            return []
+        if stat.st_ino != self.inode:
+            return []
+        return self._read_from(self.path + '.1', stat.st_size)
+
+    def _read_from(self, path, size):
+        if size <= self.offset:
+            return []
+        with open(path, 'rb') as f:
+            f.seek(self.offset)
+            data = f.read(size - self.offset)
+        # A line still being written is picked up next time
+        end = data.rfind(b'\n') + 1
+        self.offset += end
+        records = []
+        for line in data[:end].splitlines():
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                continue
+        return records
+
+
+class Metrics:
+    """Counters and histograms of everything the trace log and battery history tell"""
+
+    def __init__(self, trace_path=None, battery=None, from_start=False):
+        self.follower = TraceFollower(trace_path or default_log_path(), from_start)
+        self.battery = battery
+        self.lock = threading.Lock()
+        self.commands = array('Q', bytes(8 * len(OPERATIONS)))
+        self.failures = array('Q', bytes(8 * len(OPERATIONS)))
+        self.errors = array('Q', bytes(8 * len(ERROR_KINDS)))
+        self.reports = 0
+        self.retries = 0
+        self.apply_seconds = Histogram(APPLY_BUCKETS)
+        self.report_tries = Histogram(TRIES_BUCKETS)
+        # Last apply's time in each phase, and when it happened
+        self.phase_seconds = array('d', bytes(8 * len(PHASES)))
+        self.last_apply = None
+
+    def observe(self, record):
+        """Fold one trace record (see attack_shark_r1.trace.make_record) into the metrics"""
+        try:
+            operation = OPERATIONS.index(record.get('operation'))
+        except ValueError:
+            return
+        self.commands[operation] += 1
+        if record.get('error'):
+            self.failures[operation] += 1
+            self.errors[ERROR_INDEX[error_kind(record['error'])]] += 1
+        if OPERATIONS[operation] == 'query':
+            return
+
+        self.apply_seconds.observe(record.get('elapsed_us', 0) / 1e6)
+        phases = self.phase_seconds
+        for i in range(len(phases)):
+            phases[i] = 0.0
+        phases[PHASES.index('queued')] = record.get('queued_us', 0) / 1e6
+        phases[PHASES.index('overhead')] = record.get('overhead_us', 0) / 1e6
+        for span in record.get('spans', ()):
+            if span.get('phase') in PHASES:
+                phases[PHASES.index(span['phase'])] += span.get('us', 0) / 1e6
+            if span.get('phase') == 'report':
+                tries = max(1, span.get('tries', 1))
+                self.reports += 1
+                self.retries += tries - 1
+                self.report_tries.observe(tries)
+        self.last_apply = record.get('time')
+
+    def refresh(self):
+        """Take in what was logged since the last refresh"""
+        with self.lock:
+            for record in self.follower.read():
+                self.observe(record)
+            if self.battery is not None:
+                self.battery.reload()
+
+    def render(self, openmetrics=True):
+        """The metrics in the OpenMetrics text format, or Prometheus' when not `openmetrics`"""
+        with self.lock:
+            lines = []
+
+            def family(name, kind, help_text):
+                # OpenMetrics names counter families without their _total suffix
+                shown = name[:-len('_total')] if openmetrics and kind == 'counter' else name
+                lines.append(f'# HELP {shown} {help_text}')
+                lines.append(f'# TYPE {shown} {kind}')
+
+            sample = self.battery.last() if self.battery is not None else None
+            if sample is not None:
+                family('r1_battery_percent', 'gauge', "Last battery charge reading")
+                lines.append(f'r1_battery_percent {sample[1]}')
+                family('r1_battery_timestamp_seconds', 'gauge', "Time of the last battery charge reading")
+                lines.append(f'r1_battery_timestamp_seconds {sample[0]}')
+
+            family('r1_commands_total', 'counter', "Commands by operation")
+            for operation, count in zip(OPERATIONS, self.commands):
+                lines.append(f'r1_commands_total{{operation="{operation}"}} {count}')
+            family('r1_command_failures_total', 'counter', "Commands that failed, by operation")
+            for operation, count in zip(OPERATIONS, self.failures):
+                lines.append(f'r1_command_failures_total{{operation="{operation}"}} {count}')
+            family('r1_errors_total', 'counter', "Command errors by driver error name")
+            for (kind, source), count in zip(ERROR_KINDS, self.errors):
+                lines.append(f'r1_errors_total{{kind="{kind}",source="{source}"}} {count}')
+
+            family('r1_apply_seconds', 'histogram', "Time applies took once they left the queue")
+            lines.extend(self.apply_seconds.lines('r1_apply_seconds'))
+            family('r1_last_apply_phase_seconds', 'gauge', "Time the last apply spent in each phase")
+            for phase, seconds in zip(PHASES, self.phase_seconds):
+                lines.append(f'r1_last_apply_phase_seconds{{phase="{phase}"}} {seconds!r}')
+            if self.last_apply is not None:
+                family('r1_last_apply_timestamp_seconds', 'gauge', "Time of the last apply")
+                lines.append(f'r1_last_apply_timestamp_seconds {self.last_apply!r}')
+
+            family('r1_reports_total', 'counter', "Reports sent by applies")
+            lines.append(f'r1_reports_total {self.reports}')
+            family('r1_ack_retries_total', 'counter', "Wireless reports sent again for lack of an ack")
+            lines.append(f'r1_ack_retries_total {self.retries}')
+            family('r1_report_tries', 'histogram', "Sends per report until it was acked")
+            lines.extend(self.report_tries.lines('r1_report_tries'))
+
+            if openmetrics:
+                lines.append('# EOF')
+            return '\n'.join(lines) + '\n'
+
+
+def open_battery(path=None):
+    """The battery history the GUI keeps, or None if there isn't one yet"""
+    path = path or default_history_path()
+    return BatteryHistory(path) if os.path.exists(path) else None
+
+
+def write_textfile(metrics, directory):
+    """Write the metrics for node-exporter's textfile collector, atomically"""
+    path = os.path.join(directory, TEXTFILE_NAME)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        f.write(metrics.render(openmetrics=False))
+    os.replace(tmp_path, path)
+
+
+def serve(metrics, port, host='127.0.0.1'):
+    """Serve the metrics on http://host:port/metrics until interrupted"""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.partition('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            openmetrics = 'application/openmetrics-text' in self.headers.get('Accept', '')
+            metrics.refresh()
+            body = metrics.render(openmetrics).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', OPENMETRICS_TYPE if openmetrics else PROMETHEUS_TYPE)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = HTTPServer((host, port), Handler)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
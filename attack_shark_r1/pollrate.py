@@ -0,0 +1,247 @@
+"""
+Measuring the report rate the mouse actually delivers
+
+Every USB report of the mouse ends in an EV_SYN/SYN_REPORT event on its
+evdev node, stamped by the kernel, so the SYN_REPORT timestamps are the
+report times. They are collected from /dev/input/event* while the mouse
+moves, or from a dump of that stream (`cat /dev/input/eventN > dump`, or
+--record), and analyzed with NumPy: effective rate, jitter against the
+configured period, a histogram of the intervals and the number of
+intervals the mouse skipped.
+
+Reading is done in chunks into one preallocated buffer that NumPy looks
+at in place, and timestamps go into a preallocated array, so nothing is
+allocated per event and a 1000 Hz stream is read long before the
+kernel's buffer fills. If it ever does, the kernel's SYN_DROPPED events
+are counted as overruns.
+
+The mouse only reports while it moves: gaps longer than `idle_gap` are
+pauses, not dropped reports, and are left out.
+
+Needs numpy (python-numpy); events use the 64-bit struct input_event.
+"""
+
+import os
+import select
+import time
+from collections import namedtuple
+
+from .errors import R1Error
+from .transport import PID, VID, WIRED_PID
+
+EV_SYN = 0
+SYN_REPORT = 0
+SYN_DROPPED = 3
+
+# struct input_event on 64-bit: struct timeval, type, code, value
+EVENT_FIELDS = [('sec', '<i8'), ('usec', '<i8'), ('type', '<u2'), ('code', '<u2'), ('value', '<i4')]
+EVENT_SIZE = 24
+
+# Histogram bins per configured period, covering 0 to HISTOGRAM_PERIODS periods
+HISTOGRAM_BINS_PER_PERIOD = 8
+HISTOGRAM_PERIODS = 3
+
+PollRateReport = namedtuple('PollRateReport', [
+    'expected_hz',
+    'effective_hz',
+    'reports',          # SYN_REPORTs seen
+    'intervals',        # intervals counted, i.e. not idle gaps
+    'jitter_mean_us',   # mean and spread of interval minus period
+    'jitter_std_us',
+    'jitter_p99_us',    # 99th percentile of |interval - period|
+    'dropped',          # reports missing from the counted intervals
+    'overruns',         # SYN_DROPPED events: the kernel's buffer overflowed
+    'histogram',        # interval counts per bin, the last one is everything longer
+    'bin_us',           # width of a histogram bin
+])
+
+
+class PollRateError(R1Error):
+    """Raised when there is nothing to measure or NumPy is missing"""
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise PollRateError("Measuring the polling rate needs numpy (python-numpy)") from None
+    return numpy
+
+
+def _event_dtype():
+    return _numpy().dtype(EVENT_FIELDS)
+
+
+def find_event_device(sysfs='/sys'):
+    """The /dev/input node of the R1's pointer, or None"""
+    root = os.path.join(sysfs, 'class', 'input')
+    try:
+        names = sorted(name for name in os.listdir(root) if name.startswith('event'))
+    except OSError:
+        return None
+    for name in names:
+        device = os.path.join(root, name, 'device')
+        try:
+            with open(os.path.join(device, 'id', 'vendor')) as f:
+                vid = int(f.read(), 16)
+            with open(os.path.join(device, 'id', 'product')) as f:
+                pid = int(f.read(), 16)
+            with open(os.path.join(device, 'capabilities', 'rel')) as f:
+                rel = int(f.read().split()[-1], 16)
+        except (OSError, ValueError, IndexError):
+            continue
+        # REL_X: the pointer, not the keyboard interface
+        if vid == VID and pid in (PID, WIRED_PID) and rel & 1:
+            return '/dev/input/' + name
+    return None
+
+
+class EvdevReader:
+    """Collects SYN_REPORT times from an evdev stream into a preallocated array"""
+
+    def __init__(self, fd, capacity=600000, chunk_events=256):
+        np = _numpy()
+        self.np = np
+        self.fd = fd
+        self.dtype = _event_dtype()
+        self.buffer = bytearray(EVENT_SIZE * chunk_events)
+        self.view = memoryview(self.buffer)
+        self.pending = 0            # bytes of an event split across reads
+        self.times = np.empty(capacity, np.float64)
+        self.count = 0
+        self.overruns = 0
+        self.record = None
+
+    def full(self):
+        return self.count == len(self.times)
+
+    def read(self):
+        """Take what the stream has; returns False at its end"""
+        try:
+            n = os.readv(self.fd, [self.view[self.pending:]])
+        except BlockingIOError:
+            return True
+        if n == 0:
+            return False
+        if self.record is not None:
+            self.record.write(self.view[self.pending:self.pending + n])
+        total = self.pending + n
+        whole = total - total % EVENT_SIZE
+        self.add(self.np.frombuffer(self.buffer, self.dtype, count=whole // EVENT_SIZE))
+        self.pending = total - whole
+        if self.pending:
+            self.buffer[:self.pending] = self.buffer[whole:total]
+        return True
+
+    def add(self, events):
+        """Store the report times among `events`, a structured array of input events"""
+        np = self.np
+        syn = events['type'] == EV_SYN
+        self.overruns += int(np.count_nonzero(syn & (events['code'] == SYN_DROPPED)))
+        reports = events[syn & (events['code'] == SYN_REPORT)]
+        n = min(len(reports), len(self.times) - self.count)
+        out = self.times[self.count:self.count + n]
+        np.multiply(reports['usec'][:n], 1e-6, out=out)
+        out += reports['sec'][:n]
+        self.count += n
+
+    def timestamps(self):
+        return self.times[:self.count]
+
+
+def read_dump(path):
+    """(report times, overruns) from a dump of an evdev stream"""
+    np = _numpy()
+    events = np.fromfile(path, dtype=_event_dtype())
+    syn = events['type'] == EV_SYN
+    reports = events[syn & (events['code'] == SYN_REPORT)]
+    times = reports['sec'] + reports['usec'] * 1e-6
+    return times, int(np.count_nonzero(syn & (events['code'] == SYN_DROPPED)))
+
+
+def measure(path, duration, record_path=None, should_stop=None):
+    """Collect report times from the event device at `path` for `duration` seconds
+
+    Returns (report times, overruns). The raw stream is also written to
+    `record_path` if given. `should_stop()` can end the measurement early.
+    """
+    try:
+        fd = os.open(path, os.O_RDONLY | os.O_NONBLOCK)
+    except OSError as e:
+        raise PollRateError(f"Cannot open {path}: {e.strerror}") from None
+    reader = EvdevReader(fd)
+    try:
+        if record_path is not None:
+            reader.record = open(record_path, 'wb')
+        end = time.monotonic() + duration
+        while not reader.full():
+            left = end - time.monotonic()
+            if left <= 0 or (should_stop is not None and should_stop()):
+                break
+            readable, _, _ = select.select([fd], [], [], min(left, 0.25))
+            if readable and not reader.read():
+                break
+        return reader.timestamps().copy(), reader.overruns
+    finally:
+        if reader.record is not None:
+            reader.record.close()
+        os.close(fd)
+
+
+def analyze(times, expected_hz, overruns=0, idle_gap=None):
+    """Turn report times in seconds into a PollRateReport against `expected_hz`"""
+    np = _numpy()
+    times = np.asarray(times, dtype=np.float64)
+    if len(times) < 2:
+        raise PollRateError("Not enough reports: move the mouse while measuring")
+    period = 1 / expected_hz
+    if idle_gap is None:
+        idle_gap = max(10 * period, 0.05)
+
+    intervals = np.diff(times)
+    intervals = intervals[(intervals > 0) & (intervals < idle_gap)]
+    if not len(intervals):
+        raise PollRateError("Not enough reports: move the mouse while measuring")
+
+    jitter_us = (intervals - period) * 1e6
+    # Intervals of about n periods mean n - 1 reports went missing
+    periods = np.rint(intervals / period)
+    dropped = int(np.sum(periods[periods > 1] - 1))
+
+    bin_us = period * 1e6 / HISTOGRAM_BINS_PER_PERIOD
+    bins = np.minimum((intervals * 1e6 / bin_us).astype(np.int64), HISTOGRAM_BINS_PER_PERIOD * HISTOGRAM_PERIODS)
+    histogram = np.bincount(bins, minlength=HISTOGRAM_BINS_PER_PERIOD * HISTOGRAM_PERIODS + 1)
+
+    return PollRateReport(
+        expected_hz=expected_hz,
+        effective_hz=round(len(intervals) / float(np.sum(intervals)), 1),
+        reports=len(times),
+        intervals=len(intervals),
+        jitter_mean_us=round(float(np.mean(jitter_us)), 1),
+        jitter_std_us=round(float(np.std(jitter_us)), 1),
+        jitter_p99_us=round(float(np.percentile(np.abs(jitter_us), 99)), 1),
+        dropped=dropped,
+        overruns=overruns,
+        histogram=[int(count) for count in histogram],
+        bin_us=bin_us,
+    )
+
+
+def summarize(report):
+    """One line for the status bar, e.g. "998.7 Hz of 1000, jitter ±41 us, 2 dropped" """
+    text = (f"{report.effective_hz:g} Hz of {report.expected_hz}, "
+            f"jitter ±{report.jitter_std_us:.0f} us, {report.dropped} dropped")
+    if report.overruns:
+        text += f", {report.overruns} overruns"
+    return text
+
+
+def format_histogram(report, width=40):
+    """Text histogram of the intervals, one line per bin"""
+    peak = max(report.histogram) or 1
+    lines = []
+    for i, count in enumerate(report.histogram):
+        low = i * report.bin_us
+        label = f">{low:7.0f}" if i == len(report.histogram) - 1 else f"{low:8.0f}"
+        lines.append(f"{label} us {count:8d} {'#' * round(count * width / peak)}")
+    return '\n'.join(lines)
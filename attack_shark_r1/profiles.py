@@ -0,0 +1,199 @@
+"""
+Named settings profiles with pre-encoded reports
+
+Every profile keeps its settings together with the three reports they
+encode to, validated when the profile is saved. Switching to a profile
+only sends those bytes: nothing is parsed, validated or turned into
+driver flags on the way. Stored payloads are re-encoded when ENCODING
+changes, i.e. whenever the report encoders would produce other bytes.
+"""
+
+import fcntl
+import json
+import os
+import threading
+from collections import namedtuple
+
+from .errors import R1Error
+from .settings import AppliedState, REPORT_GROUPS, encode_reports
+from .validation import validate
+
+# Bump whenever protocol.encode_* changes its output for the same settings
+ENCODING = 1
+
+# reports is a tuple of (wValue, payload) in the order they are sent
+Profile = namedtuple('Profile', ['name', 'state', 'reports'])
+
+
+class ProfileError(R1Error):
+    """Raised for unknown profiles or settings that can't be stored as one"""
+
+
+def default_profiles_path():
+    config_home = os.environ.get('XDG_CONFIG_HOME') or os.path.expanduser("~/.config")
+    return os.path.join(config_home, "attack-shark", "profiles.json")
+
+
+def encode_profile(name, state):
+    """Validate `state` and encode every report it needs"""
+    problems = validate(state, allow_disabled_dpis=True)
+    if problems:
+        raise ProfileError(f"Profile {name!r}: {problems[0].message}")
+    return Profile(name, state, tuple(encode_reports(state, REPORT_GROUPS)))
+
+
+class ProfileStore:
+    """Profiles and the name of the active one, persisted as JSON
+
+    The file is re-read by reload() only when it changed on disk, so the
+    GUI and the command line can both switch profiles. Changes take an
+    flock on a sibling .lock file and re-read the file before writing it,
+    like attack_shark_r1.settings.AppliedStateCache, so no process drops
+    another's profiles.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or default_profiles_path()
+        self.profiles = {}
+        self.active = None
+        self.stamp = None
+        self.lock = threading.Lock()
+        self.reload()
+
+    def reload(self):
+        """Re-read the file if another process changed it"""
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return
+        stamp = (st.st_mtime_ns, st.st_size)
+        with self.lock:
+            if stamp == self.stamp:
+                return
+            self.stamp = stamp
+            self._read()
+
+    def _update(self, change):
+        """Apply change() to the profiles on disk, under the file lock; returns what it returned"""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with self.lock, open(self.path + '.lock', 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            self.profiles, self.active = {}, None
+            self._read()
+            result = change()
+            self._write()
+            return result
+
+    def _read(self):
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+
+        profiles = {}
+        stale = False
+        for name, entry in data.get('profiles', {}).items():
+            try:
+                settings = entry['settings']
+                state = AppliedState(**dict(settings, dpis=tuple(settings['dpis'])))
+                if entry.get('encoding') == ENCODING:
+                    reports = tuple((int(report_id, 16), bytes.fromhex(payload))
+                                    for report_id, payload in entry['reports'])
+                    profiles[name] = Profile(name, state, reports)
+                else:
+                    profiles[name] = encode_profile(name, state)
+                    stale = True
+            except (KeyError, TypeError, ValueError, ProfileError):
+                continue
+        self.profiles = profiles
+        self.active = data.get('active') if data.get('active') in profiles else None
+
+        if stale:
+            try:
+                self._write()
+            except OSError:
+                pass
+
+    def _write(self):
+        data = {
+            'active': self.active,
+            'profiles': {
+                profile.name: {
+                    'settings': profile.state._asdict(),
+                    'encoding': ENCODING,
+                    'reports': [[f'{report_id:#x}', payload.hex()] for report_id, payload in profile.reports],
+                }
+                for profile in self.profiles.values()
+            },
+        }
+        # Imported here, it costs more than the rest of the command line's startup
+        import tempfile
+
+        directory = os.path.dirname(self.path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix='.profiles-', suffix='.tmp', dir=directory)
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(data, f, indent=2)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        st = os.stat(self.path)
+        self.stamp = (st.st_mtime_ns, st.st_size)
+
+    def names(self):
+        return sorted(self.profiles)
+
+    def get(self, name):
+        try:
+            return self.profiles[name]
+        except KeyError:
+            raise ProfileError(f"No profile named {name!r}") from None
+
+    def save(self, name, state):
+        """Store `state` as profile `name`, replacing an existing one"""
+        name = name.strip()
+        if not name:
+            raise ProfileError("Profile name is empty")
+        profile = encode_profile(name, state)
+
+        def change():
+            self.profiles[name] = profile
+            return profile
+        return self._update(change)
+
+    def delete(self, name):
+        def change():
+            self.get(name)
+            del self.profiles[name]
+            if self.active == name:
+                self.active = None
+        self._update(change)
+
+    def set_active(self, name):
+        if self.active == name and name in self.profiles:
+            return
+
+        def change():
+            self.get(name)
+            self.active = name
+        self._update(change)
+
+    def next_name(self):
+        """Name of the profile after the active one, wrapping around"""
+        names = self.names()
+        if not names:
+            raise ProfileError("No profiles saved")
+        if self.active not in names:
+            return names[0]
+        return names[(names.index(self.active) + 1) % len(names)]
+
+
+def switch_profile(store, name, transport, timeout=None):
+    """Send a profile's stored reports through `transport` and make it the active one"""
+    profile = store.get(name)
+    transport.send_reports(profile.reports, timeout)
+    store.set_active(name)
+    return profile
@@ -0,0 +1,200 @@
+"""
+Attack Shark R1 HID report encoding
+
+Builds byte-for-byte the same feature reports as set_dpis, set_times and
+set_polling_rate in main.odin, so reports can be pre-encoded, compared and
+validated without running the driver. The decoders turn captured reports
+back into settings.
+"""
+
+from array import array
+
+# wValue of the SET_REPORT control transfer for each report
+REPORT_DPI = 0x304
+REPORT_TIMES = 0x305
+REPORT_POLLING = 0x306
+
+DPI_MIN = 100
+DPI_MAX = 18000
+DPI_STEP = 100
+
+# Device code of every DPI step, indexed by dpi // 100 - 1 (the dpis table in dpi.odin)
+DPI_CODES = array('B', bytes.fromhex(
+    "02 04 06 09 0b 0e 10 12 15 17"  # 100-1000
+    "19 1c 1e 20 23 25 27 2a 2c 2f"  # 1100-2000
+    "31 33 36 38 3a 3d 3f 41 44 46"  # 2100-3000
+    "48 4b 4d 4f 52 54 57 59 5b 5e"  # 3100-4000
+    "60 62 65 67 69 6c 6e 70 73 75"  # 4100-5000
+    "77 7a 7c 7f 81 83 86 88 8a 8d"  # 5100-6000
+    "8f 91 94 96 98 9b 9d 9f a2 a4"  # 6100-7000
+    "a7 a9 ab ae b0 b2 b5 b7 b9 bc"  # 7100-8000
+    "be c0 c3 c5 c7 ca cc cf d1 d3"  # 8100-9000
+    "d6 d8 da dd df e1 e4 e6 e8 eb"  # 9100-10000
+    "76 77 79 7a 7b 7c 7d 7f 80 81"  # 10100-11000, high range flag set
+    "82 83 84 86 87 88 89 8a 8b 8d"  # 11100-12000, high range flag set
+    "8e 8f 90 91 93 94 95 96 97 98"  # 12100-13000, >12K bit set
+    "9a 9b 9c 9d 9e 9f a1 a2 a3 a4"  # 13100-14000, >12K bit set
+    "a5 a7 a8 a9 aa ab ac ae af b0"  # 14100-15000, >12K bit set
+    "b1 b2 b3 b5 b6 b7 b8 b9 bb bc"  # 15100-16000, >12K bit set
+    "bd be bf c0 c2 c3 c4 c5 c6 c7"  # 16100-17000, >12K bit set
+    "c9 ca cb cc cd cf d0 d1 d2 d3"  # 17100-18000, >12K bit set
+))
+
+# 1 for the steps that need the per-slot high range flag (10100-12000)
+DPI_HIGH_RANGE = array('B', [1 if 10100 <= (i + 1) * DPI_STEP <= 12000 else 0 for i in range(len(DPI_CODES))])
+
+# PollingRate enum in main.odin, sent little-endian
+POLLING_CODES = {
+    125: 0xf708,
+    250: 0xfb04,
+    500: 0xfd02,
+    1000: 0xfe01,
+}
+
+DPI_TEMPLATE = bytes.fromhex(
+    "04 38 01 00 00 3f 00 00 02 02 02 02 02 02 00 00"
+    "00 00 00 00 00 00 00 00 01 ff 00 00 00 ff 00 00"
+    "00 ff ff ff 00 00 ff ff ff 00 ff ff 40 00 ff ff"
+    "ff 02 0d 75 00 00 00 00"
+)
+TIMES_TEMPLATE = bytes.fromhex("05 0f 01 00 03 18 00 00 ff 04 02 01 20 00 00")
+POLLING_TEMPLATE = bytes.fromhex("06 09 01 01 00 00 00 00 00")
+
+DPI_CHECKSUM_BASE = 0x0d75
+
+ACK = 0x50
+
+
+def dpi_index(dpi):
+    """Return the DPI_CODES index of a DPI value, raising ValueError if the driver would reject it"""
+    if dpi < DPI_MIN or dpi > DPI_MAX or dpi % DPI_STEP != 0:
+        raise ValueError(f"Invalid DPI value {dpi}: must be a multiple of 100 in [100; 18000]")
+    return dpi // DPI_STEP - 1
+
+
+def encode_dpi_report(dpis, active_dpi, ripple_control=False, angle_snap=False):
+    """Build the 56-byte DPI report (0x304) for six DPI slots"""
+    if len(dpis) != 6:
+        raise ValueError(f"Expected 6 DPI values, got {len(dpis)}")
+    if active_dpi < 1 or active_dpi > 6:
+        raise ValueError(f"Invalid active DPI slot {active_dpi}: must be in [1; 6]")
+
+    payload = bytearray(DPI_TEMPLATE)
+    checksum = DPI_CHECKSUM_BASE
+    bigger_than_12k = 0
+    for i, dpi in enumerate(dpis):
+        index = dpi_index(dpi)
+        code = DPI_CODES[index]
+        high = DPI_HIGH_RANGE[index]
+        payload[8 + i] = code
+        payload[16 + i] = high
+        checksum += code + high
+        if dpi > 12000:
+            bigger_than_12k |= 1 << i
+
+    payload[6] = bigger_than_12k
+    payload[7] = bigger_than_12k
+    checksum += bigger_than_12k * 2
+    payload[24] = active_dpi
+    checksum += active_dpi - 1
+
+    if ripple_control:
+        checksum += 1
+        payload[4] = 1
+    if angle_snap:
+        checksum += 1
+        payload[3] = 1
+
+    checksum &= 0xffff
+    payload[50] = checksum >> 8
+    payload[51] = checksum & 0xff
+    return bytes(payload)
+
+
+def encode_times_report(sleep_time, deep_sleep_time, key_response_time):
+    """Build the 15-byte sleep/deep sleep/key response time report (0x305)"""
+    if sleep_time < 0.5 or sleep_time > 30:
+        raise ValueError(f"Invalid sleep time {sleep_time}: must be in [0.5; 30]")
+    if deep_sleep_time < 1 or deep_sleep_time > 60:
+        raise ValueError(f"Invalid deep sleep time {deep_sleep_time}: must be in [1; 60]")
+    if key_response_time < 4 or key_response_time > 50 or key_response_time % 2 != 0:
+        raise ValueError(f"Invalid key response time {key_response_time}: must be even in [4; 50]")
+
+    payload = bytearray(TIMES_TEMPLATE)
+    payload[4] = 0x03 | (deep_sleep_time & 0xf0)
+    payload[5] = (0x08 | (deep_sleep_time & 0x0f) << 4) & 0xff
+    payload[9] = int(sleep_time * 2) & 0xff
+    payload[10] = key_response_time // 2
+    payload[12] = times_checksum(payload)
+    return bytes(payload)
+
+
+def times_checksum(payload):
+    """Checksum byte 12 of a times report should hold"""
+    deep_sleep_time = (payload[4] & 0xf0) | payload[5] >> 4
+    nibbles = ((deep_sleep_time & 0x0f) + ((deep_sleep_time & 0xf0) >> 4)) & 0x0f
+    return ((nibbles << 4) + 0xa + payload[9] + payload[10]) & 0xff
+
+
+def encode_polling_report(polling_rate):
+    """Build the 9-byte polling rate report (0x306)"""
+    try:
+        code = POLLING_CODES[polling_rate]
+    except KeyError:
+        raise ValueError(f"Invalid polling rate {polling_rate}: must be one of 125, 250, 500, 1000") from None
+
+    payload = bytearray(POLLING_TEMPLATE)
+    payload[3] = code & 0xff
+    payload[4] = code >> 8
+    return bytes(payload)
+
+
+# (code, high range flag, >12K bit) of every DPI step, for decoding
+DPI_BY_CODE = {
+    (code, DPI_HIGH_RANGE[i], int((i + 1) * DPI_STEP > 12000)): (i + 1) * DPI_STEP
+    for i, code in enumerate(DPI_CODES)
+}
+
+
+def dpi_checksum(payload):
+    """Checksum bytes 50-51 of a DPI report should hold"""
+    checksum = DPI_CHECKSUM_BASE + sum(payload[8:14]) + sum(payload[16:22]) + payload[6] * 2
+    checksum += payload[24] - 1 + payload[4] + payload[3]
+    return checksum & 0xffff
+
+
+def decode_dpi_report(payload):
+    """Return (dpis, active_dpi, ripple_control, angle_snap) of a DPI report"""
+    if len(payload) != len(DPI_TEMPLATE):
+        raise ValueError(f"DPI report must be {len(DPI_TEMPLATE)} bytes, got {len(payload)}")
+    if payload[50] << 8 | payload[51] != dpi_checksum(payload):
+        raise ValueError("DPI report checksum mismatch")
+    dpis = []
+    for i in range(6):
+        key = (payload[8 + i], payload[16 + i], payload[6] >> i & 1)
+        try:
+            dpis.append(DPI_BY_CODE[key])
+        except KeyError:
+            raise ValueError(f"Unknown DPI code {key[0]:#04x} in slot {i + 1}") from None
+    return dpis, payload[24], bool(payload[4]), bool(payload[3])
+
+
+def decode_times_report(payload):
+    """Return (sleep_time, deep_sleep_time, key_response_time) of a times report"""
+    if len(payload) != len(TIMES_TEMPLATE):
+        raise ValueError(f"Times report must be {len(TIMES_TEMPLATE)} bytes, got {len(payload)}")
+    if payload[12] != times_checksum(payload):
+        raise ValueError("Times report checksum mismatch")
+    deep_sleep_time = (payload[4] & 0xf0) | payload[5] >> 4
+    return payload[9] / 2, deep_sleep_time, payload[10] * 2
+
+
+def decode_polling_report(payload):
+    """Return the polling rate of a polling report"""
+    if len(payload) != len(POLLING_TEMPLATE):
+        raise ValueError(f"Polling report must be {len(POLLING_TEMPLATE)} bytes, got {len(payload)}")
+    code = payload[3] | payload[4] << 8
+    for rate, known in POLLING_CODES.items():
+        if known == code:
+            return rate
+    raise ValueError(f"Unknown polling rate code {code:#06x}")
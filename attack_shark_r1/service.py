@@ -0,0 +1,367 @@
+"""
+Session bus service owning the mouse
+
+`python3 -m attack_shark_r1 service` opens the mouse once, through a
+direct transport that keeps it claimed, and offers it on the session bus
+as io.github.xbbx.AttackSharkR1:
+
+    ApplySettings(a{sv} changes)    merge fields of AppliedState into the settings and send them
+    SwitchProfile(s name)           send a stored profile and make it the active one
+    QueryCharge() -> i              battery charge in percent
+    GetState() -> a{sv}             the settings the service keeps the mouse at
+    StateChanged(a{sv}) signal      after every successful apply
+    ChargeChanged(i) signal         after every charge reading
+
+Clients are the "service" transport (ServiceTransport, through `gdbus
+call`), so the command line, the daemons and the GUI's direct mode use it
+with --transport service. The GUI also follows the signals.
+
+All requests go through one worker thread (DeviceOwner). Applies arriving
+while the mouse is busy are merged into a single one: each changes the
+wanted settings, and the next send carries all of them and answers every
+caller. Only the reports whose settings changed are sent, and while what
+the mouse holds is unknown (nothing cached, or a send failed) only the
+reports the requests touched.
+
+Testing needs no hardware or login session:
+
+    dbus-run-session -- sh -c 'python3 -m attack_shark_r1 service --transport sim &
+        sleep 1; python3 -m attack_shark_r1 apply --transport service --polling-rate 500'
+
+Needs PyGObject (Gio/GLib) for the service itself; clients only need gdbus.
+"""
+
+import signal
+import sys
+import threading
+
+from . import protocol
+from .errors import R1Error
+from .settings import DEFAULT_STATE, REPORT_GROUPS
+from .trace import logged
+from .validation import validate
+
+BUS_NAME = 'io.github.xbbx.AttackSharkR1'
+OBJECT_PATH = '/io/github/xbbx/AttackSharkR1'
+INTERFACE = 'io.github.xbbx.AttackSharkR1'
+ERROR = INTERFACE + '.Error'
+
+INTROSPECTION = f"""
+<node>
+  <interface name="{INTERFACE}">
+    <method name="ApplySettings">
+      <arg name="changes" type="a{{sv}}" direction="in"/>
+    </method>
+    <method name="SwitchProfile">
+      <arg name="name" type="s" direction="in"/>
+    </method>
+    <method name="QueryCharge">
+      <arg name="charge" type="i" direction="out"/>
+    </method>
+    <method name="GetState">
+      <arg name="state" type="a{{sv}}" direction="out"/>
+    </method>
+    <signal name="StateChanged">
+      <arg name="state" type="a{{sv}}"/>
+    </signal>
+    <signal name="ChargeChanged">
+      <arg name="charge" type="i"/>
+    </signal>
+  </interface>
+</node>
+"""
+
+# D-Bus type of every AppliedState field
+FIELD_TYPES = {
+    'polling_rate': 'i',
+    'dpis': 'ai',
+    'active_dpi': 'i',
+    'ripple_control': 'b',
+    'angle_snap': 'b',
+    'sleep_time': 'd',
+    'deep_sleep_time': 'i',
+    'key_response_time': 'i',
+}
+
+GDBUS_CALL = ['gdbus', 'call', '--session', '--dest', BUS_NAME, '--object-path', OBJECT_PATH]
+
+
+class ServiceError(R1Error):
+    """Raised for requests the service refuses"""
+
+
+def state_changes(fields):
+    """Settings changes from a dict of AppliedState fields, raising ServiceError for bad ones"""
+    changes = {}
+    for field, value in fields.items():
+        kind = FIELD_TYPES.get(field)
+        if kind is None:
+            raise ServiceError(f"Unknown setting {field!r}")
+        try:
+            if kind == 'ai':
+                value = tuple(int(dpi) for dpi in value)
+            elif kind == 'b':
+                value = bool(value)
+            elif kind == 'd':
+                value = float(value)
+            else:
+                value = int(value)
+        except (TypeError, ValueError):
+            raise ServiceError(f"Invalid value for {field}: {value!r}") from None
+        changes[field] = value
+    return changes
+
+
+def report_changes(reports):
+    """Settings changes carried by encoded (wValue, payload) reports, e.g. a profile's"""
+    changes = {}
+    for report_id, payload in reports:
+        payload = bytes(payload)
+        if report_id == protocol.REPORT_DPI:
+            dpis, active_dpi, ripple_control, angle_snap = protocol.decode_dpi_report(payload)
+            changes.update(dpis=tuple(dpis), active_dpi=active_dpi,
+                           ripple_control=ripple_control, angle_snap=angle_snap)
+        elif report_id == protocol.REPORT_TIMES:
+            sleep_time, deep_sleep_time, key_response_time = protocol.decode_times_report(payload)
+            changes.update(sleep_time=sleep_time, deep_sleep_time=deep_sleep_time,
+                           key_response_time=key_response_time)
+        elif report_id == protocol.REPORT_POLLING:
+            changes['polling_rate'] = protocol.decode_polling_report(payload)
+        else:
+            raise ServiceError(f"Unknown report {report_id:#x}")
+    return changes
+
+
+def format_changes(changes):
+    """Settings changes as a GVariant a{sv} in text form, for gdbus call"""
+    items = []
+    for field, value in changes.items():
+        kind = FIELD_TYPES[field]
+        if kind == 'ai':
+            text = f"[{', '.join(str(int(dpi)) for dpi in value)}]"
+        elif kind == 'b':
+            text = 'true' if value else 'false'
+        elif kind == 'd':
+            text = repr(float(value))
+        else:
+            text = str(int(value))
+        items.append(f"'{field}': <{text}>")
+    return '{' + ', '.join(items) + '}'
+
+
+class DeviceOwner:
+    """Runs every request against the one transport on a worker thread, merging applies
+
+    `connect` opens the transport. It stays open between requests and is
+    reopened after a failure, since the mouse may have been unplugged.
+    Replies come through reply(result, error) from the worker thread, and
+    so do on_state_changed(state) and on_charge_changed(charge). Settings
+    nobody asked for while the mouse's are unknown come from `base`, e.g.
+    the driver's config file.
+    """
+
+    def __init__(self, connect, applied_states, key, profiles, timeout=None, base=DEFAULT_STATE):
+        self.connect = connect
+        self.applied_states = applied_states
+        self.key = key
+        self.profiles = profiles
+        self.timeout = timeout
+        self.transport = None
+        # What the mouse holds, for the report groups in `known`, and what clients asked for
+        self.applied = applied_states.get(key)
+        self.known = set(REPORT_GROUPS) if self.applied is not None else set()
+        self.wanted = self.applied or base
+        self.touched = set()        # groups the pending applies changed
+        self.apply_replies = []
+        self.profile = None         # profile to mark active once the wanted settings are sent
+        self.charge_replies = []
+        self.closing = False
+        self.on_state_changed = None
+        self.on_charge_changed = None
+        self.condition = threading.Condition()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def state(self):
+        with self.condition:
+            return self.wanted
+
+    def apply(self, fields, reply):
+        """Merge settings changes into the wanted settings; raises ServiceError if they are invalid"""
+        changes = state_changes(fields)
+        with self.condition:
+            wanted = self.wanted._replace(**changes)
+            problems = validate(wanted, allow_disabled_dpis=True)
+            if problems:
+                raise ServiceError(problems[0].message)
+            self.wanted = wanted
+            self.touched |= {group for group, fields in REPORT_GROUPS.items() if any(field in changes for field in fields)}
+            self.apply_replies.append(reply)
+            self.condition.notify()
+
+    def switch_profile(self, name, reply):
+        """Replace the wanted settings with a profile's; raises ProfileError if there is no such profile"""
+        self.profiles.reload()
+        profile = self.profiles.get(name)
+        with self.condition:
+            self.wanted = profile.state
+            self.touched = set(REPORT_GROUPS)
+            self.profile = name
+            self.apply_replies.append(reply)
+            self.condition.notify()
+
+    def query_charge(self, reply):
+        with self.condition:
+            self.charge_replies.append(reply)
+            self.condition.notify()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not (self.apply_replies or self.charge_replies or self.closing):
+                    self.condition.wait()
+                if self.closing:
+                    break
+                wanted, touched, apply_replies, profile = self.wanted, self.touched, self.apply_replies, self.profile
+                charge_replies = self.charge_replies
+                self.touched, self.apply_replies, self.charge_replies, self.profile = set(), [], [], None
+            if apply_replies:
+                self._apply(wanted, touched, apply_replies, profile)
+            if charge_replies:
+                self._query_charge(charge_replies)
+        if self.transport is not None:
+            self.transport.close()
+
+    def _call(self, operation, method, *args):
+        try:
+            if self.transport is None:
+                self.transport = self.connect()
+            with logged(operation, self.transport):
+                return getattr(self.transport, method)(*args, timeout=self.timeout)
+        except Exception:
+            # The mouse may be gone, reopen it next time
+            if self.transport is not None:
+                self.transport.close()
+                self.transport = None
+            raise
+
+    def _apply(self, wanted, touched, replies, profile):
+        # Only what the requests changed; an unknown group only if they touched it
+        groups = {group for group in touched
+                  if group not in self.known or
+                  any(getattr(self.applied, field) != getattr(wanted, field) for field in REPORT_GROUPS[group])}
+        try:
+            if groups:
+                self._call('apply', 'apply', wanted, groups)
+        except Exception as e:
+            # Some reports may have gone out, what they carried is unknown now
+            self.known -= groups
+            self.applied_states.forget(self.key)
+            for reply in replies:
+                reply(None, e)
+            return
+        self.known |= groups
+        self.applied = wanted
+        # The cache only records fully known settings
+        if self.known == set(REPORT_GROUPS):
+            self.applied_states.put(self.key, wanted)
+        if profile is not None:
+            try:
+                self.profiles.set_active(profile)
+            except Exception:
+                pass
+        for reply in replies:
+            reply(wanted, None)
+        if groups and self.on_state_changed is not None:
+            self.on_state_changed(wanted)
+
+    def _query_charge(self, replies):
+        try:
+            charge = self._call('query', 'query_charge')
+        except Exception as e:
+            for reply in replies:
+                reply(None, e)
+            return
+        for reply in replies:
+            reply(charge, None)
+        if self.on_charge_changed is not None:
+            self.on_charge_changed(charge)
+
+    def close(self):
+        with self.condition:
+            self.closing = True
+            self.condition.notify()
+        self.thread.join()
+
+
+def state_variant(state):
+    """An AppliedState as a GLib.Variant of type a{sv}"""
+    from gi.repository import GLib
+
+    return GLib.Variant('a{sv}', {field: GLib.Variant(FIELD_TYPES[field], list(value) if field == 'dpis' else value)
+                                  for field, value in state._asdict().items()})
+
+
+def serve(owner):
+    """Offer `owner` on the session bus until SIGINT or SIGTERM, or until the name is taken"""
+    from gi.repository import GLib, Gio
+
+    node = Gio.DBusNodeInfo.new_for_xml(INTROSPECTION)
+    loop = GLib.MainLoop()
+    connection = None
+
+    def soon(function, *args):
+        # Replies and signals go out from the main loop, not the worker thread
+        def run():
+            function(*args)
+            return GLib.SOURCE_REMOVE
+        GLib.idle_add(run)
+
+    def emit(name, parameters):
+        if connection is not None:
+            connection.emit_signal(None, OBJECT_PATH, INTERFACE, name, parameters)
+
+    def answer(invocation, to_variant):
+        def reply(result, error):
+            if error is not None:
+                soon(invocation.return_dbus_error, f"{ERROR}.{type(error).__name__}", str(error))
+            else:
+                soon(invocation.return_value, to_variant(result))
+        return reply
+
+    def on_method_call(conn, sender, path, interface, method, parameters, invocation):
+        try:
+            if method == 'ApplySettings':
+                owner.apply(parameters.unpack()[0], answer(invocation, lambda state: None))
+            elif method == 'SwitchProfile':
+                owner.switch_profile(parameters.unpack()[0], answer(invocation, lambda state: None))
+            elif method == 'QueryCharge':
+                owner.query_charge(answer(invocation, lambda charge: GLib.Variant('(i)', (charge,))))
+            elif method == 'GetState':
+                invocation.return_value(GLib.Variant.new_tuple(state_variant(owner.state())))
+        except Exception as e:
+            invocation.return_dbus_error(f"{ERROR}.{type(e).__name__}", str(e))
+
+    def on_bus_acquired(conn, name):
+        nonlocal connection
+        connection = conn
+        conn.register_object(OBJECT_PATH, node.interfaces[0], on_method_call, None, None)
+
+    def on_name_lost(conn, name):
+        print(f"ERROR: Cannot own {BUS_NAME} on the session bus, is the service already running?",
+              file=sys.stderr, flush=True)
+        loop.quit()
+
+    owner.on_state_changed = lambda state: soon(emit, 'StateChanged', GLib.Variant.new_tuple(state_variant(state)))
+    owner.on_charge_changed = lambda charge: soon(emit, 'ChargeChanged', GLib.Variant('(i)', (charge,)))
+
+    owner_id = Gio.bus_own_name(Gio.BusType.SESSION, BUS_NAME, Gio.BusNameOwnerFlags.NONE,
+                                on_bus_acquired, None, on_name_lost)
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        GLib.unix_signal_add(GLib.PRIORITY_DEFAULT, signum, loop.quit)
+    try:
+        loop.run()
+    finally:
+        Gio.bus_unown_name(owner_id)
+        owner.close()
+
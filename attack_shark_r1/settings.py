@@ -0,0 +1,260 @@
+"""
+Mouse settings snapshots and the reports/driver flags they map to
+"""
+
+import fcntl
+import json
+import os
+import threading
+import time
+from collections import namedtuple
+
+from . import protocol
+
+# Snapshot of the settings that were last sent to a device
+AppliedState = namedtuple('AppliedState', [
+    'polling_rate',
+    'dpis',
+    'active_dpi',
+    'ripple_control',
+    'angle_snap',
+    'sleep_time',
+    'deep_sleep_time',
+    'key_response_time',
+])
+
+# Settings carried by each HID report the driver sends
+REPORT_GROUPS = {
+    'polling': ('polling_rate',),                                       # 0x306
+    'times': ('sleep_time', 'deep_sleep_time', 'key_response_time'),    # 0x305
+    'dpi': ('dpis', 'active_dpi', 'ripple_control', 'angle_snap'),      # 0x304
+}
+
+# wValue of the report carrying each group
+GROUP_REPORTS = {
+    'polling': protocol.REPORT_POLLING,
+    'times': protocol.REPORT_TIMES,
+    'dpi': protocol.REPORT_DPI,
+}
+
+# dpis from the default attack-shark-r1.ini, used for slots left at 0 when there is no config file
+DEFAULT_DPIS = (800, 1600, 3200, 4000, 5000, 12000)
+
+# The GUI's defaults ("Reset to Defaults"), slots 2-6 disabled
+DEFAULT_STATE = AppliedState(
+    polling_rate=1000,
+    dpis=(800, 0, 0, 0, 0, 0),
+    active_dpi=1,
+    ripple_control=False,
+    angle_snap=False,
+    sleep_time=2.0,
+    deep_sleep_time=5,
+    key_response_time=8,
+)
+
+# Key of the mouse in the AppliedStateCache
+DEVICE = 'r1'
+
+
+class AppliedStateCache:
+    """Last successfully applied state per device, persisted under $XDG_STATE_HOME
+
+    The GUI, the command line and the daemons share one file. Every change
+    takes an flock on a sibling .lock file, reads what the others wrote
+    and writes the merged result through a temporary file of its own, so
+    no writer drops another's entries. Each entry also records when it
+    was written (written_at()).
+    """
+
+    def __init__(self, path=None):
+        if path is None:
+            state_home = os.environ.get('XDG_STATE_HOME') or os.path.expanduser("~/.local/state")
+            path = os.path.join(state_home, "attack-shark", "applied-state.json")
+        self.path = path
+        self.lock = threading.Lock()
+        self.states, self.written = self._read()
+
+    def _read(self):
+        """({device: AppliedState}, {device: wall clock time it was written, or None})"""
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+            states, written = {}, {}
+            for device, fields in data.items():
+                fields = dict(fields)
+                written[device] = fields.pop('written_at', None)
+                states[device] = AppliedState(**dict(fields, dpis=tuple(fields['dpis'])))
+            return states, written
+        except (OSError, ValueError, TypeError, KeyError):
+            return {}, {}
+
+    def _write(self):
+        # Imported here, it costs more than the rest of the command line's startup
+        import tempfile
+
+        directory = os.path.dirname(self.path)
+        fd, tmp_path = tempfile.mkstemp(prefix='.applied-state-', suffix='.tmp', dir=directory)
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump({device: dict(state._asdict(), written_at=self.written.get(device))
+                           for device, state in self.states.items()}, f, indent=2)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def _update(self, change):
+        """Apply change(states) to the states on disk, under the file lock"""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with self.lock, open(self.path + '.lock', 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            self.states, self.written = self._read()
+            if change(self.states):
+                self._write()
+
+    def reload(self):
+        """Pick up states another process wrote since"""
+        with self.lock:
+            self.states, self.written = self._read()
+
+    def written_at(self, device):
+        """Wall clock time a device's state was put, as of the last read; None if unknown"""
+        with self.lock:
+            return self.written.get(device) if device in self.states else None
+
+    def get(self, device):
+        with self.lock:
+            return self.states.get(device)
+
+    def put(self, device, state):
+        def change(states):
+            _forget_aliases(states, device)
+            states[device] = state
+            self.written[device] = time.time()
+            return True
+        self._update(change)
+
+    def forget(self, device):
+        """Mark a device's state as unknown, e.g. after a failed apply"""
+        def change(states):
+            aliases = _forget_aliases(states, device)
+            return states.pop(device, None) is not None or aliases
+        self._update(change)
+
+
+def _forget_aliases(states, device):
+    """Drop the entries that may be the same mouse as `device`; True if there were any
+
+    The plain DEVICE key is whichever R1 was found first when several were
+    connected (see devices.state_key), so it may be any of the DEVICE@id
+    ones, and any of them may be it.
+    """
+    if device == DEVICE:
+        aliases = [key for key in states if key.startswith(DEVICE + '@')]
+    else:
+        aliases = [DEVICE] if DEVICE in states and device.startswith(DEVICE + '@') else []
+    for key in aliases:
+        del states[key]
+    return bool(aliases)
+
+
+def changed_report_groups(old, new):
+    """Return the report groups whose fields differ between two states"""
+    if old is None:
+        return set(REPORT_GROUPS)
+    return {
+        group for group, fields in REPORT_GROUPS.items()
+        if any(getattr(old, field) != getattr(new, field) for field in fields)
+    }
+
+
+def driver_args(state, groups, reapply=False):
+    """Build the driver flags for the given report groups
+
+    Every flag of a group is sent together because the driver rebuilds
+    the whole report whenever one of its fields is set.
+    """
+    cmd = []
+
+    # Add reapply config flag (standalone, no value)
+    if reapply:
+        cmd.append('-reapply-config')
+
+    if 'polling' in groups:
+        # Add polling rate with = format
+        cmd.append(f'-polling-rate={state.polling_rate}')
+
+    if 'dpi' in groups:
+        # Add active DPI with = format
+        cmd.append(f'-active-dpi={state.active_dpi}')
+
+        # Add DPI values with : format (special for map type!)
+        for i, dpi_value in enumerate(state.dpis, start=1):
+            if dpi_value > 0:
+                cmd.append(f'-dpi:{i}={dpi_value}')
+
+        # Add angle snap with = format
+        cmd.append(f'-angle-snap={str(state.angle_snap).lower()}')
+
+        # Add ripple control with = format
+        cmd.append(f'-ripple-control={str(state.ripple_control).lower()}')
+
+    if 'times' in groups:
+        # Add key response time with = format
+        cmd.append(f'-key-response-time={state.key_response_time}')
+
+        # Add sleep time with = format
+        cmd.append(f'-sleep-time={state.sleep_time}')
+
+        # Add deep sleep time with = format
+        cmd.append(f'-deep-sleep-time={state.deep_sleep_time}')
+
+    return cmd
+
+
+def report_args(reports):
+    """Build the driver flags sending already encoded (wValue, payload) reports as they are"""
+    return [f'-report:{report_id:#x}={payload.hex()}' for report_id, payload in reports]
+
+
+# Parsed config files for config_dpis(), created when first needed
+_config_store = None
+
+
+def config_dpis(config_path=None):
+    """dpis of the driver's config file (the default one if None), or DEFAULT_DPIS if it can't be read
+
+    The driver sends these for slots it gets no -dpi flag for.
+    """
+    global _config_store
+    from .config import ConfigStore, default_config_path
+
+    if _config_store is None:
+        _config_store = ConfigStore()
+    try:
+        return _config_store.load(config_path or default_config_path()).driver_dpis
+    except OSError:
+        return DEFAULT_DPIS
+
+
+def encode_reports(state, groups, config_path=None):
+    """Encode the reports of the given groups as (wValue, payload), in the driver's order
+
+    Slots left at 0 are disabled in the GUI and take the value in the
+    config file at `config_path`, like the driver does with the -dpi flags
+    driver_args() leaves out for them, so every transport sends the same
+    bytes for the same state.
+    """
+    reports = []
+    if 'polling' in groups:
+        reports.append((protocol.REPORT_POLLING, protocol.encode_polling_report(state.polling_rate)))
+    if 'times' in groups:
+        reports.append((protocol.REPORT_TIMES, protocol.encode_times_report(
+            state.sleep_time, state.deep_sleep_time, state.key_response_time)))
+    if 'dpi' in groups:
+        dpis = state.dpis
+        if 0 in dpis:
+            dpis = [dpi or fallback for dpi, fallback in zip(dpis, config_dpis(config_path))]
+        reports.append((protocol.REPORT_DPI, protocol.encode_dpi_report(
+            dpis, state.active_dpi, state.ripple_control, state.angle_snap)))
+    return reports
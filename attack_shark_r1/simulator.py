@@ -0,0 +1,149 @@
+"""
+Software stand-in for the mouse
+
+SimulatedMouse takes the feature reports the driver sends (0x304, 0x305,
+0x306), checks their length, report id byte and the checksums set_dpis and
+set_times compute, and keeps the decoded settings as an AppliedState. A
+report failing a check is ignored and never acknowledged, like the
+firmware does. When wireless, acks come out of the simulated 0x83 endpoint
+`ack_latency` seconds after their report, and `drop_rate` of them never do,
+so retries, backoff and timeouts can be exercised. In between, the endpoint
+delivers status reports carrying the battery charge.
+
+transport.SimulatorTransport (the "sim" transport) puts a SimulatedMouse
+behind the usual report sending, so the GUI's direct mode, the command
+line and the daemons run unchanged without hardware:
+
+    R1_SIM_ACK_MS=5 R1_SIM_DROP_RATE=0.1 python3 -m attack_shark_r1 apply --transport sim --polling-rate 500
+"""
+
+import json
+import os
+import random
+import time
+from collections import deque
+
+from . import protocol
+from .settings import DEFAULT_STATE, AppliedState
+
+# Environment read by from_environment() and their defaults
+ENVIRONMENT = {
+    'R1_SIM_ACK_MS': 2,           # ack latency
+    'R1_SIM_DROP_RATE': 0,        # fraction of acks lost
+    'R1_SIM_CHARGE': 80,          # battery charge in percent
+    'R1_SIM_WIRED': 0,            # 1 for the wired mouse, which sends no acks
+    'R1_SIM_STATUS_MS': 50,       # interval of the status reports
+    'R1_SIM_SEED': None,          # seed for the dropped acks
+    'R1_SIM_STATE': None,         # file keeping the settings and charge between runs
+}
+
+
+class SimulatedMouse:
+    """A mouse or receiver answering like the real one, minus the USB"""
+
+    def __init__(self, ack_latency=0.002, drop_rate=0.0, charge=80, wired=False,
+                 status_interval=0.05, seed=None, state=DEFAULT_STATE):
+        self.ack_latency = ack_latency
+        self.drop_rate = drop_rate
+        self.charge = charge
+        self.wired = wired
+        self.status_interval = status_interval
+        self.state = state
+        self.random = random.Random(seed)
+        self.pending = deque()  # due times of acks not read yet
+        # Counters for tests and load tests
+        self.received = 0
+        self.acks_dropped = 0
+        self.rejected = []      # (report id, reason)
+
+    def set_feature(self, report_id, payload):
+        """Take a SET_REPORT control transfer; returns False if the report was ignored"""
+        self.received += 1
+        try:
+            self.state = self.decode(report_id, bytes(payload))
+        except ValueError as e:
+            self.rejected.append((report_id, str(e)))
+            return False
+        if not self.wired:
+            if self.random.random() < self.drop_rate:
+                self.acks_dropped += 1
+            else:
+                self.pending.append(time.monotonic() + self.ack_latency)
+        return True
+
+    def decode(self, report_id, payload):
+        """The settings after applying one report, raising ValueError if it fails a check"""
+        if not payload or payload[0] != report_id & 0xff:
+            raise ValueError(f"Report id byte doesn't match {report_id:#x}")
+        if report_id == protocol.REPORT_DPI:
+            dpis, active_dpi, ripple_control, angle_snap = protocol.decode_dpi_report(payload)
+            return self.state._replace(dpis=tuple(dpis), active_dpi=active_dpi,
+                                       ripple_control=ripple_control, angle_snap=angle_snap)
+        if report_id == protocol.REPORT_TIMES:
+            sleep_time, deep_sleep_time, key_response_time = protocol.decode_times_report(payload)
+            return self.state._replace(sleep_time=sleep_time, deep_sleep_time=deep_sleep_time,
+                                       key_response_time=key_response_time)
+        if report_id == protocol.REPORT_POLLING:
+            return self.state._replace(polling_rate=protocol.decode_polling_report(payload))
+        raise ValueError(f"Unknown report {report_id:#x}")
+
+    def status_report(self):
+        return bytes((0x03, 0x00, 0x00, 0x00, self.charge // 10))
+
+    def read_input(self, timeout):
+        """Next report on the 0x83 endpoint, or None after `timeout` seconds
+
+        An ack that is due comes first, otherwise the next status report.
+        The wired mouse sends neither.
+        """
+        now = time.monotonic()
+        if self.pending:
+            wait = self.pending[0] - now
+            if wait > timeout:
+                time.sleep(max(0, timeout))
+                return None
+            time.sleep(max(0, wait))
+            self.pending.popleft()
+            return bytes((0x03, 0x00, protocol.ACK, 0x00, self.charge // 10))
+        if self.wired or self.status_interval > timeout:
+            time.sleep(max(0, timeout))
+            return None
+        time.sleep(self.status_interval)
+        return self.status_report()
+
+    def save(self, path):
+        """Keep the settings and charge for the next run"""
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'state': self.state._asdict(), 'charge': self.charge}, f, indent=2)
+        os.replace(tmp_path, path)
+
+    def load(self, path):
+        """Pick up what save() left, if anything"""
+        try:
+            with open(path, 'r') as f:
+                data = json.load(f)
+            fields = data['state']
+            self.state = AppliedState(**dict(fields, dpis=tuple(fields['dpis'])))
+            self.charge = int(data.get('charge', self.charge))
+        except (OSError, ValueError, TypeError, KeyError):
+            pass
+
+
+def from_environment(environ=None):
+    """A SimulatedMouse set up from the R1_SIM_* variables; returns (mouse, state file or None)"""
+    environ = os.environ if environ is None else environ
+    settings = {name: environ.get(name, default) for name, default in ENVIRONMENT.items()}
+    mouse = SimulatedMouse(
+        ack_latency=float(settings['R1_SIM_ACK_MS']) / 1000,
+        drop_rate=float(settings['R1_SIM_DROP_RATE']),
+        charge=int(settings['R1_SIM_CHARGE']),
+        wired=str(settings['R1_SIM_WIRED']) not in ('', '0'),
+        status_interval=float(settings['R1_SIM_STATUS_MS']) / 1000,
+        seed=settings['R1_SIM_SEED'],
+    )
+    state_path = settings['R1_SIM_STATE']
+    if state_path:
+        mouse.load(state_path)
+    return mouse, state_path
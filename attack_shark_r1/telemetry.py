@@ -0,0 +1,163 @@
+"""
+Live pointer deltas and report intervals for the GUI's telemetry panel
+
+A MotionReader thread reads the mouse's evdev stream in chunks, like
+attack_shark_r1.pollrate, sums the REL_X/REL_Y events of every report
+(one per SYN_REPORT) and appends (time, dx, dy) to a MotionRing. The
+ring is a few preallocated arrays written in place, so a 1000 Hz stream
+keeps using the same memory however long it runs, and the oldest samples
+are simply overwritten.
+
+Drawing copies the newest samples into buffers the view owns
+(MotionRing.copy_latest) and reduces each trace to one min/max pair per
+pixel column (decimate), so a frame costs the same whether it covers 100
+or 10000 reports.
+"""
+
+import os
+import select
+import threading
+
+from .pollrate import EVENT_FIELDS, EVENT_SIZE, EV_SYN, SYN_REPORT, _numpy
+
+EV_REL = 2
+REL_X = 0
+REL_Y = 1
+
+
+class MotionRing:
+    """The newest `capacity` reports as (time, dx, dy), shared by one writer and one reader"""
+
+    def __init__(self, capacity=8192):
+        np = _numpy()
+        self.np = np
+        self.capacity = capacity
+        self.times = np.zeros(capacity, np.float64)
+        self.dx = np.zeros(capacity, np.int32)
+        self.dy = np.zeros(capacity, np.int32)
+        self.written = 0            # reports ever added; the next one goes to written % capacity
+        self.lock = threading.Lock()
+
+    def extend(self, times, dx, dy):
+        n = len(times)
+        if n > self.capacity:
+            times, dx, dy = times[-self.capacity:], dx[-self.capacity:], dy[-self.capacity:]
+            skipped, n = n - self.capacity, self.capacity
+        else:
+            skipped = 0
+        with self.lock:
+            start = (self.written + skipped) % self.capacity
+            first = min(n, self.capacity - start)
+            for array, values in ((self.times, times), (self.dx, dx), (self.dy, dy)):
+                array[start:start + first] = values[:first]
+                array[:n - first] = values[first:]
+            self.written += skipped + n
+
+    def copy_latest(self, times, dx, dy):
+        """Copy the newest reports, oldest first, into the given arrays; returns how many"""
+        with self.lock:
+            n = min(len(times), self.written, self.capacity)
+            end = self.written % self.capacity
+            start = end - n
+            for array, out in ((self.times, times), (self.dx, dx), (self.dy, dy)):
+                if start >= 0:
+                    out[:n] = array[start:end]
+                else:
+                    out[:-start] = array[start:]
+                    out[-start:n] = array[:end]
+        return n
+
+
+def report_motion(events, carry=(0, 0)):
+    """(times, dx, dy) per SYN_REPORT in a structured array of input events, plus the carry
+
+    Motion after the last SYN_REPORT belongs to a report the next chunk
+    completes; it is returned as the carry to pass along with that chunk.
+    """
+    np = _numpy()
+    syn = (events['type'] == EV_SYN) & (events['code'] == SYN_REPORT)
+    # Events up to and including a SYN_REPORT make up that report
+    report = np.cumsum(syn) - syn
+    reports = int(np.count_nonzero(syn))
+    rel = events['type'] == EV_REL
+    x = np.where(rel & (events['code'] == REL_X), events['value'], 0)
+    y = np.where(rel & (events['code'] == REL_Y), events['value'], 0)
+    dx = np.bincount(report, weights=x, minlength=reports + 1).astype(np.int32)
+    dy = np.bincount(report, weights=y, minlength=reports + 1).astype(np.int32)
+    dx[0] += carry[0]
+    dy[0] += carry[1]
+    marks = events[syn]
+    times = marks['sec'] + marks['usec'] * 1e-6
+    return times, dx[:reports], dy[:reports], (int(dx[reports]), int(dy[reports]))
+
+
+class MotionReader:
+    """Feeds a MotionRing from the event device at `path` on a background thread"""
+
+    def __init__(self, path, ring, chunk_events=256):
+        self.np = _numpy()
+        self.path = path
+        self.ring = ring
+        self.dtype = self.np.dtype(EVENT_FIELDS)
+        self.buffer = bytearray(EVENT_SIZE * chunk_events)
+        self.view = memoryview(self.buffer)
+        self.pending = 0
+        self.carry = (0, 0)
+        self.error = None           # why the thread ended early, if it did
+        self.stopping = threading.Event()
+        self.thread = None
+        self.fd = None
+
+    def start(self):
+        """Open the device and start reading; raises OSError if it can't be opened"""
+        self.fd = os.open(self.path, os.O_RDONLY | os.O_NONBLOCK)
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def run(self):
+        try:
+            while not self.stopping.is_set():
+                readable, _, _ = select.select([self.fd], [], [], 0.1)
+                if readable and not self.read():
+                    self.error = f"{self.path} went away"
+                    return
+        except OSError as e:
+            self.error = f"Cannot read {self.path}: {e.strerror}"
+        finally:
+            os.close(self.fd)
+
+    def read(self):
+        try:
+            n = os.readv(self.fd, [self.view[self.pending:]])
+        except BlockingIOError:
+            return True
+        if n == 0:
+            return False
+        total = self.pending + n
+        whole = total - total % EVENT_SIZE
+        events = self.np.frombuffer(self.buffer, self.dtype, count=whole // EVENT_SIZE)
+        times, dx, dy, self.carry = report_motion(events, self.carry)
+        if len(times):
+            self.ring.extend(times, dx, dy)
+        self.pending = total - whole
+        if self.pending:
+            self.buffer[:self.pending] = self.buffer[whole:total]
+        return True
+
+    def stop(self):
+        self.stopping.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+
+def decimate(values, width):
+    """(mins, maxs) of `values` per pixel column, at most `width` of each"""
+    np = _numpy()
+    if len(values) <= width:
+        return values, values
+    starts = np.arange(width) * len(values) // width
+    return np.minimum.reduceat(values, starts), np.maximum.reduceat(values, starts)
@@ -0,0 +1,205 @@
+"""
+Apply-path tracing
+
+With -trace the driver prints the phases of a command (config, init, open,
+detach, claim, one span per report with its tries, charge, attach) as a
+single "trace <json>" line. This module separates those lines from the
+driver output, adds what only the caller can measure (queueing and process
+or IPC overhead), and keeps the result as JSON lines for later analysis.
+
+Every apply is logged, traced or not: the command line, the watchers and
+the service wrap their sends in logged(), which costs a span per report and
+one appended line, and the GUI logs every command it runs. Without -trace
+a record holds only the elapsed time, the report tries where the transport
+counts them, and the error. Once the log reaches MAX_LOG_BYTES it is
+renamed to apply-trace.jsonl.1, replacing the previous one, and a new log
+is started.
+"""
+
+import fcntl
+import json
+import os
+import time
+from contextlib import contextmanager
+
+PREFIX = 'trace '
+
+# Size at which the log is rotated; a record is a few hundred bytes
+MAX_LOG_BYTES = 1 << 20
+
+
+def default_log_path():
+    state_home = os.environ.get('XDG_STATE_HOME') or os.path.expanduser("~/.local/state")
+    return os.path.join(state_home, "attack-shark", "apply-trace.jsonl")
+
+
+def _us(seconds):
+    return int(seconds * 1_000_000)
+
+
+def parse_trace_line(line):
+    """Return the trace in a single output line, or None if it is not one"""
+    if not line.startswith(PREFIX):
+        return None
+    try:
+        return json.loads(line[len(PREFIX):])
+    except ValueError:
+        return None
+
+
+def split_trace(output):
+    """Separate "trace <json>" lines from driver output
+
+    Returns the remaining output and the list of parsed traces.
+    """
+    lines = []
+    traces = []
+    for line in output.splitlines():
+        trace = parse_trace_line(line)
+        if trace is None:
+            lines.append(line)
+        else:
+            traces.append(trace)
+    return '\n'.join(lines), traces
+
+
+class Tracer:
+    """Records spans in the driver's trace format, for the direct transports"""
+
+    def __init__(self):
+        self.start = time.monotonic()
+        self.spans = []
+
+    @contextmanager
+    def span(self, phase, **fields):
+        """Time the enclosed block; fields may be updated through the yielded dict"""
+        start = time.monotonic()
+        span = {'phase': phase}
+        try:
+            yield fields
+        finally:
+            span['start_us'] = _us(start - self.start)
+            span['us'] = _us(time.monotonic() - start)
+            span.update(fields)
+            self.spans.append(span)
+
+    def trace(self):
+        return {'total_us': _us(time.monotonic() - self.start), 'spans': self.spans}
+
+
+def make_record(operation, mode, traces, queued, elapsed, error=None):
+    """Combine traces with the caller's timings into one log record
+
+    `queued` and `elapsed` are the seconds spent waiting for and running the
+    command. Whatever the traces don't account for is reported as overhead:
+    process spawn and exit for one-shot runs, pipe round trips for a session,
+    thread handoff for direct transports.
+    """
+    spans = [span for trace in traces for span in trace.get('spans', ())]
+    traced_us = sum(trace.get('total_us', 0) for trace in traces)
+    elapsed_us = _us(elapsed)
+    return {
+        'time': round(time.time(), 3),
+        'operation': operation,
+        'mode': mode,
+        'queued_us': _us(queued),
+        'elapsed_us': elapsed_us,
+        'overhead_us': max(0, elapsed_us - traced_us),
+        'spans': spans,
+        'error': None if error is None else str(error),
+    }
+
+
+OVERHEAD_NAMES = {'oneshot': 'spawn', 'session': 'ipc', 'direct': 'handoff'}
+
+
+def summarize(record):
+    """One-line breakdown, e.g. "52 ms: spawn 9, open 21, detach 2, 3 reports 17 (1 retry)" """
+    parts = []
+    totals = {}
+    reports = retries = 0
+    for span in record['spans']:
+        if span['phase'] == 'report':
+            reports += 1
+            retries += max(0, span.get('tries', 1) - 1)
+        totals[span['phase']] = totals.get(span['phase'], 0) + span['us']
+
+    overhead = OVERHEAD_NAMES.get(record['mode'], 'overhead')
+    parts.append(f"{overhead} {record['overhead_us'] / 1000:.0f}")
+    for phase, us in totals.items():
+        if phase == 'report':
+            part = f"{reports} report{'s' if reports != 1 else ''} {us / 1000:.0f}"
+            if retries:
+                part += f" ({retries} retr{'ies' if retries != 1 else 'y'})"
+            parts.append(part)
+        else:
+            parts.append(f"{phase} {us / 1000:.0f}")
+    if record['queued_us'] >= 1000:
+        parts.insert(0, f"queued {record['queued_us'] / 1000:.0f}")
+    return f"{record['elapsed_us'] / 1000:.0f} ms: " + ', '.join(parts)
+
+
+class TraceLog:
+    """Append-only JSON-lines log of trace records, rotated at `max_bytes`"""
+
+    def __init__(self, path=None, max_bytes=MAX_LOG_BYTES):
+        self.path = path or default_log_path()
+        self.max_bytes = max_bytes
+
+    def append(self, record):
+        line = (json.dumps(record, separators=(',', ':')) + '\n').encode()
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        while True:
+            with open(self.path, 'ab') as f:
+                # Writers take turns, so only one of them rotates
+                fcntl.flock(f, fcntl.LOCK_EX)
+                stat = os.fstat(f.fileno())
+                try:
+                    current = os.stat(self.path).st_ino == stat.st_ino
+                except FileNotFoundError:
+                    current = False
+                if not current:
+                    # Rotated by another writer while we waited for the lock
+                    continue
+                if stat.st_size and stat.st_size + len(line) > self.max_bytes:
+                    os.replace(self.path, self.path + '.1')
+                    continue
+                f.write(line)
+                return
+
+
+def log_record(record, log=None):
+    """Append `record` to `log`, the default trace log if None; a log that can't be written is skipped"""
+    try:
+        (log or TraceLog()).append(record)
+    except OSError:
+        pass
+
+
+@contextmanager
+def logged(operation, transport, log=None):
+    """Log what the enclosed block sends through `transport` as one record
+
+    Transports that send the reports themselves record a span per report
+    with its tries. Sends through the service are logged by the service,
+    not again by its client (see Transport.trace_mode).
+    """
+    mode = transport.trace_mode
+    if mode is None:
+        yield
+        return
+    tracer = Tracer()
+    previous = getattr(transport, 'tracer', None)
+    if previous is None and hasattr(transport, 'tracer'):
+        transport.tracer = tracer
+    error = None
+    try:
+        yield
+    except Exception as e:
+        error = e
+        raise
+    finally:
+        if previous is None and hasattr(transport, 'tracer'):
+            transport.tracer = None
+        traces = [tracer.trace()] if tracer.spans else []
+        log_record(make_record(operation, mode, traces, 0, time.monotonic() - tracer.start, error), log)
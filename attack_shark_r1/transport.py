@@ -0,0 +1,470 @@
+"""
+Transports that deliver settings to the mouse
+
+DriverTransport runs attack-shark-r1-driver as the GUI always has.
+HidrawTransport and LibusbTransport send the feature reports from this
+process and read the 0x83 acknowledgement themselves, which avoids a
+process spawn and a full USB enumeration per apply. ServiceTransport asks
+the session bus service (attack_shark_r1.service) that owns the mouse.
+MockTransport records the reports for tests.
+"""
+
+import fcntl
+import glob
+import os
+import re
+import select
+import subprocess
+import time
+
+from . import protocol
+from .errors import R1Error
+from .settings import REPORT_GROUPS, driver_args, encode_reports, report_args
+
+DRIVER = 'attack-shark-r1-driver'
+
+VID = 0x1d57
+PID = 0xfa60
+WIRED_PID = 0xfa61
+INTERFACE = 2
+STATUS_ENDPOINT = 0x83
+
+
+def HIDIOCSFEATURE(length):
+    """_IOWR('H', 0x06, length) from linux/hidraw.h"""
+    return (3 << 30) | (length << 16) | (ord('H') << 8) | 0x06
+
+
+class TransportError(R1Error):
+    """Raised when settings could not be delivered to the mouse"""
+
+
+class DeviceUnreachable(TransportError):
+    """Raised when a wireless report is not acknowledged in time"""
+
+    def __init__(self, report_id, tries, elapsed):
+        super().__init__(
+            f"device unreachable after {tries} tries in {elapsed * 1000:.0f} ms (report {report_id:#x})")
+        self.report_id = report_id
+        self.tries = tries
+        self.elapsed = elapsed
+
+
+class Transport:
+    """Delivers settings to the mouse"""
+
+    # How trace records name the way to the mouse; None if another process logs the sends
+    trace_mode = 'direct'
+
+    def apply(self, state, groups, reapply=False, timeout=None):
+        """Send the reports of `groups` for `state`, giving up after `timeout` seconds"""
+        raise NotImplementedError
+
+    def send_reports(self, reports, timeout=None):
+        """Send already encoded (wValue, payload) reports, e.g. a profile's"""
+        raise NotImplementedError
+
+    def query_charge(self, timeout=None):
+        """Return the battery charge in percent"""
+        raise NotImplementedError
+
+    def close(self):
+        """Release the device"""
+
+
+class DriverTransport(Transport):
+    """Runs attack-shark-r1-driver once per call"""
+
+    trace_mode = 'oneshot'
+
+    def __init__(self, config_path=None, driver=DRIVER, timeout=10, device=None):
+        self.config_path = config_path
+        self.driver = driver
+        self.timeout = timeout
+        self.device = device
+
+    def run(self, args, timeout=None):
+        """Run the driver with `args` and return its stdout
+
+        The driver is asked to give up on unanswered wireless reports a bit
+        before `timeout`, so it can report how far it got.
+        """
+        timeout = timeout or self.timeout
+        cmd = [self.driver]
+        if self.config_path:
+            cmd.append(f'-config-path={self.config_path}')
+        if self.device:
+            cmd.append(f'-device={self.device}')
+        cmd.append(f'-deadline-ms={max(100, int(timeout * 1000) - 500)}')
+        try:
+            result = subprocess.run(cmd + args, capture_output=True, text=True, timeout=timeout)
+        except FileNotFoundError:
+            raise TransportError(f"{self.driver} not found, make sure it is in your PATH") from None
+        except subprocess.TimeoutExpired:
+            raise TransportError(f"{self.driver} did not finish within {timeout} s") from None
+        if result.returncode != 0:
+            raise TransportError((result.stderr or result.stdout).strip().removeprefix("ERROR: "))
+        return result.stdout.strip()
+
+    def apply(self, state, groups, reapply=False, timeout=None):
+        self.run(driver_args(state, groups, reapply=reapply), timeout)
+
+    def send_reports(self, reports, timeout=None):
+        self.run(report_args(reports), timeout)
+
+    def query_charge(self, timeout=None):
+        # Config warnings may come before the charge
+        lines = self.run(['-query-charge'], timeout).splitlines()
+        try:
+            return int(lines[-1])
+        except (IndexError, ValueError):
+            raise TransportError("Unexpected driver output") from None
+
+
+class ReportTransport(Transport):
+    """Base for transports that encode and send the reports themselves
+
+    Subclasses provide write_feature() and read_input(). Wireless reports
+    are resent with exponential backoff until the receiver answers with an
+    ack (0x50 in byte 2), like the driver's send_report: at most
+    `max_attempts` times, each waiting `ack_timeout` seconds for the ack.
+    Disabled DPI slots are sent with the values of the config file at
+    `config_path`, like the driver sends them.
+    """
+
+    wired = False
+
+    def __init__(self, ack_timeout=0.25, max_attempts=5, config_path=None):
+        self.ack_timeout = ack_timeout
+        self.max_attempts = max_attempts
+        self.config_path = config_path
+        # attack_shark_r1.trace.Tracer recording one span per report, if set
+        self.tracer = None
+
+    def write_feature(self, report_id, payload):
+        raise NotImplementedError
+
+    def read_input(self, timeout):
+        """Return the next input report, or None after `timeout` seconds"""
+        raise NotImplementedError
+
+    def send_report(self, report_id, payload, deadline=None):
+        """Send one feature report and wait for its acknowledgement
+
+        `deadline` is a time.monotonic() value after which no more attempts
+        are made.
+        """
+        if self.tracer is None:
+            self._send_report(report_id, payload, deadline, {})
+            return
+        with self.tracer.span('report', report=report_id) as span:
+            self._send_report(report_id, payload, deadline, span)
+
+    def _send_report(self, report_id, payload, deadline, span):
+        start = time.monotonic()
+        if deadline is None:
+            deadline = float('inf')
+        backoff = 0.01
+        tries = 0
+        while tries < self.max_attempts:
+            self.write_feature(report_id, payload)
+            tries += 1
+            span['tries'] = tries
+            if self.wired:
+                return
+
+            ack_deadline = min(time.monotonic() + self.ack_timeout, deadline)
+            while True:
+                report = self.read_input(max(0, ack_deadline - time.monotonic()))
+                if report is None:
+                    break
+                if len(report) > 2 and report[2] == protocol.ACK:
+                    return
+                # Motion reports keep coming while the mouse moves, don't wait past the ack timeout for them
+                if time.monotonic() >= ack_deadline:
+                    break
+
+            if time.monotonic() + backoff >= deadline:
+                break
+            time.sleep(backoff)
+            backoff *= 2
+        raise DeviceUnreachable(report_id, tries, time.monotonic() - start)
+
+    def apply(self, state, groups, reapply=False, timeout=None):
+        # reapply only matters to the driver, which reads its own config file
+        self.send_reports(encode_reports(state, groups, self.config_path), timeout)
+
+    def send_reports(self, reports, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for report_id, payload in reports:
+            self.send_report(report_id, payload, deadline)
+
+    def query_charge(self, timeout=None):
+        # Like the driver, which leaves the status buffer empty when wired
+        if self.wired:
+            return 0
+        wait = self.ack_timeout * self.max_attempts
+        if timeout is not None:
+            wait = min(wait, timeout)
+        report = self.read_input(wait)
+        if report is None or len(report) < 5:
+            raise TransportError("The mouse did not send a status report")
+        return report[4] * 10
+
+
+def find_hidraw(device=None):
+    """Return (device node, product id) of the R1's hidraw node for interface 2
+
+    `device` picks the R1 with that USB device id (see attack_shark_r1.devices).
+    """
+    for path in sorted(glob.glob('/sys/class/hidraw/hidraw*')):
+        device_path = os.path.realpath(os.path.join(path, 'device'))
+        try:
+            with open(os.path.join(device_path, 'uevent')) as f:
+                uevent = dict(line.rstrip('\n').split('=', 1) for line in f if '=' in line)
+            with open(os.path.join(os.path.dirname(device_path), 'bInterfaceNumber')) as f:
+                interface = int(f.read(), 16)
+        except (OSError, ValueError):
+            continue
+
+        # HID_ID=0003:00001D57:0000FA60
+        try:
+            _, vid, pid = (int(part, 16) for part in uevent.get('HID_ID', '').split(':'))
+        except ValueError:
+            continue
+        # .../3-1.4/3-1.4:1.2/0003:1D57:FA60.0001
+        if device is not None and os.path.basename(os.path.dirname(os.path.dirname(device_path))) != device:
+            continue
+        if vid == VID and pid in (PID, WIRED_PID) and interface == INTERFACE:
+            return '/dev/' + os.path.basename(path), pid
+    if device is not None:
+        raise TransportError(f"No Attack Shark R1 hidraw device found at {device}")
+    raise TransportError("No Attack Shark R1 hidraw device found")
+
+
+class HidrawTransport(ReportTransport):
+    """Sends feature reports through /dev/hidraw*, leaving the kernel driver attached"""
+
+    def __init__(self, path=None, device=None, **kwargs):
+        super().__init__(**kwargs)
+        if path is None:
+            path, pid = find_hidraw(device)
+            self.wired = pid == WIRED_PID
+        try:
+            self.fd = os.open(path, os.O_RDWR | os.O_NONBLOCK)
+        except OSError as e:
+            raise TransportError(f"Cannot open {path}: {e.strerror}") from None
+        self.path = path
+
+    def _drain(self):
+        """Drop input reports queued before our request"""
+        try:
+            while os.read(self.fd, 64):
+                pass
+        except BlockingIOError:
+            pass
+
+    def write_feature(self, report_id, payload):
+        self._drain()
+        try:
+            fcntl.ioctl(self.fd, HIDIOCSFEATURE(len(payload)), bytearray(payload))
+        except OSError as e:
+            raise TransportError(f"Writing report {report_id:#x} to {self.path} failed: {e.strerror}") from None
+
+    def read_input(self, timeout):
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return None
+        try:
+            return os.read(self.fd, 64)
+        except BlockingIOError:
+            return None
+
+    def query_charge(self, timeout=None):
+        self._drain()
+        return super().query_charge(timeout)
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+def usb_device_id(d):
+    """The driver's device id of a pyusb device, e.g. 3-1.4"""
+    return f"{d.bus}-{'.'.join(str(port) for port in d.port_numbers or ())}"
+
+
+class LibusbTransport(ReportTransport):
+    """Sends control transfers through pyusb, detaching the kernel driver like the driver does"""
+
+    def __init__(self, device=None, **kwargs):
+        super().__init__(**kwargs)
+        try:
+            import usb.core
+            import usb.util
+        except ImportError:
+            raise TransportError("The libusb transport needs pyusb (python-pyusb)") from None
+        self.usb = usb
+
+        def match(d):
+            return d.idProduct in (PID, WIRED_PID) and (device is None or usb_device_id(d) == device)
+
+        self.device = usb.core.find(idVendor=VID, custom_match=match)
+        if self.device is None:
+            raise TransportError("No Attack Shark R1 found" + (f" at {device}" if device else ""))
+        self.wired = self.device.idProduct == WIRED_PID
+
+        self.reattach = False
+        try:
+            if self.device.is_kernel_driver_active(INTERFACE):
+                self.device.detach_kernel_driver(INTERFACE)
+                self.reattach = True
+            usb.util.claim_interface(self.device, INTERFACE)
+        except usb.core.USBError as e:
+            # Left detached, the mouse would stay dead until replugged
+            try:
+                if self.reattach:
+                    self.device.attach_kernel_driver(INTERFACE)
+            except usb.core.USBError:
+                pass
+            usb.util.dispose_resources(self.device)
+            self.device = None
+            raise TransportError(f"Cannot claim the mouse: {e}") from None
+
+    def write_feature(self, report_id, payload):
+        try:
+            self.device.ctrl_transfer(0x21, 0x09, report_id, INTERFACE, payload)
+        except self.usb.core.USBError as e:
+            raise TransportError(f"Sending report {report_id:#x} failed: {e}") from None
+
+    def read_input(self, timeout):
+        try:
+            return bytes(self.device.read(STATUS_ENDPOINT, 64, timeout=max(1, int(timeout * 1000))))
+        except self.usb.core.USBTimeoutError:
+            return None
+        except self.usb.core.USBError as e:
+            raise TransportError(f"Reading the status endpoint failed: {e}") from None
+
+    def close(self):
+        if self.device is None:
+            return
+        self.usb.util.release_interface(self.device, INTERFACE)
+        if self.reattach:
+            self.device.attach_kernel_driver(INTERFACE)
+        self.usb.util.dispose_resources(self.device)
+        self.device = None
+
+
+class MockTransport(ReportTransport):
+    """Records every report and acknowledges it, for tests"""
+
+    def __init__(self, charge=100, wired=False, device=None, **kwargs):
+        super().__init__(**kwargs)
+        self.charge = charge
+        self.wired = wired
+        self.device = device
+        self.reports = []
+
+    def write_feature(self, report_id, payload):
+        self.reports.append((report_id, bytes(payload)))
+
+    def read_input(self, timeout):
+        return bytes((0x03, 0x00, protocol.ACK, 0x00, self.charge // 10))
+
+
+class SimulatorTransport(ReportTransport):
+    """Talks to a simulator.SimulatedMouse, set up from the R1_SIM_* environment unless `mouse` is given"""
+
+    def __init__(self, mouse=None, device=None, **kwargs):
+        super().__init__(**kwargs)
+        self.state_path = None
+        if mouse is None:
+            from . import simulator
+
+            mouse, self.state_path = simulator.from_environment()
+        self.mouse = mouse
+        self.wired = mouse.wired
+        self.device = device
+
+    def write_feature(self, report_id, payload):
+        self.mouse.set_feature(report_id, payload)
+
+    def read_input(self, timeout):
+        return self.mouse.read_input(timeout)
+
+    def close(self):
+        if self.state_path:
+            self.mouse.save(self.state_path)
+            self.state_path = None
+
+
+class ServiceTransport(Transport):
+    """Sends everything through the session bus service, with `gdbus call`
+
+    The service opened its mouse when it started, so `device` is not
+    used; it is accepted like every transport accepts it.
+    """
+
+    # The service logs what it sends
+    trace_mode = None
+
+    def __init__(self, device=None, timeout=10):
+        self.device = device
+        self.timeout = timeout
+
+    def call(self, method, *args, timeout=None):
+        """Call a service method; returns gdbus' output, e.g. "(80,)" """
+        from .service import GDBUS_CALL, INTERFACE
+
+        timeout = timeout or self.timeout
+        command = GDBUS_CALL + ['--method', f'{INTERFACE}.{method}', '--timeout', str(max(1, round(timeout)))]
+        try:
+            result = subprocess.run(command + list(args), capture_output=True, text=True)
+        except FileNotFoundError:
+            raise TransportError("gdbus not found, it comes with GLib") from None
+        if result.returncode != 0:
+            message = result.stderr.strip()
+            if 'ServiceUnknown' in message or 'NameHasNoOwner' in message:
+                raise TransportError("The service is not running, start it with `python3 -m attack_shark_r1 service`")
+            # Error: GDBus.Error:io.github.xbbx.AttackSharkR1.Error.TransportError: message
+            match = re.search(r'GDBus\.Error:[\w.]+: (.*)', message, re.DOTALL)
+            raise TransportError(match.group(1) if match else message)
+        return result.stdout.strip()
+
+    def apply(self, state, groups, reapply=False, timeout=None):
+        from .service import format_changes
+
+        changes = {field: getattr(state, field) for group in groups for field in REPORT_GROUPS[group]}
+        self.call('ApplySettings', format_changes(changes), timeout=timeout)
+
+    def send_reports(self, reports, timeout=None):
+        from .service import format_changes, report_changes
+
+        self.call('ApplySettings', format_changes(report_changes(reports)), timeout=timeout)
+
+    def query_charge(self, timeout=None):
+        output = self.call('QueryCharge', timeout=timeout)
+        try:
+            return int(output.strip('(,)'))
+        except ValueError:
+            raise TransportError(f"Unexpected service output {output!r}") from None
+
+
+TRANSPORTS = {
+    'driver': DriverTransport,
+    'hidraw': HidrawTransport,
+    'libusb': LibusbTransport,
+    'mock': MockTransport,
+    'sim': SimulatorTransport,
+    'service': ServiceTransport,
+}
+
+
+def open_transport(name, **kwargs):
+    """Create the transport called `name` (see TRANSPORTS)"""
+    try:
+        factory = TRANSPORTS[name]
+    except KeyError:
+        raise TransportError(f"Unknown transport {name!r}") from None
+    return factory(**kwargs)
@@ -0,0 +1,113 @@
+"""
+Settings validation mirroring the driver's load_config rules
+
+Each Field carries the CfgErr names main.odin reports when the value is
+missing or invalid, so a value rejected here is exactly one the driver
+would reject, without spawning it or touching the device.
+"""
+
+from collections import namedtuple
+
+POLLING_RATES = (125, 250, 500, 1000)
+
+# A settings field: CfgErr for a missing value, CfgErr for an invalid one,
+# the check an individual value must pass and the message shown for it
+Field = namedtuple('Field', ['name', 'missing', 'invalid', 'check', 'message'])
+
+# A failed check; `slot` is the 1-based DPI slot for per-slot problems
+Problem = namedtuple('Problem', ['field', 'error', 'message', 'slot'], defaults=[None])
+
+
+def _is_bool(value):
+    return isinstance(value, bool)
+
+
+def _is_int(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def valid_dpi(value):
+    return _is_int(value) and 100 <= value <= 18000 and value % 100 == 0
+
+
+SCHEMA = (
+    Field('polling_rate', 'PollRateNotProvided', 'InvalidPollRate',
+          lambda v: v in POLLING_RATES,
+          "Polling rate must be 125, 250, 500 or 1000 Hz"),
+    Field('dpis', 'DpiValuesNotProvided', 'InvalidDpiValue',
+          valid_dpi,
+          "DPI must be a multiple of 100 between 100 and 18000"),
+    Field('active_dpi', 'ActiveDpiNotProvided', 'InvalidActiveDpiValue',
+          lambda v: _is_int(v) and 1 <= v <= 6,
+          "Active DPI slot must be between 1 and 6"),
+    Field('sleep_time', 'SleepTimeNotProvided', 'InvalidSleepTime',
+          lambda v: _is_number(v) and 0.5 <= v <= 30,
+          "Sleep time must be between 0.5 and 30"),
+    Field('deep_sleep_time', 'DeepSleepTimeNotProvided', 'InvalidDeepSleepTime',
+          lambda v: _is_int(v) and 1 <= v <= 60,
+          "Deep sleep time must be between 1 and 60"),
+    Field('key_response_time', 'KeyRespTimeNotProvided', 'InvalidKeyRespTime',
+          lambda v: _is_int(v) and 4 <= v <= 50 and v % 2 == 0,
+          "Key response time must be an even number between 4 and 50 ms"),
+    Field('angle_snap', 'AngleSnapNotProvided', 'InvalidAngleSnap',
+          _is_bool,
+          "Angle snap must be true or false"),
+    Field('ripple_control', 'RippleControlNotProvided', 'InvalidRippleControl',
+          _is_bool,
+          "Ripple control must be true or false"),
+)
+
+FIELDS = {field.name: field for field in SCHEMA}
+
+
+def validate_dpi(slot, value, allow_disabled=False):
+    """Check one DPI slot; 0 marks a slot the GUI leaves to the driver's config"""
+    if allow_disabled and value == 0:
+        return None
+    field = FIELDS['dpis']
+    if not field.check(value):
+        return Problem('dpis', field.invalid, f"Slot {slot}: {field.message}", slot)
+    return None
+
+
+def validate_field(name, value):
+    """Check a single scalar field, returning a Problem or None"""
+    field = FIELDS[name]
+    if value is None:
+        return Problem(name, field.missing, f"{name} is not set")
+    if not field.check(value):
+        return Problem(name, field.invalid, field.message)
+    return None
+
+
+def validate(settings, allow_disabled_dpis=False):
+    """Check every field of a settings snapshot, returning the list of problems
+
+    `settings` is anything with the AppliedState attributes; missing
+    attributes are reported with the driver's *NotProvided error.
+    """
+    problems = []
+    for field in SCHEMA:
+        value = getattr(settings, field.name, None)
+        if field.name != 'dpis':
+            problem = validate_field(field.name, value)
+            if problem is not None:
+                problems.append(problem)
+            continue
+
+        if value is None:
+            problems.append(Problem('dpis', field.missing, "DPI values are not set"))
+        elif len(value) < 6:
+            problems.append(Problem('dpis', 'NotEnoughDpiValues', "Exactly 6 DPI values are needed"))
+        elif len(value) > 6:
+            problems.append(Problem('dpis', 'TooMuchDpiValues', "Exactly 6 DPI values are needed"))
+        else:
+            for slot, dpi in enumerate(value, start=1):
+                problem = validate_dpi(slot, dpi, allow_disabled_dpis)
+                if problem is not None:
+                    problems.append(problem)
+    return problems
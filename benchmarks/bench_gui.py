@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""
+End-to-end benchmark of the GUI's apply and query paths
+
+Runs the real AttackSharkWindow against benchmarks/fake_driver.py, put on
+PATH as attack-shark-r1-driver, and measures the time from the button
+handler to the status bar update that ends the command. Bursts of applies
+show how well the executor keeps up with (and coalesces) rapid clicks.
+
+Needs GTK 4 and a display; without one run it under Xvfb. From the
+repository root:
+
+    xvfb-run python3 benchmarks/bench_gui.py --json bench-gui.json
+
+HOME and XDG_STATE_HOME point at a temporary directory for the run, so
+the benchmark never touches your config, battery history or trace log.
+"""
+
+import argparse
+import json
+import os
+import shlex
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FAKE_DRIVER = os.path.join(ROOT, "benchmarks", "fake_driver.py")
+sys.path.insert(0, ROOT)
+
+# Executor paths: driver session, one driver run per command, direct transport thread
+# (to the simulated mouse)
+MODES = ('session', 'oneshot', 'direct')
+
+# Bumped whenever the meaning of a field in the results changes
+RESULTS_VERSION = 2
+
+
+def percentile(samples, p):
+    """Linearly interpolated percentile of `samples`"""
+    ordered = sorted(samples)
+    k = (len(ordered) - 1) * p / 100
+    low = int(k)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (k - low)
+
+
+def latency_stats(samples, failures):
+    return {
+        'n': len(samples),
+        'failures': failures,
+        'p50_ms': round(percentile(samples, 50) * 1000, 3),
+        'p95_ms': round(percentile(samples, 95) * 1000, 3),
+        'p99_ms': round(percentile(samples, 99) * 1000, 3),
+    }
+
+
+def install_fake_driver(bin_dir):
+    """Put an attack-shark-r1-driver running fake_driver.py into `bin_dir`"""
+    path = os.path.join(bin_dir, 'attack-shark-r1-driver')
+    with open(path, 'w') as f:
+        f.write(f'#!/bin/sh\nexec {shlex.quote(sys.executable)} {shlex.quote(FAKE_DRIVER)} "$@"\n')
+    os.chmod(path, 0o755)
+
+
+class Harness:
+    """Drives one AttackSharkWindow from the GLib main loop and records its status bar"""
+
+    def __init__(self, gui):
+        from gi.repository import GLib
+
+        self.context = GLib.MainContext.default()
+        self.window = gui.AttackSharkWindow(None)
+
+        # Dialogs would pile up, background queries would compete with the clicks
+        self.window.show_message_dialog = lambda *args: None
+        self.window.show_error_dialog = lambda *args: None
+        self.window.on_battery_monitor_changed(None, False)
+
+        self.statuses = []
+        update_status = self.window.update_status
+
+        def record(message):
+            self.statuses.append((time.perf_counter(), message))
+            update_status(message)
+
+        self.window.update_status = record
+
+    def set_mode(self, mode):
+        window = self.window
+        window.session.close()
+        window.executor.close()
+        window.use_session = mode == 'session'
+        window.transport = 'sim' if mode == 'direct' else 'driver'
+
+    def click(self, action, busy_message, timeout=30):
+        """Run a button handler; return the seconds until its final status and that status"""
+        mark = len(self.statuses)
+        start = time.perf_counter()
+        action()
+        while time.perf_counter() - start < timeout:
+            for when, message in self.statuses[mark:]:
+                if message != busy_message:
+                    return when - start, message
+            self.context.iteration(True)
+        raise TimeoutError(f"No status update within {timeout} s")
+
+    def apply(self):
+        window = self.window
+        # Always leave something to send
+        window.polling_rate = 500 if window.polling_rate == 1000 else 1000
+        return self.click(lambda: window.on_apply_settings(None), "Applying settings...")
+
+    def query(self):
+        return self.click(lambda: self.window.on_query_charge(None), "Querying battery charge...")
+
+    def burst(self, clicks, timeout=60):
+        """Click Apply `clicks` times at once; return the seconds until the executor is idle"""
+        window = self.window
+        start = time.perf_counter()
+        for _ in range(clicks):
+            window.polling_rate = 500 if window.polling_rate == 1000 else 1000
+            window.on_apply_settings(None)
+        while window.executor.busy():
+            if time.perf_counter() - start > timeout:
+                raise TimeoutError(f"Burst not done within {timeout} s")
+            self.context.iteration(True)
+        return time.perf_counter() - start
+
+    def close(self):
+        self.window.on_close_request(self.window)
+
+
+def measure(harness, run, iterations):
+    samples = []
+    failures = 0
+    for _ in range(iterations):
+        elapsed, message = run()
+        samples.append(elapsed)
+        if message.startswith(("Error", "Failed", "Driver")):
+            failures += 1
+    return latency_stats(samples, failures)
+
+
+def count_lines(path):
+    try:
+        with open(path) as f:
+            return sum(1 for _ in f)
+    except FileNotFoundError:
+        return 0
+
+
+def run_mode(harness, mode, args, log_path):
+    harness.set_mode(mode)
+    # The first command pays for starting the session or opening the transport
+    first, _ = harness.apply()
+
+    result = {
+        'first_apply_ms': round(first * 1000, 3),
+        'apply': measure(harness, harness.apply, args.iterations),
+        'query': measure(harness, harness.query, args.iterations),
+    }
+
+    runs_before = count_lines(log_path)
+    elapsed = harness.burst(args.burst)
+    result['burst'] = {
+        'clicks': args.burst,
+        # Only driver modes log runs; coalescing makes this smaller than clicks
+        'driver_runs': count_lines(log_path) - runs_before if mode != 'direct' else None,
+        'elapsed_ms': round(elapsed * 1000, 3),
+        'clicks_per_s': round(args.burst / elapsed, 1),
+    }
+    return result
+
+
+def print_results(results):
+    print(f"{'mode':<10} {'op':<6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'fail':>5}")
+    for mode, result in results.items():
+        for op in ('apply', 'query'):
+            stats = result[op]
+            print(f"{mode:<10} {op:<6} {stats['p50_ms']:>9.2f} {stats['p95_ms']:>9.2f} "
+                  f"{stats['p99_ms']:>9.2f} {stats['failures']:>5}")
+        burst = result['burst']
+        runs = '' if burst['driver_runs'] is None else f", {burst['driver_runs']} driver runs"
+        print(f"{mode:<10} burst  {burst['clicks']} clicks in {burst['elapsed_ms']:.1f} ms "
+              f"({burst['clicks_per_s']:.1f}/s{runs})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--iterations', type=int, default=50, help="clicks per measurement")
+    parser.add_argument('--burst', type=int, default=20, help="applies clicked at once")
+    parser.add_argument('--spawn-ms', type=float, default=20, help="fake driver start-up time")
+    parser.add_argument('--ack-ms', type=float, default=2, help="fake time per report ack")
+    parser.add_argument('--fail-rate', type=float, default=0, help="fraction of failing commands")
+    parser.add_argument('--modes', default=','.join(MODES), help="comma separated subset of " + ', '.join(MODES))
+    parser.add_argument('--json', metavar='PATH', help="write the results here")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="r1-bench-") as tmp:
+        bin_dir = os.path.join(tmp, 'bin')
+        os.mkdir(bin_dir)
+        install_fake_driver(bin_dir)
+        log_path = os.path.join(tmp, 'driver.log')
+        os.environ.update({
+            'PATH': bin_dir + os.pathsep + os.environ.get('PATH', ''),
+            'HOME': tmp,
+            'XDG_STATE_HOME': os.path.join(tmp, 'state'),
+            'XDG_CONFIG_HOME': os.path.join(tmp, 'config'),
+            'FAKE_R1_SPAWN_MS': str(args.spawn_ms),
+            'FAKE_R1_ACK_MS': str(args.ack_ms),
+            'FAKE_R1_FAIL_RATE': str(args.fail_rate),
+            'FAKE_R1_LOG': log_path,
+            'R1_SIM_ACK_MS': str(args.ack_ms),
+        })
+
+        # Imported late so the window picks up the environment above
+        from attack_shark_r1 import gui
+
+        harness = Harness(gui)
+        try:
+            results = {mode: run_mode(harness, mode, args, log_path) for mode in args.modes.split(',')}
+        finally:
+            harness.close()
+
+    print_results(results)
+    if args.json:
+        report = {
+            'version': RESULTS_VERSION,
+            'python': sys.version.split()[0],
+            'parameters': {
+                'iterations': args.iterations,
+                'burst': args.burst,
+                'spawn_ms': args.spawn_ms,
+                'ack_ms': args.ack_ms,
+                'fail_rate': args.fail_rate,
+            },
+            'results': results,
+        }
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+            f.write('\n')
+
+
+if __name__ == "__main__":
+    main()
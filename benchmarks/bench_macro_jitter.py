@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Timing jitter of macro playback under CPU load
+
+Compiles a macro of evenly spaced key presses and plays it with
+attack_shark_r1.macros.play(), into a MockSink or a real uinput device,
+while `--load` processes keep CPUs busy. Every write's lateness against its
+scheduled time on the monotonic clock is recorded, as is the error of every
+interval between consecutive writes. From the repository root:
+
+    python3 benchmarks/bench_macro_jitter.py --load 4 --json bench-macro.json
+
+The budget, p99 of both under a millisecond, holds under SCHED_FIFO, or at
+normal priority while a CPU is left free (--load below the CPU count). Play
+runs under SCHED_FIFO like `macro play` does, which needs CAP_SYS_NICE or
+an rtprio limit; without it, or with --no-realtime, the run goes on at
+normal priority and says so. A run outside those conditions reports its
+numbers without judging them and exits 0; --uinput needs write access to
+/dev/uinput.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+from array import array
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from attack_shark_r1 import macros
+
+BUDGET_MS = 1.0
+
+# Bumped whenever the meaning of a field in the results changes
+RESULTS_VERSION = 2
+
+
+def percentile(samples, p):
+    """Linearly interpolated percentile of `samples`"""
+    ordered = sorted(samples)
+    k = (len(ordered) - 1) * p / 100
+    low = int(k)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (k - low)
+
+
+def spin():
+    """Keep one CPU busy until killed"""
+    n = 0
+    while True:
+        n = (n * 31 + 7) % 1000003
+
+
+def stats(samples_ns):
+    return {
+        'n': len(samples_ns),
+        'p50_ms': round(percentile(samples_ns, 50) / 1e6, 4),
+        'p99_ms': round(percentile(samples_ns, 99) / 1e6, 4),
+        'max_ms': round(max(samples_ns) / 1e6, 4),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--events', type=int, default=500, help="key taps to play")
+    parser.add_argument('--interval-ms', type=float, default=5, help="time from one tap to the next")
+    parser.add_argument('--load', type=int, default=os.cpu_count() or 1, help="busy processes running meanwhile")
+    parser.add_argument('--uinput', action='store_true', help="write to a real uinput device instead of a MockSink")
+    parser.add_argument('--no-realtime', dest='realtime', action='store_false',
+                        help="play at normal priority instead of under SCHED_FIFO")
+    parser.add_argument('--json', metavar='PATH', help="write the results here")
+    args = parser.parse_args()
+
+    # Taps are down, TAP_MS, up; the rest of the interval follows the release
+    rest = max(args.interval_ms - macros.TAP_MS, 0)
+    steps = ', '.join(f"KEY_A, {rest:g}ms" for _ in range(args.events))
+    compiled = macros.compile_macro(steps)
+    moments = len(compiled.times)
+
+    # Started first, so they keep the normal priority
+    workers = [multiprocessing.Process(target=spin, daemon=True) for _ in range(args.load)]
+    for worker in workers:
+        worker.start()
+    realtime = macros.realtime() if args.realtime else False
+    if args.realtime and not realtime:
+        print("Not allowed to use SCHED_FIFO, playing at normal priority", file=sys.stderr)
+    # With every CPU busy only SCHED_FIFO keeps playback from waiting out other processes' time slices
+    budget_applies = realtime or args.load < (os.cpu_count() or 1)
+
+    sink = macros.UinputSink(compiled.codes) if args.uinput else macros.MockSink(moments)
+    lateness = array('q', bytes(8 * moments))
+    try:
+        macros.play(compiled, sink, lateness)
+    finally:
+        sink.close()
+        for worker in workers:
+            worker.terminate()
+        for worker in workers:
+            worker.join()
+
+    # Interval error: how far each gap between writes is from the planned one
+    intervals = [abs(lateness[i] - lateness[i - 1]) for i in range(1, moments)]
+    results = {'lateness': stats(lateness), 'interval_error': stats(intervals)}
+    passed = None
+    if budget_applies:
+        passed = results['lateness']['p99_ms'] < BUDGET_MS and results['interval_error']['p99_ms'] < BUDGET_MS
+
+    print(f"{moments} writes over {compiled.times[-1] / 1e9:.2f} s, {args.load} busy processes, "
+          f"{'uinput' if args.uinput else 'mock sink'}{', SCHED_FIFO' if realtime else ''}")
+    for name, result in results.items():
+        print(f"{name:<16} p50 {result['p50_ms']:.3f} ms  p99 {result['p99_ms']:.3f} ms  max {result['max_ms']:.3f} ms")
+    if passed is None:
+        print(f"NOT JUDGED: the {BUDGET_MS:g} ms budget needs SCHED_FIFO or fewer busy processes than CPUs")
+    else:
+        print(f"{'PASS' if passed else 'FAIL'}: p99 {'under' if passed else 'over'} {BUDGET_MS:g} ms")
+
+    if args.json:
+        report = {
+            'version': RESULTS_VERSION,
+            'python': sys.version.split()[0],
+            'parameters': {
+                'events': args.events,
+                'interval_ms': args.interval_ms,
+                'load': args.load,
+                'uinput': args.uinput,
+                'realtime': realtime,
+            },
+            'results': results,
+            'budget_applies': budget_applies,
+            'passed': passed,
+        }
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+            f.write('\n')
+    return 1 if passed is False else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark of the R1 report encoders
+
+Checks the golden vectors first, then prints encodes per second for each
+report type. Run from the repository root:
+
+    python3 benchmarks/bench_protocol.py
+"""
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from attack_shark_r1 import golden, protocol
+
+
+def bench(name, stmt, number):
+    """Time `stmt` and print the best rate of five runs"""
+    best = min(timeit.repeat(stmt, number=number, repeat=5))
+    print(f"{name:<24} {number / best:>12,.0f} encodes/s")
+
+
+def main():
+    mismatches = golden.check()
+    if mismatches:
+        for mismatch in mismatches:
+            print(mismatch, file=sys.stderr)
+        sys.exit(1)
+    print(f"{len(golden.GOLDEN_VECTORS)} golden vectors match")
+
+    dpis = [800, 1600, 3200, 4000, 5000, 12000]
+    bench("encode_dpi_report", lambda: protocol.encode_dpi_report(dpis, 3, True, False), 100000)
+    bench("encode_times_report", lambda: protocol.encode_times_report(6, 12, 4), 200000)
+    bench("encode_polling_report", lambda: protocol.encode_polling_report(1000), 200000)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Stand-in for attack-shark-r1-driver used by the GUI benchmarks
+
+Speaks the driver's command line and -session protocol without a mouse.
+Its behaviour comes from the environment:
+
+    FAKE_R1_SPAWN_MS   time to start up and open the mouse (default 20)
+    FAKE_R1_ACK_MS     time until each report is acknowledged (default 2)
+    FAKE_R1_FAIL_RATE  fraction of commands failing as unreachable (default 0)
+    FAKE_R1_CHARGE     charge reported by -query-charge (default 80)
+    FAKE_R1_SEED       seed for the failures (default 1)
+    FAKE_R1_LOG        file receiving one line per command, if set
+"""
+
+import json
+import os
+import random
+import sys
+import time
+
+SPAWN = float(os.environ.get('FAKE_R1_SPAWN_MS', 20)) / 1000
+ACK = float(os.environ.get('FAKE_R1_ACK_MS', 2)) / 1000
+FAIL_RATE = float(os.environ.get('FAKE_R1_FAIL_RATE', 0))
+CHARGE = int(os.environ.get('FAKE_R1_CHARGE', 80))
+LOG = os.environ.get('FAKE_R1_LOG')
+
+# Different per process, reproducible per run
+rng = random.Random(f"{os.environ.get('FAKE_R1_SEED', 1)}:{os.getpid()}")
+
+
+def parse(args):
+    """Split -name=value and -name flags into a dict"""
+    opts = {}
+    for arg in args:
+        name, _, value = arg.lstrip('-').partition('=')
+        opts[name] = value or True
+    return opts
+
+
+def reports_for(opts):
+    """Report IDs the real driver would send for these flags"""
+    if 'reapply-config' in opts:
+        return [0x306, 0x305, 0x304]
+    reports = []
+    if 'polling-rate' in opts:
+        reports.append(0x306)
+    if any(name in opts for name in ('sleep-time', 'deep-sleep-time', 'key-response-time')):
+        reports.append(0x305)
+    if any(name.startswith('dpi') or name in ('active-dpi', 'angle-snap', 'ripple-control') for name in opts):
+        reports.append(0x304)
+    return reports
+
+
+def run_command(opts, start):
+    """Simulate one command; returns (reply, error, spans) with spans relative to `start`"""
+    spans = []
+    if LOG:
+        with open(LOG, 'a') as f:
+            f.write(' '.join(sorted(opts)) + '\n')
+
+    reports = reports_for(opts)
+    if reports and rng.random() < FAIL_RATE:
+        time.sleep(ACK * 5)
+        return None, f"device unreachable after 5 tries in {ACK * 5000:.0f} ms (report {reports[0]:#x})", spans
+
+    for report in reports:
+        report_start = time.monotonic()
+        time.sleep(ACK)
+        spans.append({'phase': 'report', 'start_us': int((report_start - start) * 1e6),
+                      'us': int((time.monotonic() - report_start) * 1e6), 'report': report, 'tries': 1})
+    reply = str(CHARGE) if 'query-charge' in opts else ''
+    return reply, None, spans
+
+
+def print_trace(start, spans):
+    trace = {'total_us': int((time.monotonic() - start) * 1e6), 'spans': spans}
+    print('trace', json.dumps(trace, separators=(',', ':')))
+
+
+def session(opts):
+    start = time.monotonic()
+    time.sleep(SPAWN)
+    if 'trace' in opts:
+        print_trace(start, [{'phase': 'open', 'start_us': 0, 'us': int(SPAWN * 1e6)}])
+    print('ready', flush=True)
+    for line in sys.stdin:
+        line = line.strip()
+        if not line:
+            continue
+        if line == 'quit':
+            break
+        start = time.monotonic()
+        command = parse(line.split())
+        reply, error, spans = run_command(command, start)
+        if 'trace' in command:
+            print_trace(start, spans)
+        if error is not None:
+            print('error', error)
+        elif reply:
+            print('ok', reply)
+        else:
+            print('ok')
+        sys.stdout.flush()
+
+
+def main():
+    opts = parse(sys.argv[1:])
+    if 'session' in opts:
+        session(opts)
+        return
+
+    start = time.monotonic()
+    time.sleep(SPAWN)
+    reply, error, spans = run_command(opts, start)
+    if 'trace' in opts:
+        print_trace(start, [{'phase': 'open', 'start_us': 0, 'us': int(SPAWN * 1e6)}] + spans)
+    if error is not None:
+        print('ERROR:', error, file=sys.stderr)
+        sys.exit(1)
+    if reply:
+        print(reply)
+
+
+if __name__ == "__main__":
+    main()
@@ -10,6 +10,9 @@ import "core:c"
 import "core:strconv"
 import "core:path/filepath"
 import "core:flags"
+import "core:bufio"
+import "core:time"
+import "core:encoding/hex"
 import "base:runtime"
 import "libusb"
 import "ini"
@@ -20,7 +23,143 @@ INTERFACE :: 2
 
 wired := false
 
-open_mouse :: proc(ctx: libusb.Context) -> (dev_handle: libusb.Device_Handle, has_kern_driver: bool, err: libusb.Error) {
+// Bounds on waiting for the receiver's 0x50 ack to a wireless report
+AckOptions :: struct {
+    timeout_ms:   u32,       // per interrupt read
+    max_retries:  int,       // sends of one report before giving up
+    has_deadline: bool,      // whole command must finish by `deadline`
+    deadline:     time.Time,
+}
+ack_options := AckOptions{timeout_ms = 250, max_retries = 5}
+
+// Tries and time spent on the last report that was not acknowledged
+AckStats :: struct {
+    report:  u16,
+    tries:   int,
+    elapsed: time.Duration,
+}
+ack_stats: AckStats
+
+AckErr :: enum {
+    None,
+    DeviceUnreachable,
+}
+
+// Timestamped phases of a command, printed as one "trace <json>" line with -trace
+Span :: struct {
+    phase:  string,
+    report: u16,           // only set for "report" spans
+    tries:  int,
+    start:  time.Duration, // since trace_start
+    length: time.Duration,
+}
+tracing := false
+trace_start: time.Time
+spans: [dynamic]Span
+
+trace_span :: proc(phase: string, start: time.Time, report: u16 = 0, tries: int = 0) {
+    if !tracing do return
+    append(&spans, Span{phase, report, tries, time.diff(trace_start, start), time.since(start)})
+}
+// Prints and clears the recorded spans, e.g.
+// trace {"total_us":5120,"spans":[{"phase":"open","start_us":310,"us":2650},{"phase":"report","start_us":4020,"us":980,"report":774,"tries":1}]}
+print_trace :: proc() {
+    if !tracing do return
+    us :: proc(d: time.Duration) -> i64 { return i64(time.duration_microseconds(d)) }
+
+    b := strings.builder_make(context.temp_allocator)
+    fmt.sbprintf(&b, `{"total_us":%d,"spans":[`, us(time.since(trace_start)))
+    for span, i in spans {
+        if i > 0 do strings.write_byte(&b, ',')
+        fmt.sbprintf(&b, `{"phase":"%s","start_us":%d,"us":%d`, span.phase, us(span.start), us(span.length))
+        if span.report != 0 do fmt.sbprintf(&b, `,"report":%d,"tries":%d`, span.report, span.tries)
+        strings.write_byte(&b, '}')
+    }
+    strings.write_string(&b, "]}")
+    fmt.println("trace", strings.to_string(b))
+    clear(&spans)
+}
+
+is_r1 :: proc(desc: libusb.Device_Descriptor) -> bool {
+    return desc.idVendor == VID && (desc.idProduct == PID || desc.idProduct == WIRED_PID)
+}
+// Bus and port path, e.g. "3-1.4", the same name the device has under /sys/bus/usb/devices.
+// It stays the same as long as the receiver or cable stays in the same port.
+device_id :: proc(dev: libusb.Device) -> string {
+    ports: [7]u8
+    count := libusb.get_port_numbers(dev, &ports[0], i32(len(ports)))
+    b := strings.builder_make(context.temp_allocator)
+    fmt.sbprintf(&b, "%d", libusb.get_bus_number(dev))
+    for port, i in ports[:max(count, 0)] {
+        strings.write_byte(&b, '-' if i == 0 else '.')
+        fmt.sbprintf(&b, "%d", port)
+    }
+    return strings.to_string(b)
+}
+// Prints one line per R1: id, wired|wireless and the serial number, "-" if it has none
+list_devices :: proc(ctx: libusb.Context) {
+    devs_raw: [^]libusb.Device = nil
+    count := libusb.get_device_list(ctx, &devs_raw)
+    if count < 0 do return
+    defer libusb.free_device_list(devs_raw, 1)
+    for idev in devs_raw[:count] {
+        desc: libusb.Device_Descriptor = {}
+        if libusb.get_device_descriptor(idev, &desc) != .SUCCESS || !is_r1(desc) do continue
+        serial := "-"
+        handle: libusb.Device_Handle = nil
+        if desc.iSerialNumber != 0 && libusb.open(idev, &handle) == .SUCCESS {
+            buf: [128]u8
+            n := libusb.get_string_descriptor_ascii(handle, desc.iSerialNumber, &buf[0], i32(len(buf)))
+            if n > 0 do serial = strings.clone(string(buf[:n]), context.temp_allocator)
+            libusb.close(handle)
+        }
+        fmt.println(device_id(idev), "wired" if desc.idProduct == WIRED_PID else "wireless", serial)
+    }
+}
+
+// Binary log of every transfer, written with -capture and read by attack_shark_r1/capture.py:
+// the header "R1CAP\x00" + version (u16le), then a CaptureRecord followed by its payload per transfer
+CAPTURE_MAGIC   :: "R1CAP\x00"
+CAPTURE_VERSION :: 1
+CaptureRecord :: struct #packed {
+    time_us:   u64le, // since the capture was opened
+    direction: u8,    // 0 host to device, 1 device to host
+    value:     u16le, // wValue of control transfers, the endpoint of interrupt transfers
+    length:    u16le,
+}
+capturing := false
+capture_file: os.Handle
+capture_start: time.Time
+
+open_capture :: proc(path: string) -> os.Error {
+    capture_file = os.open(path, os.O_WRONLY | os.O_CREATE | os.O_TRUNC, 0o644) or_return
+    version := u16le(CAPTURE_VERSION)
+    os.write_string(capture_file, CAPTURE_MAGIC) or_return
+    os.write(capture_file, mem.ptr_to_bytes(&version)) or_return
+    capturing = true
+    capture_start = time.now()
+    return nil
+}
+capture_transfer :: proc(direction: u8, value: u16, data: []u8) {
+    if !capturing do return
+    record := CaptureRecord{
+        time_us   = u64le(u64(time.duration_microseconds(time.since(capture_start)))),
+        direction = direction,
+        value     = u16le(value),
+        length    = u16le(len(data)),
+    }
+    // A full disk shouldn't break the command being captured
+    os.write(capture_file, mem.ptr_to_bytes(&record))
+    os.write(capture_file, data)
+}
+close_capture :: proc() {
+    if !capturing do return
+    capturing = false
+    os.close(capture_file)
+}
+
+// Opens the R1 whose device_id is `want`, or the first one found if `want` is empty
+open_mouse :: proc(ctx: libusb.Context, want: string = "") -> (dev_handle: libusb.Device_Handle, has_kern_driver: bool, err: libusb.Error) {
     dev: libusb.Device = nil
     devs_raw: [^]libusb.Device = nil 
     count := libusb.get_device_list(ctx, &devs_raw)
@@ -28,7 +167,7 @@ open_mouse :: proc(ctx: libusb.Context) -> (dev_handle: libusb.Device_Handle, ha
     for idev in devs {
         desc: libusb.Device_Descriptor = {}
         if libusb.get_device_descriptor(idev, &desc) != .SUCCESS do continue
-        if desc.idProduct == PID && desc.idVendor == VID || desc.idProduct == WIRED_PID {
+        if is_r1(desc) && (want == "" || device_id(idev) == want) {
             dev = idev
             wired = desc.idProduct == WIRED_PID
             break
@@ -40,8 +179,10 @@ open_mouse :: proc(ctx: libusb.Context) -> (dev_handle: libusb.Device_Handle, ha
     dev_handle = nil
     libusb.open(dev, &dev_handle) or_return
     
+    start := time.now()
     has_kern_driver = libusb.kernel_driver_active(dev_handle, INTERFACE) != .SUCCESS
     if has_kern_driver do libusb.detach_kernel_driver(dev_handle, INTERFACE)
+    trace_span("detach", start)
 
 
     return dev_handle, has_kern_driver, .SUCCESS
@@ -55,34 +196,63 @@ PollingRate :: enum u16 {
 }
 ctrl_transfer :: proc (dev_handle: libusb.Device_Handle, reqType: u8, req: u8, value: u16, index: u16, data: []u8) -> libusb.Error {
     err := libusb.control_transfer(dev_handle, reqType, req, value, index, slice.as_ptr(data), u16(len(data)), 0)
-    if int(err) >= 0 do return nil
+    if int(err) >= 0 {
+        capture_transfer(reqType >> 7, value, data)
+        return nil
+    }
     return err
 }
-interrupt_transfer :: proc(dev_handle: libusb.Device_Handle, endpoint: u8, buf: []u8) -> libusb.Error {
+interrupt_transfer :: proc(dev_handle: libusb.Device_Handle, endpoint: u8, buf: []u8, timeout_ms: u32 = 0) -> libusb.Error {
     t := i32(0)
-    err := libusb.interrupt_transfer(dev_handle, endpoint, slice.as_ptr(buf), i32(len(buf)), &t, 0) 
-    if int(err) >= 0 do return nil
+    err := libusb.interrupt_transfer(dev_handle, endpoint, slice.as_ptr(buf), i32(len(buf)), &t, c.uint(timeout_ms)) 
+    if int(err) >= 0 {
+        capture_transfer(endpoint >> 7, u16(endpoint), buf[:t])
+        return nil
+    }
     return err
 }
-
-set_times :: proc (dev_handle: libusb.Device_Handle, sleep_time: f64, deep_sleep: int, key_resp: int) -> libusb.Error {
-    t := i32(0)
-    for {
-        payload := [?]u8{0x5, 0xf, 0x1, 0x0, 0x03 /*deep sleep 4bit higher*/, 0x18 /*0xF0 deep sleep 4 bit lower*/, 0x0, 0x0, 0xff, 0x4 /*sleep time (0.5 * value)*/, 0x2 /*key resp time (2 * value)*/, 0x1, 0x20 /*checksum*/, 0x0, 0x0};
-        payload[4] = 0x03 | u8(deep_sleep & 0xF0)
-        payload[5] = 0x08 | u8((deep_sleep & 0x0F) << 4)
-        payload[9] = u8(int(sleep_time * 2))
-        payload[10] = u8(key_resp / 2)
-        payload[12] = ((u8(deep_sleep) & 0xF + (u8(deep_sleep & 0xF0) >> 4) & 0xF) << 4) + 0xa + payload[9] + payload[10]
-        ctrl_transfer(dev_handle, 0x21, 0x9, 0x305, INTERFACE, payload[:]) or_return
+// Milliseconds left before the command deadline, capped at `limit`. 0 once it has passed.
+remaining_ms :: proc(limit: u32) -> u32 {
+    if !ack_options.has_deadline do return limit
+    left := time.duration_milliseconds(time.diff(time.now(), ack_options.deadline))
+    if left <= 0 do return 0
+    return min(limit, u32(left) + 1)
+}
+// Sends a feature report; when wireless, resends it with exponential backoff
+// until the receiver acks it, up to ack_options.max_retries times or the deadline.
+send_report :: proc(dev_handle: libusb.Device_Handle, report: u16, payload: []u8) -> DriverError {
+    start := time.now()
+    backoff := 10 * time.Millisecond
+    tries := 0
+    defer trace_span("report", start, report, tries)
+    for tries < max(ack_options.max_retries, 1) {
+        ctrl_transfer(dev_handle, 0x21, 0x9, report, INTERFACE, payload) or_return
+        tries += 1
+        if wired do return nil
+
+        timeout := remaining_ms(ack_options.timeout_ms)
+        if timeout == 0 do break
         buf := [5]u8{}
-        if !wired {
-            buf := [5]u8{}
-            interrupt_transfer(dev_handle, 0x83, buf[:]) or_return
-            if buf[2] == 0x50 do break
-        } else do break
+        err := interrupt_transfer(dev_handle, 0x83, buf[:], timeout)
+        if err == nil && buf[2] == 0x50 do return nil
+        if err != nil && err != .TIMEOUT do return err
+
+        if remaining_ms(u32(time.duration_milliseconds(backoff))) == 0 do break
+        time.sleep(backoff)
+        backoff *= 2
     }
-    return nil
+    ack_stats = {report = report, tries = tries, elapsed = time.since(start)}
+    return AckErr.DeviceUnreachable
+}
+
+set_times :: proc (dev_handle: libusb.Device_Handle, sleep_time: f64, deep_sleep: int, key_resp: int) -> DriverError {
+    payload := [?]u8{0x5, 0xf, 0x1, 0x0, 0x03 /*deep sleep 4bit higher*/, 0x18 /*0xF0 deep sleep 4 bit lower*/, 0x0, 0x0, 0xff, 0x4 /*sleep time (0.5 * value)*/, 0x2 /*key resp time (2 * value)*/, 0x1, 0x20 /*checksum*/, 0x0, 0x0};
+    payload[4] = 0x03 | u8(deep_sleep & 0xF0)
+    payload[5] = 0x08 | u8((deep_sleep & 0x0F) << 4)
+    payload[9] = u8(int(sleep_time * 2))
+    payload[10] = u8(key_resp / 2)
+    payload[12] = ((u8(deep_sleep) & 0xF + (u8(deep_sleep & 0xF0) >> 4) & 0xF) << 4) + 0xa + payload[9] + payload[10]
+    return send_report(dev_handle, 0x305, payload[:])
 }
 get_dpi_value :: proc(dpi: int) -> u8 {
     assert(dpi >= 100 && dpi <= 18000) 
@@ -93,60 +263,41 @@ get_dpi_value :: proc(dpi: int) -> u8 {
     index -= 6
     return u8(14 + ((index + 1) / 3) + (index + 1) * 2)
 }
-set_dpis :: proc (dev_handle: libusb.Device_Handle, dpi: [6]int, active_dpi: int, ripple_control: bool, angle_snap: bool) -> libusb.Error {
-    t := i32(0)
-    for {
+set_dpis :: proc (dev_handle: libusb.Device_Handle, dpi: [6]int, active_dpi: int, ripple_control: bool, angle_snap: bool) -> DriverError {
     payload := [?]u8{0x4, 0x38, 0x1, 0x0, 0x0, 0x3f, 0x0, 0x0, 0x2, 0x2, 0x2, 0x2, 0x2, 0x2, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x1, 0xff, 0x0, 0x0, 0x0, 0xff, 0x0, 0x0, 0x0, 0xff, 0xff, 0xff, 0x0, 0x0, 0xff, 0xff, 0xff, 0x0, 0xff, 0xff, 0x40, 0x0, 0xff, 0xff, 0xff, 0x2, 0xd, 0x75, 0x0, 0x0, 0x0, 0x0};
-        checksum := u16(u16(0x0d75))
-        is_bigger_than12K := u8(0)
-        for i in 0..<6 {
-            payload[i + 8] = u8(dpis[dpi[i]])
-            checksum += u16(u8(dpis[dpi[i]]))
-            payload[i+16] = dpi[i] >= 10100 && dpi[i] <= 12000 ? 1 : 0
-            checksum += dpi[i] >= 10100 && dpi[i] <= 12000 ? 1 : 0 
-            if dpi[i] > 12000 {
-                is_bigger_than12K |= 1 << u8(i)
-            }
+    checksum := u16(u16(0x0d75))
+    is_bigger_than12K := u8(0)
+    for i in 0..<6 {
+        payload[i + 8] = u8(dpis[dpi[i]])
+        checksum += u16(u8(dpis[dpi[i]]))
+        payload[i+16] = dpi[i] >= 10100 && dpi[i] <= 12000 ? 1 : 0
+        checksum += dpi[i] >= 10100 && dpi[i] <= 12000 ? 1 : 0 
+        if dpi[i] > 12000 {
+            is_bigger_than12K |= 1 << u8(i)
         }
-        payload[6] = is_bigger_than12K
-        payload[7] = is_bigger_than12K
-        checksum += u16(is_bigger_than12K * 2)
-        payload[24] = u8(active_dpi)
-        checksum += u16(active_dpi - 1)
-
-        if ripple_control {
-            checksum += 1
-            payload[4] = 1
-        }
-        if angle_snap {
-            checksum += 1
-            payload[3] = 1
-        }
-        (transmute(^u16be)&payload[50])^ = u16be(checksum)
-
-        ctrl_transfer(dev_handle, 0x21, 0x9, 0x304, INTERFACE, payload[:]) or_return
-        if !wired {
-            buf := [5]u8{}
-            interrupt_transfer(dev_handle, 0x83, buf[:]) or_return
-            if buf[2] == 0x50 do break
-        } else do break
     }
-    return nil
-}
-set_polling_rate :: proc (dev_handle: libusb.Device_Handle, polling_rate: PollingRate) -> libusb.Error {
-    t := i32(0)
-    for {
-        payload := [9]u8{0x6, 0x9, 0x1, 0x1, 0x0, 0x0, 0x0, 0x0, 0x0}
-        (transmute(^u16)&payload[3])^ = u16(polling_rate)
-        ctrl_transfer(dev_handle, 0x21, 0x9, 0x306, INTERFACE, payload[:]) or_return
-        buf := [5]u8{}
-        if !wired {
-            buf := [5]u8{}
-            interrupt_transfer(dev_handle, 0x83, buf[:]) or_return
-            if buf[2] == 0x50 do break
-        } else do break
+    payload[6] = is_bigger_than12K
+    payload[7] = is_bigger_than12K
+    checksum += u16(is_bigger_than12K * 2)
+    payload[24] = u8(active_dpi)
+    checksum += u16(active_dpi - 1)
+
+    if ripple_control {
+        checksum += 1
+        payload[4] = 1
     }
-    return nil
+    if angle_snap {
+        checksum += 1
+        payload[3] = 1
+    }
+    (transmute(^u16be)&payload[50])^ = u16be(checksum)
+
+    return send_report(dev_handle, 0x304, payload[:])
+}
+set_polling_rate :: proc (dev_handle: libusb.Device_Handle, polling_rate: PollingRate) -> DriverError {
+    payload := [9]u8{0x6, 0x9, 0x1, 0x1, 0x0, 0x0, 0x0, 0x0, 0x0}
+    (transmute(^u16)&payload[3])^ = u16(polling_rate)
+    return send_report(dev_handle, 0x306, payload[:])
 }
 Config :: struct {
     poll:            PollingRate,
@@ -178,6 +329,7 @@ CfgErr :: enum {
     InvalidAngleSnap,
     RippleControlNotProvided,
     InvalidRippleControl,
+    InvalidReport,
 
 }
 ConfigError :: union #shared_nil {
@@ -273,7 +425,7 @@ load_config :: proc(path: string) -> (cfg: Config, err: ConfigError) {
 
     return cfg, nil
 }
-apply_config :: proc(config: Config, mouse: libusb.Device_Handle) -> libusb.Error {
+apply_config :: proc(config: Config, mouse: libusb.Device_Handle) -> DriverError {
     set_polling_rate(mouse, config.poll) or_return
     set_times(mouse, config.sleep_time, config.deep_sleep_time, config.key_resp_time) or_return
     set_dpis(mouse, config.dpis, config.active_dpi, config.ripple_control, config.angle_snap) or_return
@@ -287,32 +439,70 @@ CliOptions :: struct {
     deep_sleep_time: int `usage:"Set deepsleep time [1ms; 60ms]"`,
     reapply_config: bool `usage:"Reapply entire config"`,
     query_charge: bool `usage:"Output current charge"`,
+    trace: bool `usage:"Print the time spent in each phase as a trace <json> line"`,
     ripple_control: string `usage:"Set ripple control(true|false)"`,
     angle_snap: string `usage:"Set angle snap(true|false)"`,
     dpi: map[string]int `usage:"Set dpi"`,
+    report: map[string]string `usage:"Send an encoded report as is, e.g. -report:0x306=06090101fe00000000"`,
     active_dpi: int `usage:"Set active dpi"`,
+    session: bool `usage:"Keep the mouse open and read commands from stdin, one per line"`,
+    ack_timeout_ms: int `usage:"Wait at most this long for each wireless ack (default 250)"`,
+    max_retries: int `usage:"Send a wireless report at most this many times (default 5)"`,
+    deadline_ms: int `usage:"Give up once the command has taken this long"`,
+    list_devices: bool `usage:"List every connected R1 as: id wired|wireless serial"`,
+    device: string `usage:"Use the R1 with this id from -list-devices instead of the first one"`,
+    capture: string `usage:"Record every USB transfer to this file (see attack_shark_r1/capture.py)"`,
 } 
 DriverError :: union #shared_nil {
     ConfigError,
     libusb.Error,
+    AckErr,
 }
-driver_main :: proc(opts: CliOptions , config: ^Config) -> DriverError {
-    ctx := libusb.Context {}
-    libusb.init(&ctx)
-    mouse, has_kern_driver := open_mouse(ctx) or_return
-    defer if has_kern_driver do libusb.attach_kernel_driver(mouse, INTERFACE)
-
-    libusb.claim_interface(mouse, INTERFACE) or_return
-    defer libusb.release_interface(mouse, INTERFACE)
-
-    if opts.reapply_config do apply_config(config^, mouse) or_return
-    t := i32(0)
-    buf := [5]u8{}
-    if !wired {
-        libusb.interrupt_transfer(mouse, 0x83, slice.as_ptr(buf[:]), 64, &t, 0) or_return
+set_ack_options :: proc(opts: CliOptions) {
+    if opts.ack_timeout_ms > 0 do ack_options.timeout_ms = u32(opts.ack_timeout_ms)
+    if opts.max_retries > 0 do ack_options.max_retries = opts.max_retries
+    ack_options.has_deadline = opts.deadline_ms > 0
+    if ack_options.has_deadline {
+        ack_options.deadline = time.time_add(time.now(), time.Duration(opts.deadline_ms) * time.Millisecond)
     }
-    if opts.query_charge do fmt.println(buf[4] * 10)
-    
+}
+format_error :: proc(err: DriverError) -> string {
+    if ack_err, ok := err.(AckErr); ok && ack_err == .DeviceUnreachable {
+        return fmt.tprintf("device unreachable after %d tries in %d ms (report 0x%x)",
+            ack_stats.tries, i64(time.duration_milliseconds(ack_stats.elapsed)), ack_stats.report)
+    }
+    return fmt.tprint(err)
+}
+read_charge :: proc(mouse: libusb.Device_Handle) -> (charge: int, err: libusb.Error) {
+    if wired do return 0, nil
+    start := time.now()
+    defer trace_span("charge", start)
+    buf := [64]u8{}
+    timeout := remaining_ms(ack_options.timeout_ms * u32(max(ack_options.max_retries, 1)))
+    if timeout == 0 do return 0, .TIMEOUT
+    interrupt_transfer(mouse, 0x83, buf[:], timeout) or_return
+    return int(buf[4]) * 10, nil
+}
+// Sends reports that were encoded (and validated) beforehand, e.g. a GUI profile's,
+// in the order apply_config uses. Only their size is checked.
+send_raw_reports :: proc(reports: map[string]string, mouse: libusb.Device_Handle) -> DriverError {
+    sizes := [3]int{56, 15, 9} // 0x304, 0x305, 0x306
+    payloads: [3]string
+    for key, value in reports {
+        id, ok := strconv.parse_uint(key)
+        if !ok || id < 0x304 || id > 0x306 do return ConfigError(.InvalidReport)
+        payloads[id - 0x304] = value
+    }
+    for i := 2; i >= 0; i -= 1 {
+        if payloads[i] == "" do continue
+        payload, ok := hex.decode(transmute([]u8)payloads[i], context.temp_allocator)
+        if !ok || len(payload) != sizes[i] do return ConfigError(.InvalidReport)
+        send_report(mouse, u16(0x304 + i), payload) or_return
+    }
+    return nil
+}
+set_options :: proc(opts: CliOptions, config: ^Config, mouse: libusb.Device_Handle) -> DriverError {
+    if len(opts.report) != 0 do send_raw_reports(opts.report, mouse) or_return
     if opts.polling_rate != 0 {
         polls := map[int]PollingRate {
             125  = .Hz125,
@@ -320,6 +510,7 @@ driver_main :: proc(opts: CliOptions , config: ^Config) -> DriverError {
             500  = .Hz500,
             1000 = .Hz1000,
         }    
+        defer delete(polls)
         if poll, ok := polls[opts.polling_rate]; ok {
             set_polling_rate(mouse, poll) or_return
         } else {
@@ -343,7 +534,7 @@ driver_main :: proc(opts: CliOptions , config: ^Config) -> DriverError {
         sleep_time := opts.sleep_time
         if sleep_time < 0.5 || sleep_time > 30 do return ConfigError(.InvalidSleepTime)
         config.sleep_time = sleep_time
-        times := true
+        times = true
     }
     dpi := false
 
@@ -377,9 +568,89 @@ driver_main :: proc(opts: CliOptions , config: ^Config) -> DriverError {
     if times do set_times(mouse, config.sleep_time, config.deep_sleep_time, config.key_resp_time) or_return
     if dpi do set_dpis(mouse, config.dpis, config.active_dpi, config.ripple_control, config.angle_snap) or_return
 
+    return nil
+}
+// Session protocol: one command per line on stdin, written with the same flags as the
+// command line (e.g. "-polling-rate=500 -dpi:1=800"). Every command is answered with a
+// single line: "ok", "ok <charge>" for -query-charge, or "error <message>", preceded by
+// a "trace <json>" line when the command has -trace.
+// "quit" or EOF ends the session and releases the mouse.
+session_command :: proc(opts: CliOptions, config: ^Config, mouse: libusb.Device_Handle) -> (charge: int, err: DriverError) {
+    if opts.reapply_config do apply_config(config^, mouse) or_return
+    if opts.query_charge do charge = read_charge(mouse) or_return
+    set_options(opts, config, mouse) or_return
+    return charge, nil
+}
+run_session :: proc(config: ^Config, mouse: libusb.Device_Handle) {
+    scanner: bufio.Scanner
+    bufio.scanner_init(&scanner, os.stream_from_handle(os.stdin))
+    defer bufio.scanner_destroy(&scanner)
+
+    print_trace()
+    fmt.println("ready")
+    for bufio.scanner_scan(&scanner) {
+        defer free_all(context.temp_allocator)
+        line := strings.trim_space(bufio.scanner_text(&scanner))
+        if line == "" do continue
+        if line == "quit" do break
+
+        args := strings.fields(line, context.temp_allocator)
+        opts: CliOptions = {}
+        if err := flags.parse(&opts, args, .Odin, allocator = context.temp_allocator); err != nil {
+            fmt.println("error", err)
+            continue
+        }
+        set_ack_options(opts)
+        tracing = opts.trace
+        trace_start = time.now()
+        charge, err := session_command(opts, config, mouse)
+        print_trace()
+        if err != nil {
+            fmt.println("error", format_error(err))
+        } else if opts.query_charge {
+            fmt.println("ok", charge)
+        } else {
+            fmt.println("ok")
+        }
+    }
+}
+driver_main :: proc(opts: CliOptions , config: ^Config) -> DriverError {
+    ctx := libusb.Context {}
+    start := time.now()
+    libusb.init(&ctx)
+    trace_span("init", start)
 
+    if opts.list_devices {
+        list_devices(ctx)
+        return nil
+    }
 
-    return nil
+    start = time.now()
+    mouse, has_kern_driver := open_mouse(ctx, opts.device) or_return
+    trace_span("open", start)
+    defer if has_kern_driver {
+        start := time.now()
+        libusb.attach_kernel_driver(mouse, INTERFACE)
+        trace_span("attach", start)
+    }
+
+    start = time.now()
+    libusb.claim_interface(mouse, INTERFACE) or_return
+    trace_span("claim", start)
+    defer libusb.release_interface(mouse, INTERFACE)
+
+    if opts.session {
+        run_session(config, mouse)
+        return nil
+    }
+
+    if opts.reapply_config do apply_config(config^, mouse) or_return
+    // Without -query-charge the status report is only drained, don't fail if there is none
+    charge, charge_err := read_charge(mouse)
+    if charge_err != nil && (opts.query_charge || charge_err != .TIMEOUT) do return charge_err
+    if opts.query_charge do fmt.println(charge)
+
+    return set_options(opts, config, mouse)
 }
 main :: proc () {
     opts: CliOptions = {}
@@ -387,7 +658,10 @@ main :: proc () {
         flags.write_usage(os.stream_from_handle(os.stdout), typeid_of(CliOptions), os.args[0], .Odin)
         return
     }
+    trace_start = time.now()
     flags.parse_or_exit(&opts, os.args, .Odin)
+    set_ack_options(opts)
+    tracing = opts.trace
 
     cfg := os.get_env("XDG_CONFIG_HOME")
     if cfg == "" {
@@ -401,14 +675,24 @@ main :: proc () {
     if !os.exists(cfg) {
         cfg = "/etc/attack-shark-r1.ini"
     }
+    start := time.now()
     config, cfg_err := load_config(cfg) 
+    trace_span("config", start)
     if cfg_err != nil {
         fmt.println("ERROR while loading config:", cfg_err)
     }
     //apply_config(config, nil)
+    if opts.capture != "" {
+        if capture_err := open_capture(opts.capture); capture_err != nil {
+            fmt.eprintln("ERROR: cannot open capture file:", capture_err)
+            os.exit(1)
+        }
+    }
     err := driver_main(opts, &config)
+    close_capture()
+    print_trace()
     if err != nil {
-        fmt.eprintln("ERROR:", err)
+        fmt.eprintln("ERROR:", format_error(err))
         os.exit(1)
     }
 }
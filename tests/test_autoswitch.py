@@ -0,0 +1,47 @@
+import pytest
+
+from attack_shark_r1.autoswitch import AutoSwitcher
+from attack_shark_r1.profiles import ProfileStore
+from attack_shark_r1.settings import DEFAULT_STATE, AppliedStateCache
+from attack_shark_r1.transport import DeviceUnreachable, MockTransport
+
+
+class AsleepTransport(MockTransport):
+    def send_reports(self, reports, timeout=None):
+        raise DeviceUnreachable(reports[0][0], 5, 1.0)
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = ProfileStore(str(tmp_path / 'profiles.json'))
+    store.save('fps', DEFAULT_STATE._replace(polling_rate=500))
+    return store
+
+
+def test_switch_diffs_against_the_devices_entry_as_written_by_others(store, tmp_path):
+    path = str(tmp_path / 'applied-state.json')
+    transport = MockTransport()
+    switcher = AutoSwitcher(store, AppliedStateCache(path), transport, {'cs2': 'fps'}, debounce=0, key='r1@3-1')
+    # Another process sent everything but the polling rate meanwhile
+    AppliedStateCache(path).put('r1@3-1', DEFAULT_STATE)
+    switched = []
+    switcher.on_switched = switched.append
+
+    switcher.update({'cs2'})
+
+    assert [report_id for report_id, _ in transport.reports] == [0x306]
+    assert AppliedStateCache(path).get('r1@3-1').polling_rate == 500
+    assert store.active == 'fps'
+    assert switched == ['fps']
+
+
+def test_failed_switch_forgets_the_applied_state(store, tmp_path):
+    cache = AppliedStateCache(str(tmp_path / 'applied-state.json'))
+    cache.put('r1@3-1', DEFAULT_STATE)
+    switcher = AutoSwitcher(store, cache, AsleepTransport(), {'cs2': 'fps'}, debounce=0, key='r1@3-1')
+
+    with pytest.raises(DeviceUnreachable):
+        switcher.update({'cs2'})
+
+    assert cache.get('r1@3-1') is None
+    assert store.active is None
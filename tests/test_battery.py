@@ -0,0 +1,80 @@
+import pytest
+
+from attack_shark_r1.battery import BatteryHistory, next_poll_interval
+
+
+@pytest.fixture
+def history(tmp_path):
+    history = BatteryHistory(str(tmp_path / 'battery.ring'), capacity=4)
+    yield history
+    history.close()
+
+
+def test_the_ring_wraps_around_keeping_the_newest_samples(history):
+    for i in range(6):
+        history.append(100 - i, timestamp=1000 + i)
+
+    assert len(history) == 4
+    assert history.samples() == [(1002, 98), (1003, 97), (1004, 96), (1005, 95)]
+    assert history.samples(2) == [(1004, 96), (1005, 95)]
+    assert history.last() == (1005, 95)
+
+
+def test_samples_survive_reopening(history):
+    for i in range(5):
+        history.append(90, timestamp=1000 + i)
+    reopened = BatteryHistory(history.path, capacity=4)
+
+    assert reopened.samples() == history.samples()
+    reopened.close()
+
+
+def test_another_capacity_starts_over(history):
+    history.append(90, timestamp=1000)
+    reopened = BatteryHistory(history.path, capacity=8)
+
+    assert len(reopened) == 0
+    reopened.close()
+
+
+def test_reload_picks_up_other_writers(history):
+    writer = BatteryHistory(history.path, capacity=4)
+    writer.append(80, timestamp=1000)
+    history.reload()
+
+    assert history.last() == (1000, 80)
+    writer.close()
+
+
+def test_discharge_rate_fits_the_run_since_charging(tmp_path):
+    history = BatteryHistory(str(tmp_path / 'battery.ring'))
+    # Charged from 40% to 100%, then 10% lost every 30 minutes
+    history.append(40, timestamp=0)
+    for i in range(5):
+        history.append(100 - 10 * i, timestamp=3600 + 1800 * i)
+
+    assert history.discharge_run()[0] == (3600, 100)
+    assert history.discharge_rate() == pytest.approx(20)
+    assert history.time_remaining() == pytest.approx(3)
+    history.close()
+
+
+def test_discharge_rate_is_unknown_without_enough_data(history):
+    assert history.discharge_rate() is None
+    history.append(90, timestamp=0)
+    history.append(80, timestamp=60)
+    # Less than min_span apart
+    assert history.discharge_rate() is None
+    history.append(90, timestamp=3600)
+    # Charging
+    assert history.discharge_rate() is None
+
+
+def test_unchanged_readings_back_off(history):
+    assert next_poll_interval(history) == 60
+    history.append(90, timestamp=0)
+    history.append(90, timestamp=900)
+
+    assert next_poll_interval(history) == 15 * 60
+    assert next_poll_interval(history, previous=15 * 60) == 30 * 60
+    assert next_poll_interval(history, previous=45 * 60) == 60 * 60
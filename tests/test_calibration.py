@@ -0,0 +1,49 @@
+import pytest
+
+from attack_shark_r1 import calibration
+from attack_shark_r1.pollrate import EVENT_FIELDS
+
+np = pytest.importorskip('numpy')
+
+
+def by_dpi(results):
+    return {result.dpi: result for result in results}
+
+
+def test_each_step_gets_its_own_median():
+    # Over one inch, so counts are CPI
+    results = by_dpi(calibration.analyze([
+        (800, [790, 810, 800]),
+        (1600, [1700, 1500, 1580, 1540]),
+        (3200, [3000, 5, 3000]),
+        (400, []),
+    ], calibration.MM_PER_INCH))
+
+    assert (results[800].strokes, results[800].cpi, results[800].flagged) == (3, 800, False)
+    # An even number of strokes: the mean of the middle two
+    assert results[1600].cpi == 1560
+    assert results[1600].drift_pct == pytest.approx(-2.5)
+    assert not results[1600].flagged
+    # The 5 count twitch isn't a stroke
+    assert (results[3200].strokes, results[3200].cpi, results[3200].cpi_std) == (2, 3000, 0)
+    assert results[3200].drift_pct == pytest.approx(-6.25)
+    assert results[3200].flagged
+    assert (results[400].strokes, results[400].cpi, results[400].flagged) == (0, 0, True)
+
+
+def test_counts_are_divided_by_the_distance():
+    result, = calibration.analyze([(800, [1600, 1600])], 2 * calibration.MM_PER_INCH)
+
+    assert result.cpi == 800 and not result.flagged
+
+
+def test_pauses_split_strokes():
+    events = np.zeros(6, dtype=EVENT_FIELDS)
+    events['sec'] = [0, 0, 0, 1, 1, 1]
+    events['usec'] = [0, 10000, 10000, 0, 10000, 10000]
+    events['type'] = [calibration.EV_REL, calibration.EV_REL, 0] * 2
+    events['code'] = [calibration.REL_X, calibration.REL_Y, 0] * 2
+    events['value'] = [3, 4, 0, 6, -8, 0]
+
+    assert list(calibration.stroke_counts(events)) == pytest.approx([5, 10])
+
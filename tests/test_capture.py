@@ -0,0 +1,66 @@
+import pytest
+
+from attack_shark_r1 import capture, protocol
+
+DPI_REPORT = protocol.encode_dpi_report([800, 1600, 3200, 4000, 5000, 12000], 3)
+POLLING_REPORT = protocol.encode_polling_report(1000)
+ACK = bytes([0x03, 0x00, protocol.ACK, 0x00])
+
+
+def make_capture(*records):
+    """Capture bytes for (time_us, direction, value, payload) records"""
+    data = capture.HEADER.pack(capture.MAGIC, capture.VERSION)
+    for time_us, direction, value, payload in records:
+        data += capture.RECORD.pack(time_us, direction, value, len(payload)) + payload
+    return data
+
+
+def test_records_are_read_back():
+    data = make_capture((0, capture.OUT, protocol.REPORT_DPI, DPI_REPORT), (850, capture.IN, 0x82, ACK))
+    records = list(capture.iter_records(data))
+
+    assert [(r.time_us, r.direction, r.value, bytes(r.payload)) for r in records] == [
+        (0, capture.OUT, protocol.REPORT_DPI, DPI_REPORT), (850, capture.IN, 0x82, ACK)]
+    assert capture.describe(records[1]) == "ack"
+
+
+@pytest.mark.parametrize('cut', [1, capture.RECORD.size, capture.RECORD.size + len(POLLING_REPORT) - 1])
+def test_a_truncated_record_ends_the_capture(cut):
+    whole = make_capture((0, capture.OUT, protocol.REPORT_DPI, DPI_REPORT))
+    data = make_capture((0, capture.OUT, protocol.REPORT_DPI, DPI_REPORT),
+                        (900, capture.OUT, protocol.REPORT_POLLING, POLLING_REPORT))[:len(whole) + cut]
+
+    assert [r.time_us for r in capture.iter_records(data)] == [0]
+
+
+@pytest.mark.parametrize('data, message', [
+    (b'R1C', 'too short'),
+    (b'PCAP\0\0\1\0', 'bad magic'),
+    (capture.HEADER.pack(capture.MAGIC, capture.VERSION + 1), 'version'),
+])
+def test_other_files_are_rejected(data, message):
+    with pytest.raises(capture.CaptureError, match=message):
+        list(capture.iter_records(data))
+
+
+def test_check_passes_what_the_encoders_produce():
+    records = capture.iter_records(make_capture((0, capture.OUT, protocol.REPORT_DPI, DPI_REPORT),
+                                                (850, capture.IN, 0x82, ACK),
+                                                (900, capture.OUT, protocol.REPORT_POLLING, POLLING_REPORT)))
+
+    assert capture.check(records) == []
+
+
+def test_check_reports_bytes_the_encoders_dont_produce():
+    # Same settings and a valid checksum, but a template byte the encoder never writes
+    odd = bytearray(DPI_REPORT)
+    odd[40] ^= 0xff
+    corrupt = bytearray(POLLING_REPORT)
+    corrupt[3] = 0
+    records = capture.iter_records(make_capture((0, capture.OUT, protocol.REPORT_DPI, bytes(odd)),
+                                                (900, capture.OUT, protocol.REPORT_POLLING, bytes(corrupt))))
+    mismatches = capture.check(records)
+
+    assert len(mismatches) == 2
+    assert mismatches[0].startswith("0 us, report 0x304: captured")
+    assert "Unknown polling rate" in mismatches[1]
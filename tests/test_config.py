@@ -0,0 +1,69 @@
+import os
+
+from attack_shark_r1.config import GUI_DEFAULTS, ConfigStore, parse_config, render_config, write_atomic
+from attack_shark_r1.macros import Macro
+from attack_shark_r1.settings import DEFAULT_DPIS, DEFAULT_STATE
+
+STATE = DEFAULT_STATE._replace(polling_rate=500, dpis=(400, 0, 1600, 0, 10100, 18000), active_dpi=3,
+                               sleep_time=2.5, angle_snap=True)
+
+
+def test_settings_gui_and_macros_round_trip():
+    gui = dict(GUI_DEFAULTS, transport='service', live_apply_debounce_ms=150)
+    macros = {'burst': Macro('burst', 'BTN_LEFT, 20ms, BTN_LEFT', 3), 'copy': Macro('copy', 'LEFTCTRL down, C', 1)}
+    config = parse_config(render_config(STATE, gui, macros))
+
+    assert config.state == STATE
+    assert config.gui == gui
+    assert config.macros == macros
+    assert config.problems == []
+
+
+def test_disabled_slots_are_written_as_the_drivers_fallback():
+    text = render_config(STATE, GUI_DEFAULTS)
+    config = parse_config(text)
+
+    assert f"dpis = 400 {DEFAULT_DPIS[1]} 1600 {DEFAULT_DPIS[3]} 10100 18000" in text
+    assert "disabled_dpi_slots = 2 4" in text
+    assert config.state.dpis == STATE.dpis
+    assert config.driver_dpis == (400, DEFAULT_DPIS[1], 1600, DEFAULT_DPIS[3], 10100, 18000)
+
+
+def test_without_a_gui_section_no_slot_is_disabled():
+    config = parse_config(render_config(STATE))
+
+    assert 0 not in config.state.dpis
+    assert config.gui == GUI_DEFAULTS
+
+
+def test_invalid_values_fall_back_to_the_defaults():
+    config = parse_config("polling_rate = 2000\ndpis = 800 800\nactive_dpi = x\n[gui]\nlive_apply = maybe\n")
+
+    assert {problem.error for problem in config.problems} >= {'InvalidPollRate', 'NotEnoughDpiValues',
+                                                              'InvalidActiveDpiValue'}
+    assert config.state.polling_rate == DEFAULT_STATE.polling_rate
+    assert config.state.active_dpi == DEFAULT_STATE.active_dpi
+    assert config.driver_dpis == DEFAULT_DPIS
+    assert config.gui['live_apply'] == GUI_DEFAULTS['live_apply']
+
+
+def test_unchanged_files_arent_parsed_again(tmp_path):
+    path = str(tmp_path / 'attack-shark-r1.ini')
+    store = ConfigStore()
+    store.save(path, STATE)
+    first = store.load(path)
+
+    assert store.load(path) is first
+    assert ConfigStore().load(path) == first
+
+    write_atomic(path, render_config(STATE._replace(polling_rate=250)))
+    assert store.load(path).state.polling_rate == 250
+
+
+def test_write_atomic_leaves_no_temporary_file(tmp_path):
+    path = str(tmp_path / 'config' / 'attack-shark-r1.ini')
+    write_atomic(path, "polling_rate = 125\n")
+    write_atomic(path, "polling_rate = 250\n")
+
+    assert open(path).read() == "polling_rate = 250\n"
+    assert os.listdir(tmp_path / 'config') == ['attack-shark-r1.ini']
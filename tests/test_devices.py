@@ -0,0 +1,24 @@
+from attack_shark_r1.devices import list_devices, state_key
+
+
+def add_device(sysfs, name, product='fa60'):
+    path = sysfs / 'bus' / 'usb' / 'devices' / name
+    path.mkdir(parents=True)
+    (path / 'idVendor').write_text('1d57\n')
+    (path / 'idProduct').write_text(product + '\n')
+
+
+def test_list_devices(tmp_path):
+    add_device(tmp_path, '3-2')
+    add_device(tmp_path, '3-1')
+    add_device(tmp_path, '1-1', product='ffff')
+    assert [device.id for device in list_devices(str(tmp_path))] == ['3-1', '3-2']
+
+
+def test_first_found_is_keyed_by_id_when_alone(tmp_path):
+    assert state_key(None, str(tmp_path)) == 'r1'
+    add_device(tmp_path, '3-1')
+    assert state_key(None, str(tmp_path)) == 'r1@3-1'
+    assert state_key('3-1', str(tmp_path)) == 'r1@3-1'
+    add_device(tmp_path, '3-2')
+    assert state_key(None, str(tmp_path)) == 'r1'
@@ -0,0 +1,154 @@
+import json
+import os
+import socket
+from pathlib import Path
+
+import pytest
+
+from attack_shark_r1 import hotplug
+from attack_shark_r1.config import ConfigStore
+from attack_shark_r1.profiles import ProfileStore
+from attack_shark_r1.settings import DEFAULT_STATE, REPORT_GROUPS, AppliedStateCache, encode_reports
+from attack_shark_r1.transport import MockTransport
+
+from test_devices import add_device
+
+MOUSE = dict(PRODUCT='1d57/fa60/100')
+
+
+class AsleepTransport(MockTransport):
+    def send_reports(self, reports, timeout=None):
+        raise OSError("mouse asleep")
+
+
+@pytest.fixture
+def sysfs(tmp_path):
+    add_device(tmp_path / 'sys', '3-1')
+    return str(tmp_path / 'sys')
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return AppliedStateCache(str(tmp_path / 'applied-state.json'))
+
+
+def reapplier(cache, sysfs, transports, device=None):
+    def connect():
+        transports.append(MockTransport())
+        return transports[-1]
+
+    def wanted(applied):
+        state = applied or DEFAULT_STATE
+        return state, tuple(encode_reports(state, REPORT_GROUPS))
+
+    return hotplug.Reapplier(cache, connect, wanted, settle=0, sysfs=sysfs, device=device)
+
+
+def uevents(*events):
+    """A UeventSource that yields `events`, then closes"""
+    ours, theirs = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+    for action, devpath, env in events:
+        theirs.send(hotplug.format_uevent(action, devpath, **env))
+    theirs.close()
+    return hotplug.UeventSource(ours)
+
+
+def logind(*lines):
+    """A LogindSource that reads `lines` as printed by gdbus monitor, then closes"""
+    read_end, write_end = os.pipe()
+    os.write(write_end, b''.join(line + b'\n' for line in lines))
+    os.close(write_end)
+    return hotplug.LogindSource(read_end)
+
+
+def test_uevents_carry_the_device_id():
+    source = uevents(('add', '/devices/pci0000:00/0000:00:14.0/usb3/3-1/3-1.4/3-1.4:1.0', MOUSE),
+                     ('add', '/devices/pci0000:00/0000:00:14.0/usb3/3-2', dict(PRODUCT='046d/c52b/1')))
+    assert source.events() == [('add', '3-1.4')]
+    source.close()
+
+
+def test_plugging_in_reapplies_under_the_devices_key(cache, sysfs, state_home):
+    cache.put('r1@3-1', DEFAULT_STATE._replace(polling_rate=500))
+    transports = []
+    hotplug.run(reapplier(cache, sysfs, transports), [uevents(('add', '/devices/usb3/3-1', MOUSE))])
+
+    # What was applied last goes out again
+    assert len(transports) == 1
+    assert cache.get('r1@3-1') == DEFAULT_STATE._replace(polling_rate=500)
+    assert dict(transports[0].reports)[0x306] == dict(encode_reports(cache.get('r1@3-1'), REPORT_GROUPS))[0x306]
+    # Logged for the metrics, one span per report
+    record, = map(json.loads, (state_home / 'attack-shark' / 'apply-trace.jsonl').read_text().splitlines())
+    assert record['operation'] == 'send' and len(record['spans']) == len(transports[0].reports)
+
+
+def test_sleep_doesnt_reapply(cache, sysfs):
+    cache.put('r1@3-1', DEFAULT_STATE)
+    transports = []
+    source = logind(b"/org/freedesktop/login1: org.freedesktop.login1.Manager.PrepareForSleep (true,)")
+    hotplug.run(reapplier(cache, sysfs, transports), [source])
+
+    assert transports == []
+
+
+def test_resume_reapplies(cache, sysfs):
+    cache.put('r1@3-1', DEFAULT_STATE)
+    transports = []
+    source = logind(b"/org/freedesktop/login1: org.freedesktop.login1.Manager.PrepareForSleep (true,)",
+                    b"/org/freedesktop/login1: org.freedesktop.login1.Manager.PrepareForSleep (false,)")
+    hotplug.run(reapplier(cache, sysfs, transports), [source])
+
+    assert len(transports) == 1
+
+
+def test_other_devices_events_are_ignored(cache, sysfs):
+    add_device(Path(sysfs), '3-2')
+    cache.put('r1@3-1', DEFAULT_STATE)
+    transports = []
+    hotplug.run(reapplier(cache, sysfs, transports, device='3-1'), [uevents(('add', '/devices/usb3/3-2', MOUSE))])
+
+    assert transports == []
+
+
+def test_staleness_is_per_device(cache, sysfs):
+    cache.put('r1@3-1', DEFAULT_STATE)
+    replier = reapplier(cache, sysfs, [], device='3-1')
+    replier.note('add', '3-1')
+    # Another R1's entry written after the event doesn't vouch for this one
+    cache.put('r1@3-2', DEFAULT_STATE)
+
+    assert replier.stale()
+
+
+def test_wanted_settings_prefer_the_last_applied_state(tmp_path):
+    profiles = ProfileStore(str(tmp_path / 'profiles.json'))
+    config_store = ConfigStore()
+    config_path = str(tmp_path / 'attack-shark-r1.ini')
+    config_store.save(config_path, DEFAULT_STATE._replace(polling_rate=250))
+    applied = DEFAULT_STATE._replace(polling_rate=1000)
+
+    assert hotplug.wanted_settings(applied, profiles, config_store, config_path)[0] == applied
+    # Never recorded: the config file, or the active profile if there is one
+    assert hotplug.wanted_settings(None, profiles, config_store, config_path)[0].polling_rate == 250
+    profiles.save('fps', DEFAULT_STATE._replace(polling_rate=500))
+    profiles.set_active('fps')
+    assert hotplug.wanted_settings(None, profiles, config_store, config_path)[0].polling_rate == 500
+
+
+def test_a_failed_reapply_is_retried_with_the_last_applied_state(cache, sysfs):
+    applied = DEFAULT_STATE._replace(polling_rate=500)
+    cache.put('r1@3-1', applied)
+    sent = []
+    replier = reapplier(cache, sysfs, [])
+    replier.wanted = lambda state: sent.append(state) or (state, ())
+    replier.note('add')
+    replier.connect = lambda: AsleepTransport()
+    with pytest.raises(OSError):
+        replier.check()
+    # The failure dropped the cache entry, the retry still sends what was applied
+    assert cache.get('r1@3-1') is None
+    replier.connect = MockTransport
+    replier.check()
+
+    assert sent == [applied, applied]
+    assert cache.get('r1@3-1') == applied
@@ -0,0 +1,76 @@
+import gc
+import threading
+from array import array
+
+import pytest
+
+from attack_shark_r1 import macros
+from attack_shark_r1.macros import EV_KEY, EV_SYN, KEY_CODES, TAP_MS, MacroError, MockSink, compile_macro, play
+
+CTRL, C, V = KEY_CODES['KEY_LEFTCTRL'], KEY_CODES['KEY_C'], KEY_CODES['KEY_V']
+
+
+class FakeClock:
+    """A monotonic_ns that moves forward by `step` ns on every read"""
+
+    def __init__(self, step=1000):
+        self.now = 0
+        self.step = step
+
+    def __call__(self):
+        self.now += self.step
+        return self.now
+
+
+def test_compile_groups_events_by_moment_and_releases_held_keys():
+    compiled = compile_macro("KEY_LEFTCTRL down, KEY_C, 50ms, KEY_V")
+
+    tap = TAP_MS * 1_000_000
+    assert list(compiled.times) == [0, tap, tap + 50_000_000, 2 * tap + 50_000_000]
+    assert compiled.codes == {CTRL, C, V}
+    sink = MockSink(len(compiled.times))
+    for i in range(len(compiled.times)):
+        sink.write(compiled.data[compiled.offsets[i]:compiled.offsets[i + 1]])
+    keys = [(code, value) for kind, code, value in sink.events() if kind == EV_KEY]
+    assert keys == [(CTRL, 1), (C, 1), (C, 0), (V, 1), (V, 0), (CTRL, 0)]
+    # Every key event is followed by its SYN_REPORT
+    assert [kind for kind, _, _ in sink.events()] == [EV_KEY, EV_SYN] * 6
+
+
+def test_compile_rejects_unknown_keys_and_repeats():
+    with pytest.raises(MacroError):
+        compile_macro("KEY_NOPE")
+    with pytest.raises(MacroError):
+        compile_macro("KEY_A", repeat=0)
+
+
+def test_play_writes_every_moment_on_time():
+    compiled = compile_macro("KEY_A, 5ms, KEY_B", repeat=2)
+    clock = FakeClock()
+    sink = MockSink(len(compiled.times), clock=clock)
+    lateness = array('q', bytes(8 * len(compiled.times)))
+
+    worst = play(compiled, sink, lateness, clock=clock, spin_ns=float('inf'))
+
+    assert sink.count == len(compiled.times)
+    # The clock moves on every read, so each write lands a read or two after its moment
+    for i, planned in enumerate(compiled.times):
+        assert abs(sink.times[i] - sink.times[0] - planned) <= 2 * clock.step
+    assert worst == max(lateness)
+
+
+def test_play_stops_when_asked():
+    compiled = compile_macro("KEY_A, 100ms, KEY_B")
+    sink = MockSink(len(compiled.times))
+    play(compiled, sink, should_stop=lambda: True)
+    assert sink.count == 1
+
+
+def test_play_off_the_main_thread_leaves_the_collector_alone(monkeypatch):
+    seen = []
+    monkeypatch.setattr(macros.gc, 'disable', lambda: seen.append('disable'))
+    compiled = compile_macro("KEY_A")
+    thread = threading.Thread(target=play, args=(compiled, MockSink(len(compiled.times))))
+    thread.start()
+    thread.join()
+    assert seen == [] and gc.isenabled()
@@ -0,0 +1,119 @@
+import json
+
+from attack_shark_r1.battery import BatteryHistory
+from attack_shark_r1.metrics import Metrics, TraceFollower
+from attack_shark_r1.trace import TraceLog
+
+RECORDS = [
+    {'operation': 'apply', 'time': 1700000000.5, 'elapsed_us': 30000, 'queued_us': 2000,
+     'spans': [{'phase': 'open', 'us': 1000}, {'phase': 'report', 'us': 4000, 'tries': 3},
+               {'phase': 'report', 'us': 1000, 'tries': 1}]},
+    {'operation': 'apply', 'time': 1700000001.5, 'elapsed_us': 200000, 'queued_us': 500,
+     'spans': [{'phase': 'open', 'us': 1500}], 'error': "[Errno 16] Resource busy"},
+    {'operation': 'query', 'time': 1700000002.5, 'error': "libusb error NO_DEVICE"},
+    {'operation': 'flash', 'time': 1700000003.5},
+]
+
+
+def test_follower_starts_at_the_end_of_the_log(tmp_path):
+    log = TraceLog(str(tmp_path / 'apply-trace.jsonl'))
+    log.append({'n': 0})
+    follower = TraceFollower(log.path)
+
+    assert follower.read() == []
+    log.append({'n': 1})
+    assert follower.read() == [{'n': 1}]
+
+
+def test_follower_reads_a_log_created_after_it_started(tmp_path):
+    log = TraceLog(str(tmp_path / 'apply-trace.jsonl'))
+    follower = TraceFollower(log.path)
+    assert follower.read() == []
+
+    log.append({'n': 0})
+    assert follower.read() == [{'n': 0}]
+
+
+def test_follower_finishes_a_rotated_log_before_the_new_one(tmp_path):
+    log = TraceLog(str(tmp_path / 'apply-trace.jsonl'), max_bytes=60)
+    follower = TraceFollower(log.path, from_start=True)
+    log.append({'n': 0, 'pad': 'x' * 10})
+    assert [record['n'] for record in follower.read()] == [0]
+
+    # Written after the last read: 1 still goes to the old log, 2 to a new one
+    log.append({'n': 1, 'pad': 'x' * 10})
+    log.append({'n': 2, 'pad': 'x' * 10})
+    assert [record['n'] for record in follower.read()] == [1, 2]
+
+
+def test_follower_leaves_a_partial_line_for_later(tmp_path):
+    path = tmp_path / 'apply-trace.jsonl'
+    follower = TraceFollower(str(path), from_start=True)
+    path.write_text(json.dumps({'n': 0}) + '\n{"n": ')
+    assert follower.read() == [{'n': 0}]
+
+    with open(path, 'a') as f:
+        f.write('1}\n')
+    assert follower.read() == [{'n': 1}]
+
+
+def test_records_are_counted_and_timed(tmp_path):
+    metrics = Metrics(str(tmp_path / 'apply-trace.jsonl'))
+    for record in RECORDS:
+        metrics.observe(record)
+    lines = metrics.render().splitlines()
+
+    for line in [
+        'r1_commands_total{operation="apply"} 2',
+        'r1_commands_total{operation="query"} 1',
+        'r1_command_failures_total{operation="apply"} 1',
+        'r1_errors_total{kind="BUSY",source="libusb"} 1',
+        'r1_errors_total{kind="NO_DEVICE",source="libusb"} 1',
+        'r1_apply_seconds_bucket{le="0.025"} 0',
+        'r1_apply_seconds_bucket{le="0.05"} 1',
+        'r1_apply_seconds_bucket{le="0.25"} 2',
+        'r1_apply_seconds_bucket{le="+Inf"} 2',
+        'r1_apply_seconds_count 2',
+        'r1_reports_total 2',
+        'r1_ack_retries_total 2',
+        'r1_report_tries_bucket{le="1.0"} 1',
+        'r1_report_tries_bucket{le="2.0"} 1',
+        'r1_report_tries_bucket{le="3.0"} 2',
+        # Only the last apply's phases
+        'r1_last_apply_phase_seconds{phase="queued"} 0.0005',
+        'r1_last_apply_phase_seconds{phase="open"} 0.0015',
+        'r1_last_apply_phase_seconds{phase="report"} 0.0',
+        'r1_last_apply_timestamp_seconds 1700000001.5',
+    ]:
+        assert line in lines
+    assert sum(line.startswith('r1_commands_total{') for line in lines) == 4
+
+
+def test_openmetrics_and_prometheus_name_counters_differently(tmp_path):
+    metrics = Metrics(str(tmp_path / 'apply-trace.jsonl'))
+    openmetrics, prometheus = metrics.render(), metrics.render(openmetrics=False)
+
+    assert '# TYPE r1_commands counter' in openmetrics.splitlines()
+    assert openmetrics.endswith('\n# EOF\n')
+    assert '# TYPE r1_commands_total counter' in prometheus.splitlines()
+    assert '# EOF' not in prometheus
+    # Nothing about a battery that was never read
+    assert 'r1_battery_percent' not in prometheus
+
+
+def test_refresh_reads_the_log_and_the_battery(tmp_path):
+    log = TraceLog(str(tmp_path / 'apply-trace.jsonl'))
+    battery = BatteryHistory(str(tmp_path / 'battery.ring'))
+    metrics = Metrics(log.path, battery, from_start=True)
+    for record in RECORDS:
+        log.append(record)
+    writer = BatteryHistory(battery.path)
+    writer.append(80, timestamp=1700000000)
+    writer.close()
+    metrics.refresh()
+    lines = metrics.render().splitlines()
+
+    assert 'r1_commands_total{operation="apply"} 2' in lines
+    assert 'r1_battery_percent 80' in lines
+    assert 'r1_battery_timestamp_seconds 1700000000' in lines
+    battery.close()
@@ -0,0 +1,55 @@
+import pytest
+
+from attack_shark_r1 import pollrate
+
+np = pytest.importorskip('numpy')
+
+# At 1000 Hz: four on-time reports, a repeated timestamp, one and two
+# missed reports, and a pause while the mouse didn't move
+INTERVALS_MS = [1.05, 1.05, 0, 2.05, 1.05, 3.05, 500, 1.05]
+
+
+def times():
+    return np.concatenate([[10.0], 10.0 + np.cumsum(INTERVALS_MS) / 1000])
+
+
+def test_missed_reports_are_counted_but_pauses_arent():
+    report = pollrate.analyze(times(), 1000, overruns=2)
+
+    assert report.reports == len(INTERVALS_MS) + 1
+    assert report.intervals == 6
+    assert report.dropped == 3
+    assert report.overruns == 2
+    assert report.effective_hz == pytest.approx(6 / 0.0093, abs=0.1)
+
+
+def test_intervals_are_binned_per_eighth_of_a_period():
+    report = pollrate.analyze(times(), 1000)
+    expected = [0] * (pollrate.HISTOGRAM_BINS_PER_PERIOD * pollrate.HISTOGRAM_PERIODS + 1)
+    expected[8] = 4     # 1.05 ms
+    expected[16] = 1    # 2.05 ms
+    expected[24] = 1    # 3.05 ms, the last bin holds everything longer
+
+    assert report.bin_us == 125
+    assert report.histogram == expected
+    assert len(pollrate.format_histogram(report).splitlines()) == len(expected)
+
+
+def test_a_still_mouse_has_nothing_to_measure():
+    with pytest.raises(pollrate.PollRateError):
+        pollrate.analyze([1.0], 1000)
+    with pytest.raises(pollrate.PollRateError):
+        pollrate.analyze([1.0, 2.0, 3.0], 1000)
+
+
+def test_dumps_of_the_event_stream_are_read(tmp_path):
+    events = np.zeros(5, dtype=pollrate.EVENT_FIELDS)
+    events['sec'] = [10, 10, 10, 10, 11]
+    events['usec'] = [0, 0, 1000, 1000, 500]
+    events['type'] = [2, 0, 2, 0, 0]
+    events['code'] = [0, pollrate.SYN_REPORT, 1, pollrate.SYN_REPORT, pollrate.SYN_DROPPED]
+    events.tofile(str(tmp_path / 'dump'))
+    report_times, overruns = pollrate.read_dump(str(tmp_path / 'dump'))
+
+    assert list(report_times) == pytest.approx([10.0, 10.001])
+    assert overruns == 1
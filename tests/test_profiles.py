@@ -0,0 +1,78 @@
+import json
+from pathlib import Path
+
+import pytest
+
+from attack_shark_r1.profiles import ENCODING, ProfileError, ProfileStore
+from attack_shark_r1.settings import DEFAULT_STATE, REPORT_GROUPS, encode_reports
+
+
+def test_stores_keep_each_others_profiles(tmp_path):
+    path = str(tmp_path / 'profiles.json')
+    gui, cli = ProfileStore(path), ProfileStore(path)
+
+    gui.save('work', DEFAULT_STATE)
+    cli.save('fps', DEFAULT_STATE._replace(polling_rate=500))
+    gui.set_active('work')
+    cli.delete('fps')
+    gui.save('mmo', DEFAULT_STATE._replace(polling_rate=250))
+
+    assert ProfileStore(path).names() == ['mmo', 'work']
+    assert ProfileStore(path).active == 'work'
+
+
+def test_profiles_carry_their_encoded_reports(tmp_path):
+    store = ProfileStore(str(tmp_path / 'profiles.json'))
+    state = DEFAULT_STATE._replace(polling_rate=500)
+    profile = store.save(' fps ', state)
+
+    assert profile.name == 'fps'
+    assert profile.reports == tuple(encode_reports(state, REPORT_GROUPS))
+    assert ProfileStore(store.path).get('fps') == profile
+
+
+def test_invalid_settings_arent_stored(tmp_path):
+    store = ProfileStore(str(tmp_path / 'profiles.json'))
+
+    with pytest.raises(ProfileError):
+        store.save('fps', DEFAULT_STATE._replace(polling_rate=2000))
+    with pytest.raises(ProfileError):
+        store.save('  ', DEFAULT_STATE)
+    assert store.names() == []
+
+
+def test_profiles_of_an_older_encoding_are_reencoded(tmp_path):
+    store = ProfileStore(str(tmp_path / 'profiles.json'))
+    store.save('fps', DEFAULT_STATE)
+    data = json.loads(Path(store.path).read_text())
+    data['profiles']['fps']['encoding'] = ENCODING - 1
+    data['profiles']['fps']['reports'] = []
+    Path(store.path).write_text(json.dumps(data))
+
+    assert ProfileStore(store.path).get('fps').reports == tuple(encode_reports(DEFAULT_STATE, REPORT_GROUPS))
+    assert json.loads(Path(store.path).read_text())['profiles']['fps']['encoding'] == ENCODING
+
+
+def test_reload_picks_up_other_processes_changes(tmp_path):
+    path = str(tmp_path / 'profiles.json')
+    gui, cli = ProfileStore(path), ProfileStore(path)
+    cli.save('fps', DEFAULT_STATE)
+    cli.set_active('fps')
+    gui.reload()
+
+    assert gui.names() == ['fps'] and gui.active == 'fps'
+
+
+def test_next_name_wraps_around(tmp_path):
+    store = ProfileStore(str(tmp_path / 'profiles.json'))
+    with pytest.raises(ProfileError):
+        store.next_name()
+    for name in ('work', 'fps', 'mmo'):
+        store.save(name, DEFAULT_STATE)
+
+    # Nothing active yet: the first one
+    assert store.next_name() == 'fps'
+    store.set_active('mmo')
+    assert store.next_name() == 'work'
+    store.set_active('work')
+    assert store.next_name() == 'fps'
@@ -0,0 +1,73 @@
+import pytest
+
+from attack_shark_r1 import golden, protocol
+from attack_shark_r1.settings import DEFAULT_DPIS, DEFAULT_STATE, encode_reports
+
+
+def test_encoders_match_the_drivers_bytes():
+    assert golden.check() == []
+
+
+@pytest.mark.parametrize('dpis, active_dpi, ripple_control, angle_snap', [
+    ([800, 1600, 3200, 4000, 5000, 12000], 3, False, False),
+    # Out of the 100-10000 table: high range flag, >12K bit, both edges
+    ([100, 10100, 12000, 12100, 18000, 10000], 6, True, True),
+    ([18000] * 6, 2, True, False),
+])
+def test_dpi_report_round_trips(dpis, active_dpi, ripple_control, angle_snap):
+    payload = protocol.encode_dpi_report(dpis, active_dpi, ripple_control, angle_snap)
+
+    assert protocol.decode_dpi_report(payload) == (dpis, active_dpi, ripple_control, angle_snap)
+
+
+def test_every_dpi_step_round_trips():
+    for dpi in range(protocol.DPI_MIN, protocol.DPI_MAX + 1, protocol.DPI_STEP):
+        payload = protocol.encode_dpi_report([dpi] * 6, 1)
+        assert protocol.decode_dpi_report(payload)[0] == [dpi] * 6
+
+
+def test_disabled_slots_decode_as_the_fallback_dpis():
+    (_, payload), = encode_reports(DEFAULT_STATE, {'dpi'})
+
+    assert protocol.decode_dpi_report(payload)[0] == [800] + list(DEFAULT_DPIS[1:])
+
+
+@pytest.mark.parametrize('dpi', [0, 50, 150, 18100])
+def test_dpis_the_driver_rejects_arent_encoded(dpi):
+    with pytest.raises(ValueError):
+        protocol.encode_dpi_report([dpi, 800, 800, 800, 800, 800], 1)
+
+
+def test_corrupt_dpi_reports_are_rejected():
+    payload = bytearray(protocol.encode_dpi_report([800] * 6, 1))
+    payload[8] ^= 1
+    with pytest.raises(ValueError, match='checksum'):
+        protocol.decode_dpi_report(bytes(payload))
+    with pytest.raises(ValueError):
+        protocol.decode_dpi_report(bytes(payload[:-1]))
+
+
+@pytest.mark.parametrize('times', [(6, 12, 4), (0.5, 1, 50), (30, 60, 4), (2.5, 37, 8)])
+def test_times_report_round_trips(times):
+    assert protocol.decode_times_report(protocol.encode_times_report(*times)) == times
+
+
+def test_corrupt_times_reports_are_rejected():
+    payload = bytearray(protocol.encode_times_report(6, 12, 4))
+    payload[9] += 1
+    with pytest.raises(ValueError, match='checksum'):
+        protocol.decode_times_report(bytes(payload))
+
+
+@pytest.mark.parametrize('rate', [125, 250, 500, 1000])
+def test_polling_report_round_trips(rate):
+    assert protocol.decode_polling_report(protocol.encode_polling_report(rate)) == rate
+
+
+def test_unknown_polling_rates_are_rejected():
+    with pytest.raises(ValueError):
+        protocol.encode_polling_report(2000)
+    payload = bytearray(protocol.encode_polling_report(1000))
+    payload[3] = 0
+    with pytest.raises(ValueError):
+        protocol.decode_polling_report(bytes(payload))
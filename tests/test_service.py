@@ -0,0 +1,141 @@
+import threading
+
+import pytest
+
+from attack_shark_r1.profiles import ProfileStore
+from attack_shark_r1.service import DeviceOwner, ServiceError
+from attack_shark_r1.settings import DEFAULT_STATE, AppliedStateCache
+from attack_shark_r1.transport import Transport
+
+CACHED = DEFAULT_STATE._replace(dpis=(400, 1600, 3200, 4000, 5000, 12000))
+
+
+class GatedTransport(Transport):
+    """Records applies; each one waits for `gate` and fails while `failing` is set"""
+
+    def __init__(self):
+        self.applies = []
+        self.gate = threading.Event()
+        self.gate.set()
+        self.started = threading.Event()
+        self.failing = False
+
+    def apply(self, state, groups, timeout=None):
+        self.started.set()
+        self.gate.wait(5)
+        self.applies.append((state, set(groups)))
+        if self.failing:
+            raise OSError("mouse asleep")
+
+
+class Replies:
+    def __init__(self):
+        self.results = []
+        self.done = threading.Semaphore(0)
+
+    def __call__(self, result, error):
+        self.results.append((result, error))
+        self.done.release()
+
+    def wait(self, n):
+        for _ in range(n):
+            assert self.done.acquire(timeout=5)
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = AppliedStateCache(str(tmp_path / 'applied-state.json'))
+    cache.put('r1', CACHED)
+    return cache
+
+
+def make_owner(transport, cache, tmp_path):
+    return DeviceOwner(lambda: transport, cache, 'r1', ProfileStore(str(tmp_path / 'profiles.json')))
+
+
+def test_applies_arriving_while_busy_are_merged(cache, tmp_path):
+    transport = GatedTransport()
+    owner = make_owner(transport, cache, tmp_path)
+    replies = Replies()
+    try:
+        transport.gate.clear()
+        owner.apply({'polling_rate': 500}, replies)
+        assert transport.started.wait(5)
+        owner.apply({'dpis': [800, 1600, 3200, 4000, 5000, 12000]}, replies)
+        owner.apply({'active_dpi': 2}, replies)
+        transport.gate.set()
+        replies.wait(3)
+    finally:
+        owner.close()
+
+    assert [groups for _, groups in transport.applies] == [{'polling'}, {'dpi'}]
+    merged = transport.applies[1][0]
+    assert merged.dpis[0] == 800 and merged.active_dpi == 2 and merged.polling_rate == 500
+    assert all(error is None for _, error in replies.results)
+    assert cache.get('r1') == merged
+
+
+def test_failed_apply_keeps_the_wanted_settings(cache, tmp_path):
+    transport = GatedTransport()
+    owner = make_owner(transport, cache, tmp_path)
+    replies = Replies()
+    try:
+        transport.failing = True
+        owner.apply({'polling_rate': 500}, replies)
+        replies.wait(1)
+        transport.failing = False
+        owner.apply({'polling_rate': 250}, replies)
+        replies.wait(1)
+    finally:
+        owner.close()
+
+    assert isinstance(replies.results[0][1], OSError)
+    assert replies.results[1] == (CACHED._replace(polling_rate=250), None)
+    # Only the polling report: the DPI table is kept, not reset to the defaults
+    state, groups = transport.applies[-1]
+    assert groups == {'polling'}
+    assert state.dpis == CACHED.dpis
+
+
+def test_unknown_state_sends_only_what_was_asked_for(tmp_path):
+    cache = AppliedStateCache(str(tmp_path / 'applied-state.json'))
+    transport = GatedTransport()
+    owner = make_owner(transport, cache, tmp_path)
+    replies = Replies()
+    try:
+        owner.apply({'polling_rate': 500}, replies)
+        replies.wait(1)
+        owner.apply({'sleep_time': 3.0}, replies)
+        replies.wait(1)
+    finally:
+        owner.close()
+
+    assert [groups for _, groups in transport.applies] == [{'polling'}, {'times'}]
+    # The DPI report was never sent, so the settings aren't known as a whole
+    assert cache.get('r1') is None
+
+
+def test_invalid_changes_are_refused(cache, tmp_path):
+    owner = make_owner(GatedTransport(), cache, tmp_path)
+    try:
+        with pytest.raises(ServiceError):
+            owner.apply({'polling_rate': 333}, Replies())
+        with pytest.raises(ServiceError):
+            owner.apply({'colour': 1}, Replies())
+    finally:
+        owner.close()
+    assert owner.state() == CACHED
+
+
+def test_profile_switch_sends_every_group(cache, tmp_path):
+    transport = GatedTransport()
+    owner = make_owner(transport, cache, tmp_path)
+    owner.profiles.save('fps', DEFAULT_STATE._replace(polling_rate=500))
+    replies = Replies()
+    try:
+        owner.switch_profile('fps', replies)
+        replies.wait(1)
+    finally:
+        owner.close()
+    assert transport.applies[-1][1] == {'polling', 'dpi'}
+    assert owner.profiles.active == 'fps'
@@ -0,0 +1,74 @@
+import os
+
+from attack_shark_r1 import protocol
+from attack_shark_r1.config import ConfigStore
+from attack_shark_r1.settings import (DEFAULT_DPIS, DEFAULT_STATE, AppliedStateCache, driver_args,
+                                      encode_reports)
+from attack_shark_r1.transport import MockTransport
+
+
+def test_writers_keep_each_others_entries(tmp_path):
+    path = str(tmp_path / 'applied-state.json')
+    cli = AppliedStateCache(path)
+    gui = AppliedStateCache(path)
+
+    cli.put('r1@3-1', DEFAULT_STATE)
+    gui.put('r1@3-2', DEFAULT_STATE._replace(polling_rate=500))
+
+    fresh = AppliedStateCache(path)
+    assert fresh.get('r1@3-1') == DEFAULT_STATE
+    assert fresh.get('r1@3-2').polling_rate == 500
+
+
+def test_forget_keeps_other_writers_entries(tmp_path):
+    path = str(tmp_path / 'applied-state.json')
+    first = AppliedStateCache(path)
+    second = AppliedStateCache(path)
+
+    first.put('r1@3-1', DEFAULT_STATE)
+    second.put('r1@3-2', DEFAULT_STATE)
+    first.forget('r1@3-1')
+
+    assert AppliedStateCache(path).get('r1@3-2') == DEFAULT_STATE
+    assert AppliedStateCache(path).get('r1@3-1') is None
+
+
+def test_no_temporary_files_left_behind(tmp_path):
+    path = str(tmp_path / 'applied-state.json')
+    cache = AppliedStateCache(path)
+    cache.put('r1@3-1', DEFAULT_STATE)
+    cache.forget('r1@3-1')
+
+    assert sorted(os.listdir(tmp_path)) == ['applied-state.json', 'applied-state.json.lock']
+
+
+def test_device_entries_invalidate_the_first_found_entry(tmp_path):
+    cache = AppliedStateCache(str(tmp_path / 'applied-state.json'))
+    cache.put('r1', DEFAULT_STATE)
+    cache.put('r1@3-1', DEFAULT_STATE)
+    assert cache.get('r1') is None
+
+    cache.put('r1@3-2', DEFAULT_STATE)
+    cache.put('r1', DEFAULT_STATE)
+    assert cache.get('r1@3-1') is None
+    assert cache.get('r1@3-2') is None
+
+
+def sent_dpis(reports):
+    return protocol.decode_dpi_report(dict(reports)[protocol.REPORT_DPI])[0]
+
+
+def test_disabled_slots_take_the_config_files_values_like_the_driver(tmp_path):
+    state = DEFAULT_STATE._replace(dpis=(800, 0, 0, 0, 0, 0))
+    # No config file: the shipped one's values
+    assert sent_dpis(encode_reports(state, {'dpi'})) == list(DEFAULT_DPIS)
+
+    path = str(tmp_path / 'attack-shark-r1.ini')
+    ConfigStore().save(path, DEFAULT_STATE._replace(dpis=(400, 900, 1800, 2400, 3600, 7200)))
+    # The driver only gets -dpi:1, and reads the others from the file
+    assert '-dpi:2=' not in ' '.join(driver_args(state, {'dpi'}))
+    assert sent_dpis(encode_reports(state, {'dpi'}, path)) == [800, 900, 1800, 2400, 3600, 7200]
+
+    transport = MockTransport(config_path=path)
+    transport.apply(state, {'dpi'})
+    assert transport.reports == encode_reports(state, {'dpi'}, path)
@@ -0,0 +1,65 @@
+import pytest
+
+from attack_shark_r1 import protocol
+from attack_shark_r1.settings import DEFAULT_STATE, REPORT_GROUPS, encode_reports
+from attack_shark_r1.simulator import SimulatedMouse
+from attack_shark_r1.transport import DeviceUnreachable, SimulatorTransport
+
+WANTED = DEFAULT_STATE._replace(polling_rate=500, dpis=(400, 1600, 3200, 4000, 5000, 12000), sleep_time=5)
+
+
+def test_reports_are_decoded_and_acked():
+    mouse = SimulatedMouse(ack_latency=0, status_interval=1)
+    transport = SimulatorTransport(mouse)
+    transport.apply(WANTED, REPORT_GROUPS)
+
+    assert mouse.state == WANTED
+    assert mouse.rejected == [] and not mouse.pending
+
+
+@pytest.mark.parametrize('report_id, checksum', [(protocol.REPORT_DPI, 51), (protocol.REPORT_TIMES, 12)])
+def test_reports_failing_their_checksum_are_ignored_and_not_acked(report_id, checksum):
+    mouse = SimulatedMouse(ack_latency=0)
+    payload = bytearray(dict(encode_reports(WANTED, REPORT_GROUPS))[report_id])
+    payload[checksum] ^= 0xff
+
+    assert not mouse.set_feature(report_id, payload)
+    assert mouse.state == DEFAULT_STATE
+    assert not mouse.pending
+    assert mouse.rejected == [(report_id, f"{'DPI' if report_id == protocol.REPORT_DPI else 'Times'} "
+                                          "report checksum mismatch")]
+
+
+def test_reports_with_the_wrong_id_byte_are_ignored():
+    mouse = SimulatedMouse()
+    payload = bytearray(dict(encode_reports(WANTED, REPORT_GROUPS))[protocol.REPORT_POLLING])
+    payload[0] ^= 0xff
+    assert not mouse.set_feature(protocol.REPORT_POLLING, payload)
+    assert mouse.state == DEFAULT_STATE
+
+
+def test_dropped_acks_are_retried():
+    mouse = SimulatedMouse(ack_latency=0, drop_rate=0.5, status_interval=1, seed=3)
+    transport = SimulatorTransport(mouse, ack_timeout=0.01, max_attempts=20)
+    transport.apply(WANTED, REPORT_GROUPS)
+
+    assert mouse.acks_dropped > 0
+    assert mouse.received == len(REPORT_GROUPS) + mouse.acks_dropped
+    assert mouse.state == WANTED
+
+
+def test_a_mouse_dropping_every_ack_is_unreachable():
+    mouse = SimulatedMouse(drop_rate=1, status_interval=1)
+    transport = SimulatorTransport(mouse, ack_timeout=0.01, max_attempts=3)
+    with pytest.raises(DeviceUnreachable):
+        transport.apply(WANTED, {'polling'})
+    assert mouse.received == mouse.acks_dropped == 3
+
+
+def test_the_wired_mouse_sends_no_acks():
+    mouse = SimulatedMouse(wired=True)
+    transport = SimulatorTransport(mouse)
+    transport.apply(WANTED, REPORT_GROUPS)
+
+    assert mouse.state == WANTED
+    assert mouse.read_input(0) is None
@@ -0,0 +1,58 @@
+import pytest
+
+from attack_shark_r1.telemetry import MotionRing, decimate
+
+np = pytest.importorskip('numpy')
+
+
+def add(ring, values):
+    values = np.asarray(values)
+    ring.extend(values.astype(np.float64), values, -values)
+
+
+def latest(ring, n):
+    times, dx, dy = np.zeros(n), np.zeros(n, np.int32), np.zeros(n, np.int32)
+    count = ring.copy_latest(times, dx, dy)
+    assert list(dy[:count]) == [-value for value in dx[:count]]
+    return list(dx[:count])
+
+
+def test_copies_are_oldest_first_across_the_wrap():
+    ring = MotionRing(capacity=5)
+    add(ring, [0, 1, 2])
+    assert latest(ring, 5) == [0, 1, 2]
+
+    add(ring, [3, 4, 5, 6])
+    assert ring.written == 7
+    assert latest(ring, 5) == [2, 3, 4, 5, 6]
+    assert latest(ring, 3) == [4, 5, 6]
+    assert latest(ring, 8) == [2, 3, 4, 5, 6]
+
+
+def test_more_than_the_capacity_keeps_the_newest():
+    ring = MotionRing(capacity=5)
+    add(ring, [0, 1, 2, 3, 4, 5, 6])
+    add(ring, list(range(7, 15)))
+
+    assert ring.written == 15
+    assert latest(ring, 5) == [10, 11, 12, 13, 14]
+
+
+def test_an_empty_ring_copies_nothing():
+    assert latest(MotionRing(capacity=5), 5) == []
+
+
+def test_decimate_keeps_the_extremes_of_every_column():
+    values = np.array([0, 9, 2, 7, 4, 5, 6, 3, 8, 1])
+    mins, maxs = decimate(values, 4)
+
+    # Columns start at 0, 2, 5 and 7
+    assert list(mins) == [0, 2, 5, 1]
+    assert list(maxs) == [9, 7, 6, 8]
+
+
+def test_decimate_leaves_short_traces_alone():
+    values = np.arange(3)
+    mins, maxs = decimate(values, 4)
+
+    assert mins is values and maxs is values
@@ -0,0 +1,57 @@
+import json
+
+import pytest
+
+from attack_shark_r1.metrics import Metrics
+from attack_shark_r1.settings import DEFAULT_STATE, REPORT_GROUPS
+from attack_shark_r1.trace import TraceLog, logged
+from attack_shark_r1.transport import DeviceUnreachable, MockTransport, ServiceTransport
+
+
+class AsleepTransport(MockTransport):
+    def read_input(self, timeout):
+        return None
+
+
+def test_sends_are_logged_with_their_report_tries(tmp_path):
+    log = TraceLog(str(tmp_path / 'apply-trace.jsonl'))
+    transport = MockTransport()
+    with logged('apply', transport, log):
+        transport.apply(DEFAULT_STATE, REPORT_GROUPS)
+
+    metrics = Metrics(log.path, from_start=True)
+    metrics.refresh()
+    assert list(metrics.commands) == [1, 0, 0, 0]
+    assert metrics.reports == len(transport.reports)
+    assert transport.tracer is None
+
+
+def test_failed_sends_are_logged_with_their_error(tmp_path):
+    log = TraceLog(str(tmp_path / 'apply-trace.jsonl'))
+    transport = AsleepTransport(ack_timeout=0, max_attempts=2)
+    with pytest.raises(DeviceUnreachable):
+        with logged('send', transport, log):
+            transport.apply(DEFAULT_STATE, {'polling'})
+
+    metrics = Metrics(log.path, from_start=True)
+    metrics.refresh()
+    assert list(metrics.failures) == [0, 1, 0, 0]
+    assert metrics.retries == 1
+
+
+def test_sends_through_the_service_are_left_to_it(tmp_path):
+    log = TraceLog(str(tmp_path / 'apply-trace.jsonl'))
+    with logged('apply', ServiceTransport(), log):
+        pass
+    assert not (tmp_path / 'apply-trace.jsonl').exists()
+
+
+def test_the_log_is_rotated_at_its_size_limit(tmp_path):
+    log = TraceLog(str(tmp_path / 'apply-trace.jsonl'), max_bytes=120)
+    for i in range(5):
+        log.append({'n': i, 'padding': 'x' * 30})
+
+    rotated = (tmp_path / 'apply-trace.jsonl.1').read_text().splitlines()
+    current = (tmp_path / 'apply-trace.jsonl').read_text().splitlines()
+    assert [json.loads(line)['n'] for line in rotated + current] == [2, 3, 4]
+    assert (tmp_path / 'apply-trace.jsonl').stat().st_size <= 120
@@ -0,0 +1,38 @@
+import time
+
+import pytest
+
+from attack_shark_r1 import protocol
+from attack_shark_r1.transport import DeviceUnreachable, ReportTransport
+
+
+class MovingMouse(ReportTransport):
+    """Answers every read with a motion report, never with an ack"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.writes = 0
+
+    def write_feature(self, report_id, payload):
+        self.writes += 1
+
+    def read_input(self, timeout):
+        time.sleep(0.001)
+        return bytes([1, 0, 0, 5, 0])
+
+
+def test_motion_reports_dont_hold_the_ack_wait_open():
+    mouse = MovingMouse(ack_timeout=0.02, max_attempts=3)
+    start = time.monotonic()
+    with pytest.raises(DeviceUnreachable):
+        mouse.send_report(protocol.REPORT_POLLING, b'\x00', deadline=start + 5)
+    assert mouse.writes == 3
+    assert time.monotonic() - start < 1
+
+
+def test_motion_reports_dont_outlast_the_deadline():
+    mouse = MovingMouse(ack_timeout=10, max_attempts=5)
+    start = time.monotonic()
+    with pytest.raises(DeviceUnreachable):
+        mouse.send_report(protocol.REPORT_POLLING, b'\x00', deadline=start + 0.05)
+    assert time.monotonic() - start < 0.5
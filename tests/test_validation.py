@@ -0,0 +1,70 @@
+from collections import namedtuple
+
+import pytest
+
+from attack_shark_r1 import validation
+from attack_shark_r1.settings import DEFAULT_STATE
+
+
+def errors(settings, **kwargs):
+    return [(problem.error, problem.slot) for problem in validation.validate(settings, **kwargs)]
+
+
+def test_valid_settings_have_no_problems():
+    assert validation.validate(DEFAULT_STATE._replace(dpis=(800, 1600, 3200, 4000, 5000, 12000))) == []
+
+
+def test_disabled_slots_are_only_accepted_when_allowed():
+    assert errors(DEFAULT_STATE) == [('InvalidDpiValue', slot) for slot in range(2, 7)]
+    assert errors(DEFAULT_STATE, allow_disabled_dpis=True) == []
+
+
+@pytest.mark.parametrize('field, value, error', [
+    ('polling_rate', 2000, 'InvalidPollRate'),
+    ('polling_rate', None, 'PollRateNotProvided'),
+    ('active_dpi', 7, 'InvalidActiveDpiValue'),
+    ('active_dpi', True, 'InvalidActiveDpiValue'),
+    ('sleep_time', 0.4, 'InvalidSleepTime'),
+    ('deep_sleep_time', 1.5, 'InvalidDeepSleepTime'),
+    ('key_response_time', 5, 'InvalidKeyRespTime'),
+    ('key_response_time', 52, 'InvalidKeyRespTime'),
+    ('angle_snap', 1, 'InvalidAngleSnap'),
+    ('ripple_control', None, 'RippleControlNotProvided'),
+])
+def test_each_field_is_rejected_with_the_drivers_error(field, value, error):
+    settings = DEFAULT_STATE._replace(dpis=(800,) * 6, **{field: value})
+
+    assert errors(settings) == [(error, None)]
+
+
+@pytest.mark.parametrize('dpis, error', [
+    (None, 'DpiValuesNotProvided'),
+    ((800,) * 5, 'NotEnoughDpiValues'),
+    ((800,) * 7, 'TooMuchDpiValues'),
+])
+def test_the_dpi_count_is_checked(dpis, error):
+    assert errors(DEFAULT_STATE._replace(dpis=dpis)) == [(error, None)]
+
+
+def test_missing_attributes_are_not_provided():
+    Partial = namedtuple('Partial', ['polling_rate'])
+
+    assert ('AngleSnapNotProvided', None) in errors(Partial(1000))
+    assert ('PollRateNotProvided', None) not in errors(Partial(1000))
+
+
+@pytest.mark.parametrize('value', [0, 50, 150, 18100, 800.0, True])
+def test_dpis_the_driver_rejects(value):
+    problem = validation.validate_dpi(3, value)
+
+    assert problem == ('dpis', 'InvalidDpiValue', "Slot 3: " + validation.FIELDS['dpis'].message, 3)
+
+
+@pytest.mark.parametrize('value', [100, 10100, 18000])
+def test_dpis_the_driver_accepts(value):
+    assert validation.validate_dpi(1, value) is None
+
+
+def test_zero_is_a_disabled_slot_only_when_allowed():
+    assert validation.validate_dpi(2, 0, allow_disabled=True) is None
+    assert validation.validate_dpi(2, 50, allow_disabled=True) is not None